@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 from decouple import config
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pos.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,21 +82,133 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'pos.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
 
+# Shared cache for the POS read endpoints. Set REDIS_URL (and install the
+# `redis` package) in production so all workers share one cache; without it
+# each process gets its own local-memory cache.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'supplymind',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+POS_CACHE_TTL = config('POS_CACHE_TTL', default=300, cast=int)
+POS_LOCAL_CACHE_MAX_ENTRIES = config('POS_LOCAL_CACHE_MAX_ENTRIES', default=1000, cast=int)
+POS_LOCAL_CACHE_TTL = config('POS_LOCAL_CACHE_TTL', default=60, cast=int)
+
+# Token -> user cache behind pos.authentication.CachedTokenAuthentication:
+# seconds in the shared cache, and in each process (which bounds how long
+# another worker still accepts a deleted token). POS_AUTH_SIGNED_TOKENS
+# enables stateless signed tokens from /api/auth/signed-token/.
+POS_AUTH_CACHE_TTL = config('POS_AUTH_CACHE_TTL', default=60, cast=int)
+POS_AUTH_LOCAL_CACHE_TTL = config('POS_AUTH_LOCAL_CACHE_TTL', default=5, cast=int)
+POS_AUTH_SIGNED_TOKENS = config('POS_AUTH_SIGNED_TOKENS', default=False, cast=bool)
+POS_AUTH_SIGNED_TOKEN_MAX_AGE = config('POS_AUTH_SIGNED_TOKEN_MAX_AGE', default=3600, cast=int)
+
+# In-process barcode -> product cache behind /api/products/by-barcode/<code>/.
+POS_BARCODE_CACHE_MAX_ENTRIES = config('POS_BARCODE_CACHE_MAX_ENTRIES', default=50000, cast=int)
+POS_BARCODE_CACHE_TTL = config('POS_BARCODE_CACHE_TTL', default=300, cast=int)
+
+# Build list/search/low_stock/today_sales payloads from .values() rows (pos/fast.py).
+POS_FAST_SERIALIZERS = config('POS_FAST_SERIALIZERS', default=False, cast=bool)
+
+# Demand forecasts behind low_stock (pos/forecasting.py): smoothing factor for
+# daily demand, supplier lead time, and safety stock in standard deviations.
+POS_FORECAST_ALPHA = config('POS_FORECAST_ALPHA', default=0.1, cast=float)
+POS_FORECAST_LEAD_TIME_DAYS = config('POS_FORECAST_LEAD_TIME_DAYS', default=7, cast=int)
+POS_FORECAST_SERVICE_Z = config('POS_FORECAST_SERVICE_Z', default=1.65, cast=float)
+
+# Deferred work (pos/tasks.py): 'eager' runs tasks inline in the request,
+# 'database' queues them for `manage.py run_workers`, and 'local' also runs
+# them in a thread pool inside the web process after each commit.
+POS_TASK_BACKEND = config('POS_TASK_BACKEND', default='eager')
+POS_TASK_LOCAL_THREADS = config('POS_TASK_LOCAL_THREADS', default=2, cast=int)
+POS_TASK_LEASE_SECONDS = config('POS_TASK_LEASE_SECONDS', default=300, cast=int)
+POS_TASK_MAX_ATTEMPTS = config('POS_TASK_MAX_ATTEMPTS', default=5, cast=int)
+POS_TASK_RETRY_DELAY = config('POS_TASK_RETRY_DELAY', default=5, cast=float)
+POS_TASK_RETRY_MAX_DELAY = config('POS_TASK_RETRY_MAX_DELAY', default=3600, cast=float)
+
+# Request metrics (pos/metrics.py) at /api/metrics/, readable by staff or with
+# `Authorization: Bearer <POS_METRICS_TOKEN>`. Requests slower than
+# POS_SLOW_REQUEST_MS (0 = off) are logged to pos.slow_requests with their SQL.
+POS_METRICS_ENABLED = config('POS_METRICS_ENABLED', default=True, cast=bool)
+POS_METRICS_TOKEN = config('POS_METRICS_TOKEN', default='')
+POS_SLOW_REQUEST_MS = config('POS_SLOW_REQUEST_MS', default=0, cast=int)
+
+# Sales history archival (pos/archive.py): `manage.py archive_sales` moves the
+# months before the last POS_ARCHIVE_KEEP_MONTHS (plus the current one) out of
+# the live sales tables, into the archive tables or, with `--to file`, into
+# gzipped NDJSON files under POS_ARCHIVE_DIR.
+POS_ARCHIVE_KEEP_MONTHS = config('POS_ARCHIVE_KEEP_MONTHS', default=12, cast=int)
+POS_ARCHIVE_DIR = config('POS_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'pos.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='http://localhost:5173,http://127.0.0.1:5173').split(',')
 
 
+# Each worker thread keeps its connection for DB_CONN_MAX_AGE seconds (0
+# closes it after every request) and checks it is still usable before
+# reusing it. Under ASGI every request runs its queries in a new thread, so
+# persistent connections aren't reused there: set DB_POOL=true (PostgreSQL
+# with psycopg 3) to share a psycopg_pool pool between all the process's
+# threads instead, sized by DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE, waiting up to
+# DB_POOL_TIMEOUT seconds for a free connection.
 DATABASES = {
     'default': dj_database_url.config(
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=config('DB_CONN_MAX_AGE', default=60, cast=int),
+        conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
     )
 }
 
+if config('DB_POOL', default=False, cast=bool):
+    if DATABASES['default']['ENGINE'] != 'django.db.backends.postgresql':
+        raise ImproperlyConfigured('DB_POOL needs a PostgreSQL DATABASE_URL.')
+    # The pool replaces persistent connections; Django refuses to combine them.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+    }
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Concurrent checkouts take the write lock up front (BEGIN IMMEDIATE) and
+    # wait for it, instead of failing with "database is locked" when two
+    # transactions try to upgrade their read locks at the same time.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    })
+    # A file-backed test database lets the checkout concurrency tests run
+    # real parallel connections (shared-cache :memory: fails instead of waiting).
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', BASE_DIR / 'test_db.sqlite3')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
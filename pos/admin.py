@@ -1,22 +1,88 @@
 from django.contrib import admin
-from .models import Product, Sale, SaleItem
+from django.db import transaction
+from django.utils import timezone
+from . import ledger
+from .models import ArchivedPeriod, DailySalesRollup, Product, ProductForecast, Sale, SaleItem, StockMovement, StockSnapshot, Task
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price', 'stock_quantity', 'category', 'is_in_stock']
+    list_display = ['name', 'price', 'cost_price', 'stock_quantity', 'reorder_point', 'category', 'is_in_stock']
     list_filter = ['category', 'created_at']
     search_fields = ['name', 'barcode']
     list_editable = ['price', 'stock_quantity']
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Stock edits here go through the ledger like API edits.
+        with transaction.atomic():
+            stock_before = ledger.lock_stock_levels([obj.pk])
+            if 'stock_quantity' not in form.changed_data:
+                obj.stock_quantity = stock_before[obj.pk]
+            super().save_model(request, obj, form, change)
+            ledger.record_overwrites(stock_before, [obj], note=f'Edited in admin by {request.user}')
+
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
     extra = 0
-    readonly_fields = ['total_price']
+    readonly_fields = ['unit_cost', 'total_price']
 
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
-    list_display = ['receipt_number', 'total_amount', 'payment_method', 'created_at']
+    list_display = ['receipt_number', 'total_amount', 'line_count', 'unit_count', 'gross_margin', 'payment_method', 'created_at']
     list_filter = ['payment_method', 'created_at']
     search_fields = ['receipt_number']
-    readonly_fields = ['receipt_number']
-    inlines = [SaleItemInline]
\ No newline at end of file
+    readonly_fields = [
+        'receipt_number', 'total_amount', 'payment_method', 'line_count', 'unit_count', 'cost_total', 'gross_margin',
+    ]
+    inlines = [SaleItemInline]
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'owner', 'payment_method', 'sale_count', 'revenue']
+    list_filter = ['payment_method', 'day']
+    readonly_fields = ['owner', 'day', 'payment_method', 'sale_count', 'revenue']
+
+
+@admin.register(ArchivedPeriod)
+class ArchivedPeriodAdmin(admin.ModelAdmin):
+    list_display = ['month', 'storage', 'sale_count', 'location', 'archived_at']
+    list_filter = ['storage']
+    readonly_fields = ['month', 'storage', 'location', 'sale_count', 'archived_at']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'product', 'kind', 'quantity', 'sale', 'note']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['product__name', 'product__barcode', 'note']
+    readonly_fields = ['product', 'kind', 'quantity', 'sale', 'note', 'created_at']
+
+    def has_change_permission(self, request, obj=None):
+        return False  # append-only
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['taken_at', 'product', 'quantity', 'last_movement_id']
+    readonly_fields = ['product', 'quantity', 'last_movement_id', 'taken_at']
+
+@admin.register(ProductForecast)
+class ProductForecastAdmin(admin.ModelAdmin):
+    list_display = ['product', 'velocity', 'reorder_point', 'through_day', 'updated_at']
+    search_fields = ['product__name', 'product__barcode']
+    readonly_fields = ['product', 'velocity', 'variance', 'through_day', 'reorder_point', 'updated_at']
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['name', 'payload', 'attempts', 'last_error', 'created_at']
+    actions = ['retry']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry(self, request, queryset):
+        queryset.update(status='queued', attempts=0, run_at=timezone.now())
@@ -0,0 +1,243 @@
+"""
+Sales analytics behind ``/api/analytics/``.
+
+Grouping and summing happen in SQL: hourly series truncate
+``Sale.created_at`` with ``TruncHour``, daily and weekly series read the
+`DailySalesRollup` table (one row per day and payment method, however many
+sales that day had), and the product and category breakdowns group
+``SaleItem`` joined with ``Product``. The grouped rows are then assembled
+with NumPy: buckets without sales are filled in with zeros over a complete
+bucket grid, weeks are binned from days, and moving averages and shares
+are computed on whole arrays, so nothing loops per row in Python except
+building the JSON. Basket sizes and margins come from the totals stored
+on each `Sale`, without touching ``SaleItem``. Reads of `Sale` and
+``SaleItem`` include archived months when the range reaches them (see
+pos/archive.py).
+
+Ranges are inclusive local dates; money is returned as 2-decimal strings.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from . import archive
+from .models import DailySalesRollup
+from .utils import day_bounds
+
+BUCKETS = ('hour', 'day', 'week')
+MAX_RANGE_DAYS = {'hour': 93, 'day': 3660, 'week': 3660}
+DEFAULT_WINDOW = 7
+MAX_WINDOW = 366
+
+
+def _columns(rows, count):
+    """Split ``values_list`` rows into ``count`` column tuples."""
+    columns = list(zip(*rows))
+    return columns if columns else [()] * count
+
+
+def _money(values):
+    return np.char.mod('%.2f', np.round(values, 2)).tolist()
+
+
+def moving_average(values, window):
+    """
+    Trailing mean over ``window`` buckets; the first buckets average over
+    however many buckets precede them.
+    """
+    sums = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    seen = np.arange(1, len(values) + 1)
+    counts = np.minimum(seen, window)
+    return (sums[seen] - sums[seen - counts]) / counts
+
+
+def shares(values):
+    """Each value's fraction of the total, rounded to 4 places (all 0 for a zero total)."""
+    values = np.asarray(values, dtype=np.float64)
+    total = values.sum()
+    if not total:
+        return np.zeros(len(values)).tolist()
+    return np.round(values / total, 4).tolist()
+
+
+def _hourly(owner, first_day, last_day):
+    start, end = day_bounds(first_day, days=(last_day - first_day).days + 1)
+    rows = [
+        row
+        for sales in archive.sale_sources(start, end)
+        for row in (
+            sales.filter(owner=owner)
+            .annotate(bucket=TruncHour('created_at'))
+            .values('bucket')
+            .annotate(sales=Count('id'), revenue=Sum('total_amount'))
+            .order_by('bucket')
+            .values_list('bucket', 'sales', 'revenue')
+        )
+    ]
+    buckets, sales, revenue = _columns(rows, 3)
+    # Local wall-clock hours; the hour repeated when clocks go back is summed.
+    keys = np.array([timezone.localtime(bucket).replace(tzinfo=None) for bucket in buckets], dtype='datetime64[h]')
+    grid = np.arange(np.datetime64(first_day, 'h'), np.datetime64(last_day + timedelta(days=1), 'h'))
+    return grid, keys, sales, revenue
+
+
+def _daily(owner, first_day, last_day):
+    rows = (
+        DailySalesRollup.objects.filter(owner=owner, day__gte=first_day, day__lte=last_day)
+        .values('day')
+        .annotate(sales=Sum('sale_count'), revenue=Sum('revenue'))
+        .order_by('day')
+        .values_list('day', 'sales', 'revenue')
+    )
+    days, sales, revenue = _columns(rows, 3)
+    grid = np.arange(np.datetime64(first_day, 'D'), np.datetime64(last_day, 'D') + 1)
+    return grid, np.array(days, dtype='datetime64[D]'), sales, revenue
+
+
+def revenue_series(owner, first_day, last_day, bucket='day', window=DEFAULT_WINDOW):
+    """
+    Sales count and revenue per ``bucket`` (hour, day or ISO week starting
+    Monday) from ``first_day`` to ``last_day``, with every bucket present
+    and a trailing ``window``-bucket moving average of revenue.
+    """
+    if bucket == 'hour':
+        grid, keys, sales, revenue = _hourly(owner, first_day, last_day)
+    else:
+        grid, keys, sales, revenue = _daily(owner, first_day, last_day)
+
+    positions = np.searchsorted(grid, keys)
+    sales_filled = np.zeros(len(grid), dtype=np.int64)
+    revenue_filled = np.zeros(len(grid), dtype=np.float64)
+    np.add.at(sales_filled, positions, np.array(sales, dtype=np.int64))
+    np.add.at(revenue_filled, positions, np.array(revenue, dtype=np.float64))
+
+    if bucket == 'week':
+        first_monday = np.datetime64(first_day - timedelta(days=first_day.weekday()), 'D')
+        weeks = (grid - first_monday).astype(np.int64) // 7
+        sales_filled = np.bincount(weeks, weights=sales_filled).astype(np.int64)
+        revenue_filled = np.bincount(weeks, weights=revenue_filled)
+        grid = first_monday + 7 * np.arange(len(sales_filled))
+
+    labels = np.datetime_as_string(grid, unit='m' if bucket == 'hour' else 'D').tolist()
+    return [
+        {'start': label, 'sales': count, 'revenue': revenue, 'moving_average': average}
+        for label, count, revenue, average in zip(
+            labels,
+            sales_filled.tolist(),
+            _money(revenue_filled),
+            _money(moving_average(revenue_filled, window)),
+        )
+    ]
+
+
+def _item_totals(owner, first_day, last_day, keys, order_by, limit=None):
+    """
+    ``(*keys, quantity, revenue)`` rows of the owner's sale items grouped by
+    ``keys``, largest ``order_by`` first. When the range reaches into the
+    archive, each table is grouped in SQL and the groups are merged here.
+    """
+    start, end = day_bounds(first_day, days=(last_day - first_day).days + 1)
+    grouped = [
+        items.filter(sale__owner=owner).values(*keys)
+        .annotate(quantity=Sum('quantity'), revenue=Sum('total_price'))
+        .order_by(f'-{order_by}', *keys)
+        .values_list(*keys, 'quantity', 'revenue')
+        for items in archive.item_sources(start, end)
+    ]
+    if len(grouped) == 1:
+        return list(grouped[0][:limit] if limit else grouped[0])
+
+    totals = {}
+    for rows in grouped:
+        for *key, quantity, revenue in rows:
+            entry = totals.setdefault(tuple(key), [0, 0])
+            entry[0] += quantity
+            entry[1] += revenue
+    column = 0 if order_by == 'quantity' else 1
+    rows = sorted(((*key, *entry) for key, entry in totals.items()),
+                  key=lambda row: (-row[len(keys) + column], *row[:len(keys)]))
+    return rows[:limit] if limit else rows
+
+
+def top_products(owner, first_day, last_day, limit=10, order_by='revenue'):
+    """The ``limit`` best sellers by ``revenue`` or ``quantity``, with their share of revenue."""
+    # A sale's total is the sum of its lines, so the rollup has the grand total.
+    total = DailySalesRollup.objects.filter(
+        owner=owner, day__gte=first_day, day__lte=last_day
+    ).aggregate(revenue=Sum('revenue'))['revenue'] or 0
+    rows = _item_totals(owner, first_day, last_day, ['product_id', 'product__name'], order_by, limit=limit)
+    ids, names, quantities, revenue = _columns(rows, 4)
+    revenue = np.array(revenue, dtype=np.float64)
+    share = np.round(revenue / float(total), 4).tolist() if total else [0.0] * len(rows)
+    return [
+        {'product_id': product_id, 'name': name, 'quantity': quantity, 'revenue': amount, 'revenue_share': part}
+        for product_id, name, quantity, amount, part in zip(ids, names, quantities, _money(revenue), share)
+    ]
+
+
+def category_mix(owner, first_day, last_day):
+    """Quantity and revenue per product category, largest revenue first."""
+    rows = _item_totals(owner, first_day, last_day, ['product__category'], 'revenue')
+    categories, quantities, revenue = _columns(rows, 3)
+    revenue = np.array(revenue, dtype=np.float64)
+    return [
+        {'category': category, 'quantity': quantity, 'revenue': amount, 'revenue_share': part}
+        for category, quantity, amount, part in zip(categories, quantities, _money(revenue), shares(revenue))
+    ]
+
+
+def payment_mix(owner, first_day, last_day):
+    """Sales and revenue per payment method, from the daily rollup."""
+    rows = list(
+        DailySalesRollup.objects.filter(owner=owner, day__gte=first_day, day__lte=last_day)
+        .values('payment_method')
+        .annotate(sales=Sum('sale_count'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'payment_method')
+        .values_list('payment_method', 'sales', 'revenue')
+    )
+    methods, sales, revenue = _columns(rows, 3)
+    revenue = np.array(revenue, dtype=np.float64)
+    return [
+        {'payment_method': method, 'sales': count, 'revenue': amount, 'revenue_share': part}
+        for method, count, amount, part in zip(methods, sales, _money(revenue), shares(revenue))
+    ]
+
+
+def basket_stats(owner, first_day, last_day):
+    """
+    Average lines, units and value per sale, and the gross margin of the
+    sales whose cost is known (``costed_sales`` of ``sales``). Reads the
+    totals stored on each sale; run ``backfill_sale_totals`` for sales
+    recorded before they existed.
+    """
+    start, end = day_bounds(first_day, days=(last_day - first_day).days + 1)
+    costed = Q(cost_total__isnull=False)
+    totals = {}
+    for sales in archive.sale_sources(start, end):
+        for name, value in sales.filter(owner=owner).aggregate(
+            sales=Count('id'),
+            lines=Sum('line_count'),
+            units=Sum('unit_count'),
+            revenue=Sum('total_amount'),
+            costed_sales=Count('id', filter=costed),
+            costed_revenue=Sum('total_amount', filter=costed),
+            cost=Sum('cost_total'),
+            margin=Sum('gross_margin'),
+        ).items():
+            totals[name] = totals.get(name, 0) + (value or 0)
+    sales = totals['sales']
+    costed_revenue = float(totals['costed_revenue'] or 0)
+    margin = float(totals['margin'] or 0)
+    return {
+        'sales': sales,
+        'average_lines': round((totals['lines'] or 0) / sales, 2) if sales else 0.0,
+        'average_units': round((totals['units'] or 0) / sales, 2) if sales else 0.0,
+        'average_value': _money(float(totals['revenue'] or 0) / sales if sales else 0.0),
+        'costed_sales': totals['costed_sales'],
+        'cost': _money(float(totals['cost'] or 0)),
+        'gross_margin': _money(margin),
+        'margin_rate': round(margin / costed_revenue, 4) if costed_revenue else 0.0,
+    }
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
+
+    def ready(self):
+        from . import authentication, forecasting, signals  # noqa: F401 (registers receivers and tasks)
+        from .metrics import install_execute_wrapper
+        from .search import install_search_index
+
+        post_migrate.connect(install_search_index, sender=self)
+        connection_created.connect(install_execute_wrapper)
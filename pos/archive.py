@@ -0,0 +1,264 @@
+"""
+Archival of closed months of sales history, for ``manage.py archive_sales``.
+
+Only recent sales are read row by row (checkout, today's sales, the sale
+list); older ones are only read as date ranges, by analytics, exports,
+forecasts and rollup rebuilds. `archive_months` moves each whole local
+month before a cutoff out of `Sale`/`SaleItem`, ``chunk_size`` sales per
+transaction, into either
+
+- the archive tables (`ArchivedSale`/`ArchivedSaleItem`): same ids,
+  totals and item costs, no constraints and only the indexes range reads
+  need; or
+- a gzipped NDJSON file per month (one sale with its items per line) for
+  cold storage. Those sales can't be queried any more.
+
+Stock movements keep their quantities but lose the link to the sale, and
+the daily rollups are left as they are, so the stock ledger, dashboards
+and rollup-based analytics don't change.
+
+Each archived month is recorded in `ArchivedPeriod`. Range reads go
+through `sale_sources`/`item_sources`, which only add the archive tables
+when the range starts before the end of the last month archived there.
+On PostgreSQL the archive tables are partitioned by month of
+``created_at`` (the partitions are created as months are archived), so
+those reads only scan the months in the range, and a month can be
+retired by dropping its partitions. `Sale` itself isn't partitioned: the
+foreign keys to it and its unique receipt and idempotency keys would all
+have to include ``created_at``. Archiving keeps it small on every
+database instead.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .cache import read_cache
+from .models import ArchivedPeriod, ArchivedSale, ArchivedSaleItem, Sale, SaleItem, StockMovement
+from .utils import day_bounds
+
+ARCHIVE_TABLES = [ArchivedSale._meta.db_table, ArchivedSaleItem._meta.db_table]
+SALE_FIELDS = [
+    'id', 'owner_id', 'created_at', 'total_amount', 'payment_method', 'receipt_number',
+    'line_count', 'unit_count', 'cost_total', 'gross_margin',
+]
+ITEM_FIELDS = ['id', 'sale_id', 'product_id', 'quantity', 'unit_price', 'unit_cost', 'total_price']
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return month_start(month_start(month) + timedelta(days=32))
+
+
+def add_months(month, months):
+    """The first day of the month ``months`` (possibly negative) after ``month``'s."""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def month_bounds(month):
+    """``[start, end)`` timestamps of the local calendar month starting ``month``."""
+    return day_bounds(month, days=(next_month(month) - month).days)
+
+
+def archived_through():
+    """The end of the last month archived to the tables, or None."""
+    last = ArchivedPeriod.objects.filter(storage='table').aggregate(month=Max('month'))['month']
+    return month_bounds(last)[1] if last else None
+
+
+def sale_sources(start, end):
+    """
+    Querysets of the sales created in ``[start, end)``, oldest first: the
+    archived ones if the range needs the archive tables, then `Sale`. A
+    sale is in exactly one of them, and both have the same fields.
+    """
+    sources = [Sale.objects.filter(created_at__gte=start, created_at__lt=end)]
+    through = archived_through()
+    if through is not None and start < through:
+        sources.insert(0, ArchivedSale.objects.filter(created_at__gte=start, created_at__lt=min(end, through)))
+    return sources
+
+
+def item_sources(start, end):
+    """
+    `sale_sources` for sale items. ``sale__...`` lookups (owner, created_at,
+    receipt_number...) work on both.
+    """
+    sources = [SaleItem.objects.filter(sale__created_at__gte=start, sale__created_at__lt=end)]
+    through = archived_through()
+    if through is not None and start < through:
+        # Filter on the item's own copy of created_at so PostgreSQL prunes its partitions.
+        sources.insert(0, ArchivedSaleItem.objects.filter(created_at__gte=start, created_at__lt=min(end, through)))
+    return sources
+
+
+def partition_name(table, month):
+    return f'{table}_{month:%Y_%m}'
+
+
+def ensure_partitions(month, using='default'):
+    """On PostgreSQL, create the archive tables' partitions for ``month``."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    start, end = month_bounds(month)
+    with connection.cursor() as cursor:
+        for table in ARCHIVE_TABLES:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+
+
+def _chunks(sales, chunk_size):
+    """Yield ``(sale rows, {sale id: item rows})`` for ``sales`` in id order, ``chunk_size`` sales at a time."""
+    last_pk = 0
+    while True:
+        rows = list(sales.filter(pk__gt=last_pk).order_by('pk').values(*SALE_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1]['id']
+        items = {}
+        for item in SaleItem.objects.filter(sale_id__in=[row['id'] for row in rows]).order_by('id').values(*ITEM_FIELDS):
+            items.setdefault(item['sale_id'], []).append(item)
+        yield rows, items
+
+
+def _remove(rows):
+    """Delete the sales of ``rows`` and their items, leaving their rollups and stock movements."""
+    ids = [row['id'] for row in rows]
+    StockMovement.objects.filter(sale_id__in=ids).update(sale=None)
+    SaleItem.objects.filter(sale_id__in=ids).delete()
+    # A raw delete skips the Sale signals, which would take the sales out of the rollups.
+    Sale.objects.filter(pk__in=ids)._raw_delete(Sale.objects.db)
+    for owner_id in {row['owner_id'] for row in rows}:
+        read_cache.bump_on_commit(owner_id, 'sales')
+
+
+def _record(month, storage, location, count):
+    period, _ = ArchivedPeriod.objects.get_or_create(
+        month=month, defaults={'storage': storage, 'location': location},
+    )
+    ArchivedPeriod.objects.filter(pk=period.pk).update(
+        sale_count=F('sale_count') + count, archived_at=timezone.now(),
+    )
+
+
+def month_file(directory, month):
+    """A new file name for ``month`` in ``directory``: ``sales-YYYY-MM.ndjson.gz``, then ``-2``, ``-3``..."""
+    directory = Path(directory)
+    path = directory / f'sales-{month:%Y-%m}.ndjson.gz'
+    part = 1
+    while path.exists():
+        part += 1
+        path = directory / f'sales-{month:%Y-%m}-{part}.ndjson.gz'
+    return path
+
+
+def month_files(period):
+    """The files a month was archived to, in the order they were written."""
+    return sorted(
+        Path(period.location).glob(f'sales-{period.month:%Y-%m}*.ndjson.gz'),
+        key=lambda path: (len(path.name), path.name),
+    )
+
+
+def read_archive_file(path):
+    """Yield the sales in an archive file: dicts of `SALE_FIELDS` with their ``items``, values as JSON."""
+    with gzip.open(path, 'rt', encoding='utf-8') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def _archive_to_tables(month, sales, chunk_size, stdout):
+    ensure_partitions(month)
+    moved = 0
+    for rows, items in _chunks(sales, chunk_size):
+        with transaction.atomic():
+            ArchivedSale.objects.bulk_create([ArchivedSale(**row) for row in rows])
+            created_at = {row['id']: row['created_at'] for row in rows}
+            ArchivedSaleItem.objects.bulk_create([
+                ArchivedSaleItem(created_at=created_at[sale_id], **item)
+                for sale_id, sale_items in items.items() for item in sale_items
+            ])
+            _remove(rows)
+            _record(month, 'table', '', len(rows))
+        moved += len(rows)
+        if stdout is not None:
+            stdout.write(f"{month:%Y-%m}: {moved} sales archived")
+    return moved
+
+
+def _archive_to_file(month, sales, directory, chunk_size, stdout):
+    # Write the whole month before deleting anything, so a failure leaves the sales in place.
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    path = month_file(directory, month)
+    partial = path.with_name(path.name + '.partial')
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    written = []
+    with gzip.open(partial, 'wt', encoding='utf-8') as out:
+        for rows, items in _chunks(sales, chunk_size):
+            for row in rows:
+                out.write(encoder.encode({**row, 'items': items.get(row['id'], [])}) + '\n')
+            written.append(rows)
+    if not written:
+        partial.unlink()
+        return 0
+    os.replace(partial, path)
+    if stdout is not None:
+        stdout.write(f"{month:%Y-%m}: wrote {path}")
+
+    moved = 0
+    for rows in written:
+        with transaction.atomic():
+            _remove(rows)
+            _record(month, 'file', str(Path(directory).resolve()), len(rows))
+        moved += len(rows)
+    return moved
+
+
+def archive_month(month, storage='table', directory=None, chunk_size=5000, stdout=None):
+    """Move the sales of the local month starting ``month`` to ``storage``. Returns how many moved."""
+    period = ArchivedPeriod.objects.filter(month=month).first()
+    if period is not None and period.storage != storage:
+        raise ValueError(f"{month:%Y-%m} is already archived to {period.get_storage_display().lower()}.")
+    start, end = month_bounds(month)
+    sales = Sale.objects.filter(created_at__gte=start, created_at__lt=end)
+    if storage == 'file':
+        return _archive_to_file(month, sales, directory, chunk_size, stdout)
+    return _archive_to_tables(month, sales, chunk_size, stdout)
+
+
+def archive_months(before, storage='table', directory=None, chunk_size=5000, stdout=None):
+    """
+    Archive the sales of every local month before the one containing
+    ``before`` to ``storage`` (``table`` or ``file``, the latter written
+    to ``directory``). Returns ``{month: sales archived}`` for the months
+    that had sales.
+    """
+    if storage not in dict(ArchivedPeriod.STORAGE_CHOICES):
+        raise ValueError(f"Unknown archive storage {storage!r}.")
+    if storage == 'file' and not directory:
+        raise ValueError("Archiving to files needs a directory.")
+    cutoff = month_start(before)
+    oldest = Sale.objects.filter(created_at__lt=day_bounds(cutoff)[0]).aggregate(at=Min('created_at'))['at']
+    archived = {}
+    if oldest is None:
+        return archived
+    month = month_start(timezone.localdate(oldest))
+    while month < cutoff:
+        moved = archive_month(month, storage, directory, chunk_size, stdout)
+        if moved:
+            archived[month] = moved
+        month = next_month(month)
+    return archived
@@ -0,0 +1,158 @@
+"""
+Async-native versions of the read-heavy endpoints, under ``/api/async/``.
+
+The DRF viewsets are sync, so under ASGI every request to them is handed
+to a thread through ``sync_to_async`` for its whole duration. These are
+plain async Django views over the same payloads: authentication (token or
+session), the versioned cache with its ETag/304 handling, and the queries
+go through the async ORM (``afirst``, ``aaggregate``, ``async for``), and
+the JSON is byte-for-byte what the sync endpoint returns. Tokens resolve
+through the same `auth_cache` as `CachedTokenAuthentication`.
+
+The cache lookups are made directly, as in the sync views: they are
+in-memory or one short round trip to the shared cache, cheaper than a
+thread hop. Search runs the sync `search_products` in a single hop, since
+its raw FTS query has no async form.
+
+Django 5.2's async ORM still runs each query in a thread (per request under
+ASGI), so ``asyncio.gather`` over the dashboard's aggregates overlaps their
+dispatch rather than the queries themselves; the event loop stays free
+while they run either way. ``manage.py loadtest`` compares these endpoints
+with the sync ones under WSGI and ASGI.
+"""
+import asyncio
+from decimal import Decimal
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+
+from . import fast, forecasting, metrics
+from .authentication import is_signed_token, user_for_signed_token
+from .cache import MISSING, auth_cache, read_cache
+from .models import Product, Sale
+from .renderers import FastJSONRenderer
+from .search import clamp_limit, search_products
+from .serializers import ProductSerializer, SaleSerializer
+from .utils import day_bounds
+from .views import conditional_read, dashboard_aggregates, with_sale_items
+
+
+def _json(data, status=200, headers=None):
+    renderer = FastJSONRenderer() if fast.enabled() else JSONRenderer()
+    return HttpResponse(renderer.render(data), status=status, headers=headers, content_type='application/json')
+
+
+async def authenticate(request):
+    """
+    The user for ``request``, from an ``Authorization: Token <key>`` header
+    or the session, or a 401 response like DRF's.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) == 2 and is_signed_token(header[1]):
+            try:
+                return await sync_to_async(user_for_signed_token)(header[1])
+            except AuthenticationFailed as exc:
+                return _json({'detail': exc.detail}, status=401, headers={'WWW-Authenticate': 'Token'})
+        token = None
+        if len(header) == 2:
+            token = auth_cache.get_token(header[1])
+            if token is None:
+                token = await Token.objects.select_related('user').filter(key=header[1]).afirst()
+                if token is not None:
+                    auth_cache.set_token(token)
+        if token is None or not token.user.is_active:
+            return _json({'detail': 'Invalid token.'}, status=401, headers={'WWW-Authenticate': 'Token'})
+        return token.user
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _json(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=401, headers={'WWW-Authenticate': 'Token'},
+        )
+    return user
+
+
+def cached_read(namespaces, per_day=False):
+    """
+    Turn ``compute(request, user)`` (async, returning the payload) into a
+    GET view served from the owner's versioned cache.
+    """
+    def decorator(compute):
+        @require_GET
+        @wraps(compute)
+        async def view(request):
+            user = await authenticate(request)
+            if isinstance(user, HttpResponse):
+                return user
+            name, versions, headers, not_modified = conditional_read(request, user.pk, namespaces, per_day)
+            if not_modified is not None:
+                return not_modified
+            key, data, tier = read_cache.lookup(user.pk, name, versions)
+            if data is MISSING:
+                data = await compute(request, user)
+                read_cache.store(key, data)
+            return _json(data, headers={'X-Cache': tier.upper() if tier else 'MISS', **headers})
+        return view
+    return decorator
+
+
+def _serialize(serializer_class, objects):
+    with metrics.timed():
+        if fast.enabled():
+            return fast.compile_serializer(serializer_class).serialize_objects(objects)
+        return serializer_class(objects, many=True).data
+
+
+def _serialize_sales(sales):
+    with metrics.timed():
+        return fast.compile_serializer(SaleSerializer).serialize(sales)
+
+
+@cached_read(('products',))
+async def search(request, user):
+    limit = clamp_limit(request.GET.get('limit'))
+    offset = clamp_limit(request.GET.get('offset'), default=0, maximum=10_000, minimum=0)
+    products = await sync_to_async(search_products)(user, request.GET.get('q', ''), limit=limit, offset=offset)
+    return _serialize(ProductSerializer, products)
+
+
+@cached_read(('products',))
+async def low_stock(request, user):
+    products = forecasting.below_reorder_point(Product.objects.filter(owner=user))
+    return _serialize(ProductSerializer, [product async for product in products])
+
+
+@cached_read(('sales', 'products'), per_day=True)
+async def dashboard_stats(request, user):
+    pairs = dashboard_aggregates(user)
+    results = await asyncio.gather(*(queryset.aaggregate(**aggregates) for queryset, aggregates in pairs))
+    stats = {}
+    for result in results:
+        stats.update(result)
+    return {key: value or 0 for key, value in stats.items()}
+
+
+@cached_read(('sales', 'products'), per_day=True)
+async def today_sales(request, user):
+    start, end = day_bounds(timezone.localdate())
+    sales = Sale.objects.filter(owner=user, created_at__gte=start, created_at__lt=end)
+    if fast.enabled():
+        # Nested items are loaded by the fast serializer with its own (sync) query.
+        payloads = await sync_to_async(_serialize_sales)(sales)
+        revenue = sum(Decimal(sale['total_amount']) for sale in payloads)
+    else:
+        loaded = [sale async for sale in with_sale_items(sales)]
+        payloads = _serialize(SaleSerializer, loaded)
+        revenue = sum(sale.total_amount for sale in loaded)
+    return {
+        'total_sales': len(payloads),
+        'total_revenue': revenue or 0,
+        'sales': payloads,
+    }
@@ -0,0 +1,97 @@
+"""
+Token authentication without a query per request.
+
+`CachedTokenAuthentication` is DRF's `TokenAuthentication` with the token
+and its user read from `auth_cache` (pos/cache.py); the token + user join
+only runs on a cache miss. The signal receivers below drop a user's entries
+when a token is deleted (dj_rest_auth's logout deletes it), on logout, and
+whenever the user is saved, which covers password changes and deactivation.
+
+With ``POS_AUTH_SIGNED_TOKENS`` on, ``POST /api/auth/signed-token/`` also
+issues stateless tokens: the user id and session auth hash, signed with
+SECRET_KEY and valid for ``POS_AUTH_SIGNED_TOKEN_MAX_AGE`` seconds. They
+are sent the same way (``Authorization: Token <token>``) and are checked
+against the cached user, so they need no token row at all. A password
+change invalidates them; logging out does not, so keep the lifetime short.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_logged_out
+from django.core import signing
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import auth_cache
+
+SIGNED_TOKEN_SALT = 'pos.authentication.signed-token'
+
+
+def issue_signed_token(user):
+    """A signed stateless token for ``user``."""
+    return signing.dumps({'id': user.pk, 'hash': user.get_session_auth_hash()}, salt=SIGNED_TOKEN_SALT, compress=True)
+
+
+def is_signed_token(key):
+    # DRF keys are 40 hex digits; signed tokens always contain the signer's separator.
+    return ':' in key
+
+
+def user_for_signed_token(key):
+    """The active user ``key`` was issued to, or AuthenticationFailed."""
+    if not settings.POS_AUTH_SIGNED_TOKENS:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    try:
+        claims = signing.loads(key, salt=SIGNED_TOKEN_SALT, max_age=settings.POS_AUTH_SIGNED_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed(_('Token expired.'))
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    user = auth_cache.get_user(claims['id'])
+    if user is None:
+        user = get_user_model().objects.filter(pk=claims['id']).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        auth_cache.set_user(user)
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    # Changing the password changes the hash, which revokes every signed token issued before.
+    if not constant_time_compare(claims['hash'], user.get_session_auth_hash()):
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """`TokenAuthentication` resolving tokens through `auth_cache`, and accepting signed tokens."""
+
+    def authenticate_credentials(self, key):
+        if is_signed_token(key):
+            return user_for_signed_token(key), None
+        token = auth_cache.get_token(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            auth_cache.set_token(token)
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    auth_cache.forget_user(instance.user_id, [instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_saved_user(sender, instance, raw=False, **kwargs):
+    if not raw:
+        auth_cache.forget_user(instance.pk, Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        auth_cache.forget_user(user.pk, Token.objects.filter(user_id=user.pk).values_list('key', flat=True))
@@ -0,0 +1,163 @@
+"""
+Endpoint benchmarks for ``manage.py bench``.
+
+Each case sends requests through the full Django stack in-process
+(middleware, authentication, routing, serialization) with the test
+client, as one owner, and records latency percentiles and queries per
+request. Read endpoints are measured ``cold`` (the owner's cached reads
+invalidated before every request, so each one hits the database) and
+``warm`` (served from the versioned cache). Sale creation writes real
+sales for the owner, one unit of its best-stocked products at a time.
+
+`run` returns a JSON-ready report with enough context (commit, database,
+scale, settings) to compare runs across commits; `compare` diffs two.
+"""
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import fast
+from .cache import read_cache
+from .models import Product, Sale, SaleItem
+from .utils import day_bounds
+
+SEARCH_TERMS = ['tea', 'coffee', 'milk', 'chips', 'soap', 'organic', 'gold', 'bread']
+READ_CASES = {
+    'search': lambda i: f'/api/products/search/?q={SEARCH_TERMS[i % len(SEARCH_TERMS)]}',
+    'today_sales': lambda i: '/api/sales/today_sales/',
+    'dashboard_stats': lambda i: '/api/sales/dashboard_stats/',
+}
+CASES = list(READ_CASES) + ['sale_create']
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(settings.BASE_DIR),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(name, mode, latencies, queries, statuses):
+    latencies = np.array(latencies) * 1000
+    return {
+        'case': name,
+        'mode': mode,
+        'requests': len(latencies),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p90_ms': round(float(np.percentile(latencies, 90)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'queries': int(np.median(queries)),
+        'errors': sum(1 for code in statuses if code >= 400),
+    }
+
+
+def _measure(send, iterations, warmup, before=None):
+    latencies, queries, statuses = [], [], []
+    for i in range(warmup + iterations):
+        if before is not None:
+            before()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = send(i)
+            elapsed = time.perf_counter() - started
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(len(captured.captured_queries))
+            statuses.append(response.status_code)
+    return latencies, queries, statuses
+
+
+def _sale_payloads(user):
+    products = list(
+        Product.objects.filter(owner=user, stock_quantity__gt=0).order_by('-stock_quantity', 'pk')
+        .values_list('pk', flat=True)[:20]
+    )
+    methods = [method for method, _ in Sale.PAYMENT_METHODS]
+
+    def payload(i):
+        return {
+            'payment_method': methods[i % len(methods)],
+            'items': [{'product_id': products[(i + line) % len(products)], 'quantity': 1} for line in range(3)],
+        }
+    return payload if products else None
+
+
+def run(user, cases=None, iterations=200, warmup=10, host='localhost', stdout=None):
+    """Benchmark ``cases`` (default all) as ``user``. Returns the report."""
+    token, _ = Token.objects.get_or_create(user=user)
+    client = Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f'Token {token.key}')
+    start, end = day_bounds(timezone.localdate())
+    report = {
+        'commit': _git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'fast_serializers': fast.enabled(),
+            'task_backend': settings.POS_TASK_BACKEND,
+        },
+        'scale': {
+            'user': user.get_username(),
+            'products': Product.objects.filter(owner=user).count(),
+            'sales': Sale.objects.filter(owner=user).count(),
+            'sale_items': SaleItem.objects.filter(sale__owner=user).count(),
+            'sales_today': Sale.objects.filter(owner=user, created_at__gte=start, created_at__lt=end).count(),
+        },
+        'iterations': iterations,
+        'results': [],
+    }
+
+    for name in cases or CASES:
+        if name == 'sale_create':
+            payload = _sale_payloads(user)
+            if payload is None:
+                continue
+            runs = [('write', lambda i: client.post('/api/sales/', payload(i), content_type='application/json'), None)]
+        else:
+            url = READ_CASES[name]
+            runs = [
+                ('cold', lambda i: client.get(url(i)), lambda: read_cache.bump(user.pk, 'products', 'sales')),
+                ('warm', lambda i: client.get(url(i)), None),
+            ]
+        for mode, send, before in runs:
+            if mode == 'warm':
+                for i in range(len(SEARCH_TERMS)):  # cache every URL the run cycles through
+                    send(i)
+            result = _summary(name, mode, *_measure(send, iterations, warmup, before=before))
+            report['results'].append(result)
+            if stdout is not None:
+                stdout.write(
+                    f"{name:16} {mode:5} p50 {result['p50_ms']:8.2f}ms  p90 {result['p90_ms']:8.2f}ms  "
+                    f"p99 {result['p99_ms']:8.2f}ms  {result['queries']:3} queries  {result['errors']} errors"
+                )
+    return report
+
+
+def compare(baseline, report, metric='p50_ms'):
+    """
+    ``(case, mode, before, after, change)`` for each result in both
+    reports, ``change`` being the relative difference of ``metric``.
+    """
+    before = {(result['case'], result['mode']): result[metric] for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        key = (result['case'], result['mode'])
+        if key in before:
+            old, new = before[key], result[metric]
+            rows.append((*key, old, new, (new - old) / old if old else None))
+    return rows
@@ -0,0 +1,358 @@
+"""
+Caches for the POS hot paths.
+
+`LocalCache` is a small thread-safe LRU with a per-entry TTL and hit/miss
+counters. Its entries live in one worker process only, so `BarcodeCache`
+is invalidated explicitly on writes in this process and bounded by the
+TTL for writes made by other workers.
+
+`VersionedCache` is the two-tier (in-process + shared Django cache) layer
+for the owner-scoped read endpoints, and `AuthCache` the same two tiers
+for token authentication.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+MISSING = object()
+
+
+class LocalCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl=None):
+        # Caller holds the lock.
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(*self._entries.popitem(last=False))
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _evict(self, key, entry):
+        """Hook for subclasses that keep secondary indexes. Called with the lock held."""
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BarcodeCache(LocalCache):
+    """
+    Per-owner ``barcode -> compact product payload`` map for the scan
+    endpoint. Entries are keyed by ``(owner_id, barcode)`` and can be
+    dropped by product id, since stock decrements only know the id.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._keys_by_product = {}
+
+    def lookup(self, owner_id, barcode):
+        return self.get((owner_id, barcode))
+
+    def store(self, owner_id, payload):
+        key = (owner_id, payload['barcode'])
+        with self._lock:
+            self._set(key, payload)
+            self._keys_by_product[payload['id']] = key
+
+    def invalidate_products(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                key = self._keys_by_product.pop(product_id, None)
+                if key is not None:
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._keys_by_product.clear()
+
+    def _evict(self, key, entry):
+        expires, payload = entry
+        self._keys_by_product.pop(payload['id'], None)
+
+
+barcode_cache = BarcodeCache(
+    max_entries=getattr(settings, 'POS_BARCODE_CACHE_MAX_ENTRIES', 50000),
+    ttl=getattr(settings, 'POS_BARCODE_CACHE_TTL', 300),
+)
+
+
+class VersionedCache:
+    """
+    Cache for owner-scoped read endpoints.
+
+    Every owner has a version counter per namespace (``products``,
+    ``sales``) in the shared Django cache, and each cached value's key
+    embeds the current versions of the namespaces it depends on.
+    Invalidation is a single ``incr``: entries under the old version are
+    never addressed again and simply expire. A small in-process
+    `LocalCache` sits in front of the shared backend, so hot payloads skip
+    the network and unpickling; it can't serve stale data because the
+    version lookup always goes to the shared cache.
+
+    Versions start from a timestamp rather than 1, so a counter that was
+    evicted never comes back at a number already used for older data.
+    """
+    KEY_PREFIX = 'pos'
+
+    def __init__(self, alias='default', ttl=300, local_entries=1000, local_ttl=60):
+        self.alias = alias
+        self.ttl = ttl
+        self.local = LocalCache(max_entries=local_entries, ttl=local_ttl)
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _version_key(self, owner_id, namespace):
+        return f'{self.KEY_PREFIX}:v:{namespace}:{owner_id}'
+
+    def _modified_key(self, owner_id, namespace):
+        return f'{self.KEY_PREFIX}:m:{namespace}:{owner_id}'
+
+    @staticmethod
+    def _fresh_version():
+        return time.time_ns() // 1000
+
+    def state(self, owner_id, namespaces):
+        """
+        Return ``(versions, last_modified)`` for ``namespaces`` in one round
+        trip: the current version of each, and the epoch time of the most
+        recent bump among them (None if none is known).
+        """
+        version_keys = {namespace: self._version_key(owner_id, namespace) for namespace in namespaces}
+        modified_keys = [self._modified_key(owner_id, namespace) for namespace in namespaces]
+        found = self.backend.get_many(list(version_keys.values()) + modified_keys)
+        versions = {}
+        for namespace, key in version_keys.items():
+            version = found.get(key)
+            if version is None:
+                version = self._fresh_version()
+                if not self.backend.add(key, version, timeout=None):
+                    version = self.backend.get(key, version)
+            versions[namespace] = version
+        modified = [found[key] for key in modified_keys if key in found]
+        return versions, max(modified) if modified else None
+
+    def versions(self, owner_id, namespaces):
+        """Current version for each namespace, fetched in one round trip."""
+        return self.state(owner_id, namespaces)[0]
+
+    @staticmethod
+    def tag(versions):
+        return '.'.join(f'{namespace}{versions[namespace]}' for namespace in sorted(versions))
+
+    def bump(self, owner_id, *namespaces):
+        """Invalidate everything ``owner_id`` has cached under ``namespaces``."""
+        now = time.time()
+        for namespace in namespaces:
+            key = self._version_key(owner_id, namespace)
+            try:
+                self.backend.incr(key)
+            except ValueError:
+                self.backend.set(key, self._fresh_version(), timeout=None)
+        self.backend.set_many(
+            {self._modified_key(owner_id, namespace): now for namespace in namespaces}, timeout=None
+        )
+
+    def bump_on_commit(self, owner_id, *namespaces):
+        """
+        Bump now, so reads later in this transaction miss, and again after
+        commit, so anything another request cached from the pre-commit
+        rows in between is dropped too.
+        """
+        if owner_id is None:
+            return
+        self.bump(owner_id, *namespaces)
+        transaction.on_commit(lambda: self.bump(owner_id, *namespaces))
+
+    def get_or_compute(self, owner_id, namespaces, name, compute, versions=None):
+        """
+        Return ``(value, tier)`` for ``name``, computing and storing it on a
+        miss. ``tier`` is ``'local'``, ``'shared'`` or ``None`` (computed).
+        Pass ``versions`` if the caller already fetched them.
+        """
+        if versions is None:
+            versions = self.versions(owner_id, namespaces)
+        key, value, tier = self.lookup(owner_id, name, versions)
+        if value is MISSING:
+            value = compute()
+            self.store(key, value)
+        return value, tier
+
+    def lookup(self, owner_id, name, versions):
+        """
+        Return ``(key, value, tier)`` for ``name`` under ``versions``; on a
+        miss ``value`` is `MISSING` and the caller `store`s it under ``key``.
+        For callers (like async views) that compute the value themselves.
+        """
+        digest = hashlib.sha1(name.encode()).hexdigest()
+        key = f'{self.KEY_PREFIX}:{owner_id}:{self.tag(versions)}:{digest}'
+
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            return key, value, 'local'
+        value = self.backend.get(key, MISSING)
+        if value is not MISSING:
+            self.shared_hits += 1
+            self.local.set(key, value)
+            return key, value, 'shared'
+
+        self.misses += 1
+        return key, MISSING, None
+
+    def store(self, key, value):
+        self.backend.set(key, value, timeout=self.ttl)
+        self.local.set(key, value)
+
+    def stats(self):
+        local = self.local.stats()
+        lookups = local['hits'] + self.shared_hits + self.misses
+        return {
+            'local_hits': local['hits'],
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'local_size': local['size'],
+            'hit_ratio': (local['hits'] + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.local.clear()
+        self.shared_hits = self.misses = 0
+
+
+read_cache = VersionedCache(
+    ttl=getattr(settings, 'POS_CACHE_TTL', 300),
+    local_entries=getattr(settings, 'POS_LOCAL_CACHE_MAX_ENTRIES', 1000),
+    local_ttl=getattr(settings, 'POS_LOCAL_CACHE_TTL', 60),
+)
+
+
+class AuthCache:
+    """
+    Token -> user resolution for `CachedTokenAuthentication`, so an
+    authenticated request doesn't query the token and user tables.
+
+    DRF tokens are cached (with their user) under a hash of the key, and
+    users under their id for signed tokens, in the shared Django cache and
+    in a `LocalCache` in front of it. `forget_user` drops a user's entries
+    here and in the shared cache; other processes' local entries expire
+    within ``local_ttl`` seconds, which bounds how long a deleted token or
+    deactivated user is still accepted by another worker.
+    """
+    KEY_PREFIX = 'pos:auth'
+
+    def __init__(self, alias='default', ttl=60, local_entries=10000, local_ttl=5):
+        self.alias = alias
+        self.ttl = ttl
+        self.local = LocalCache(max_entries=local_entries, ttl=local_ttl) if local_ttl > 0 else None
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _token_key(self, key):
+        return f'{self.KEY_PREFIX}:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def _user_key(self, user_id):
+        return f'{self.KEY_PREFIX}:user:{user_id}'
+
+    def _get(self, cache_key):
+        if self.local is not None:
+            value = self.local.get(cache_key)
+            if value is not None:
+                return value
+        value = self.backend.get(cache_key)
+        if value is not None and self.local is not None:
+            self.local.set(cache_key, value)
+        return value
+
+    def _set(self, cache_key, value):
+        self.backend.set(cache_key, value, timeout=self.ttl)
+        if self.local is not None:
+            self.local.set(cache_key, value)
+
+    def _delete(self, cache_keys):
+        self.backend.delete_many(cache_keys)
+        if self.local is not None:
+            for cache_key in cache_keys:
+                self.local.delete(cache_key)
+
+    def get_token(self, key):
+        """The cached token for ``key``, its ``user`` loaded, or None."""
+        return self._get(self._token_key(key))
+
+    def set_token(self, token):
+        self._set(self._token_key(token.key), token)
+
+    def get_user(self, user_id):
+        return self._get(self._user_key(user_id))
+
+    def set_user(self, user):
+        self._set(self._user_key(user.pk), user)
+
+    def forget_user(self, user_id, token_keys=()):
+        """Drop ``user_id`` and its tokens ``token_keys`` now and again after commit."""
+        cache_keys = [self._user_key(user_id)] + [self._token_key(key) for key in token_keys]
+        self._delete(cache_keys)
+        # A request that read the old rows before the commit may have cached them again.
+        transaction.on_commit(lambda: self._delete(cache_keys))
+
+    def clear(self):
+        if self.local is not None:
+            self.local.clear()
+
+
+auth_cache = AuthCache(
+    ttl=getattr(settings, 'POS_AUTH_CACHE_TTL', 60),
+    local_ttl=getattr(settings, 'POS_AUTH_LOCAL_CACHE_TTL', 5),
+)
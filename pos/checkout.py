@@ -0,0 +1,367 @@
+"""
+Checkout engine used by the sale endpoints.
+
+Stock is never read into Python and written back. Each product line is
+decremented with a conditional ``UPDATE ... WHERE stock_quantity >= qty``
+so two tills selling the same SKU can't both win, and the updates are
+issued in ascending product id order so row locks are always taken in the
+same order (no deadlocks between concurrent checkouts on PostgreSQL).
+
+`checkout_batch` ingests many queued sales at once (offline till sync):
+one locking read for every product involved, one UPDATE for all stock
+decrements, and bulk inserts for the sales and their items.
+
+Both record the decrements in the stock ledger in the same transaction,
+and write the sale's line, unit, cost and margin totals (`sale_totals`)
+with it. `backfill_sale_totals` fills them in for older sales.
+"""
+from collections import Counter, OrderedDict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, Subquery, When
+from django.utils import timezone
+
+from . import ledger
+from .cache import barcode_cache, read_cache
+from .models import Product, Sale, SaleItem, StockMovement
+from .rollups import queue_rollup
+from .utils import generate_receipt_number
+
+
+class ProductsNotFound(Exception):
+    """Raised when a checkout references products the owner doesn't have."""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Products not found: {self.product_ids}")
+
+
+class DuplicateSale(Exception):
+    """Raised when a sale with the same idempotency key was already recorded."""
+
+    def __init__(self, sale):
+        self.sale = sale
+        super().__init__(f"Sale {sale.receipt_number} already recorded for this idempotency key.")
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when one or more lines can't be fulfilled. ``failures`` holds one
+    dict per failing product with the requested and available quantities.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(f"Not enough stock for {len(failures)} product(s).")
+
+
+def merge_lines(items):
+    """Collapse repeated products into a single {product_id: quantity} map."""
+    quantities = OrderedDict()
+    for item in items:
+        product_id = item['product_id']
+        quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+    return quantities
+
+
+def decrement_stock(quantities, products):
+    """
+    Atomically take ``quantities`` out of stock. Must run inside a
+    transaction; raises InsufficientStock (after trying every line, so the
+    caller can report all of them) and the transaction rolls back.
+    """
+    now = timezone.now()
+    failed_ids = []
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = Product.objects.filter(
+            pk=product_id, stock_quantity__gte=quantity
+        ).update(stock_quantity=F('stock_quantity') - quantity, updated_at=now)
+        if not updated:
+            failed_ids.append(product_id)
+
+    if failed_ids:
+        available = dict(
+            Product.objects.filter(pk__in=failed_ids).values_list('id', 'stock_quantity')
+        )
+        raise InsufficientStock([
+            {
+                'product_id': product_id,
+                'name': products[product_id].name,
+                'requested': quantities[product_id],
+                'available': available.get(product_id, 0),
+            }
+            for product_id in failed_ids
+        ])
+
+
+def build_sale_items(items, products):
+    """Return (total_amount, unsaved SaleItems) priced and costed from ``products``."""
+    total_amount = Decimal('0')
+    sale_items = []
+    for item in items:
+        product = products[item['product_id']]
+        line_total = product.price * item['quantity']
+        total_amount += line_total
+        sale_items.append(
+            SaleItem(
+                product=product,
+                quantity=item['quantity'],
+                unit_price=product.price,
+                unit_cost=product.cost_price,
+                total_price=line_total,
+            )
+        )
+    return total_amount, sale_items
+
+
+def sale_totals(total_amount, lines):
+    """
+    The denormalized `Sale` totals for ``lines`` (``(quantity, unit_cost)``
+    pairs) as field values. Cost and margin are None if any cost is unknown.
+    """
+    cost_total = Decimal('0')
+    for quantity, unit_cost in lines:
+        if unit_cost is None:
+            cost_total = None
+            break
+        cost_total += quantity * unit_cost
+    return {
+        'line_count': len(lines),
+        'unit_count': sum(quantity for quantity, _ in lines),
+        'cost_total': cost_total,
+        'gross_margin': None if cost_total is None else Decimal(total_amount) - cost_total,
+    }
+
+
+def _item_totals(sale_items):
+    return [(item.quantity, item.unit_cost) for item in sale_items]
+
+
+def checkout(owner, items, payment_method, idempotency_key=None):
+    """
+    Create a Sale for ``owner`` from ``items`` (dicts with product_id and
+    quantity) and take the sold quantities out of stock.
+
+    If ``idempotency_key`` was already used by this owner, nothing is sold
+    and DuplicateSale carries the recorded sale, including when a
+    concurrent retry wins the race to insert it.
+    """
+    try:
+        return _checkout(owner, items, payment_method, idempotency_key)
+    except IntegrityError:
+        recorded = idempotency_key and Sale.objects.filter(owner=owner, idempotency_key=idempotency_key).first()
+        if recorded:
+            raise DuplicateSale(recorded)
+        # Otherwise it was a (vanishingly unlikely) receipt number clash; retry once.
+        return _checkout(owner, items, payment_method, idempotency_key)
+
+
+def _checkout(owner, items, payment_method, idempotency_key):
+    quantities = merge_lines(items)
+
+    with transaction.atomic():
+        products = Product.objects.filter(
+            id__in=list(quantities), owner=owner
+        ).only('id', 'name', 'price', 'cost_price').in_bulk()
+
+        missing = set(quantities) - set(products)
+        if missing:
+            raise ProductsNotFound(missing)
+
+        decrement_stock(quantities, products)
+        total_amount, sale_items_to_create = build_sale_items(items, products)
+
+        sale = Sale.objects.create(
+            owner=owner,
+            total_amount=total_amount,
+            payment_method=payment_method,
+            receipt_number=generate_receipt_number(),
+            idempotency_key=idempotency_key,
+            **sale_totals(total_amount, _item_totals(sale_items_to_create)),
+        )
+
+        for item in sale_items_to_create:
+            item.sale = sale
+        SaleItem.objects.bulk_create(sale_items_to_create)
+        StockMovement.objects.bulk_create([
+            ledger.record(product_id, 'sale', -quantity, sale=sale, created_at=sale.created_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+        # Cached scan payloads and product lists carry stock levels.
+        sold_ids = list(quantities)
+        transaction.on_commit(lambda: barcode_cache.invalidate_products(sold_ids))
+        read_cache.bump_on_commit(owner.pk, 'products')
+
+    return sale
+
+
+def _ingest_batch(owner, entries):
+    results = [None] * len(entries)
+    keys = [entry['idempotency_key'] for entry in entries]
+    recorded = {
+        sale['idempotency_key']: sale
+        for sale in Sale.objects.filter(owner=owner, idempotency_key__in=keys)
+        .values('id', 'idempotency_key', 'receipt_number').order_by()
+    }
+
+    pending = []
+    first_in_batch = {}
+    for index, key in enumerate(keys):
+        if key in recorded:
+            results[index] = {'status': 'duplicate', 'sale_id': recorded[key]['id'],
+                              'receipt_number': recorded[key]['receipt_number']}
+        elif key in first_in_batch:
+            continue  # resolved from the first occurrence below
+        else:
+            first_in_batch[key] = index
+            pending.append(index)
+
+    if not pending:
+        return [{'idempotency_key': key, **result} for key, result in zip(keys, results)]
+
+    product_ids = {item['product_id'] for index in pending for item in entries[index]['items']}
+    with transaction.atomic():
+        # Lock every product the batch touches, in id order, with one query.
+        products = {
+            product.id: product
+            for product in Product.objects.filter(owner=owner, id__in=product_ids)
+            .select_for_update().order_by('id').only('id', 'name', 'price', 'cost_price', 'stock_quantity')
+        }
+        available = {product_id: product.stock_quantity for product_id, product in products.items()}
+        sold = Counter()
+
+        now = timezone.now()
+        accepted = []
+        for index in pending:
+            entry = entries[index]
+            quantities = merge_lines(entry['items'])
+            missing = sorted(set(quantities) - set(products))
+            if missing:
+                results[index] = {'status': 'rejected', 'errors': {'missing_products': missing}}
+                continue
+            failures = [
+                {'product_id': product_id, 'name': products[product_id].name,
+                 'requested': quantity, 'available': available[product_id]}
+                for product_id, quantity in quantities.items() if available[product_id] < quantity
+            ]
+            if failures:
+                results[index] = {'status': 'rejected', 'errors': {'failed_items': failures}}
+                continue
+            for product_id, quantity in quantities.items():
+                available[product_id] -= quantity
+                sold[product_id] += quantity
+
+            total_amount, sale_items = build_sale_items(entry['items'], products)
+            sale = Sale(
+                owner=owner,
+                total_amount=total_amount,
+                payment_method=entry['payment_method'],
+                receipt_number=generate_receipt_number(),
+                idempotency_key=entry['idempotency_key'],
+                created_at=now,
+                **sale_totals(total_amount, _item_totals(sale_items)),
+            )
+            accepted.append((index, sale, sale_items))
+
+        if sold:
+            Product.objects.filter(pk__in=list(sold)).update(
+                stock_quantity=Case(
+                    *[When(pk=product_id, then=F('stock_quantity') - quantity) for product_id, quantity in sold.items()]
+                ),
+                updated_at=now,
+            )
+
+        sales = Sale.objects.bulk_create([sale for _, sale, _ in accepted])
+        sale_items = []
+        movements = []
+        for (index, _, items), sale in zip(accepted, sales):
+            for item in items:
+                item.sale = sale
+                sale_items.append(item)
+            movements.extend(
+                ledger.record(product_id, 'sale', -quantity, sale=sale, created_at=now)
+                for product_id, quantity in merge_lines(entries[index]['items']).items()
+            )
+        SaleItem.objects.bulk_create(sale_items)
+        StockMovement.objects.bulk_create(movements)
+
+        # bulk_create skips the Sale signals, so roll the batch up in aggregate.
+        rollup = {}
+        for sale in sales:
+            group = rollup.setdefault((timezone.localdate(sale.created_at), sale.payment_method), [0, Decimal('0')])
+            group[0] += 1
+            group[1] += sale.total_amount
+        for (day, payment_method), (count, revenue) in rollup.items():
+            queue_rollup(owner.pk, day, payment_method, count, revenue)
+
+        sold_ids = list(sold)
+        transaction.on_commit(lambda: barcode_cache.invalidate_products(sold_ids))
+        read_cache.bump_on_commit(owner.pk, 'products', 'sales')
+
+    for (index, _, _), sale in zip(accepted, sales):
+        results[index] = {'status': 'created', 'sale_id': sale.pk, 'receipt_number': sale.receipt_number}
+    for index, key in enumerate(keys):
+        if results[index] is None:
+            first = results[first_in_batch[key]]
+            results[index] = {**first, 'status': 'duplicate' if first['status'] == 'created' else first['status']}
+        results[index] = {'idempotency_key': key, **results[index]}
+    return results
+
+
+def checkout_batch(owner, entries):
+    """
+    Ingest ``entries`` (dicts with idempotency_key, payment_method and
+    items) as independent sales, in order. Returns one result per entry:
+    ``created``, ``duplicate`` (the key was already recorded) or
+    ``rejected`` (with the reason); a rejected sale doesn't affect the rest.
+    """
+    try:
+        return _ingest_batch(owner, entries)
+    except IntegrityError:
+        # A concurrent replay recorded some of these keys first; they're duplicates now.
+        return _ingest_batch(owner, entries)
+
+
+def backfill_sale_totals(sales=None, chunk_size=5000, assume_current_cost=False, stdout=None):
+    """
+    Compute the denormalized totals of ``sales`` (default: those never
+    computed, i.e. with no lines counted) from their items, ``chunk_size``
+    sales per transaction. With ``assume_current_cost``, lines sold before
+    costs were recorded first take their product's current cost_price.
+    Returns the number of sales updated.
+    """
+    sales = Sale.objects.filter(line_count=0) if sales is None else sales
+    fields = ['line_count', 'unit_count', 'cost_total', 'gross_margin']
+    updated = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                sales.filter(pk__gt=last_pk).order_by('pk').only('id', 'owner_id', 'total_amount')[:chunk_size]
+            )
+            if not chunk:
+                return updated
+            last_pk = chunk[-1].pk
+            ids = [sale.pk for sale in chunk]
+            if assume_current_cost:
+                SaleItem.objects.filter(sale_id__in=ids, unit_cost__isnull=True).update(
+                    unit_cost=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('cost_price')[:1])
+                )
+            lines = {}
+            for sale_id, quantity, unit_cost in (
+                SaleItem.objects.filter(sale_id__in=ids).order_by().values_list('sale_id', 'quantity', 'unit_cost')
+            ):
+                lines.setdefault(sale_id, []).append((quantity, unit_cost))
+            for sale in chunk:
+                for field, value in sale_totals(sale.total_amount, lines.get(sale.pk, [])).items():
+                    setattr(sale, field, value)
+            Sale.objects.bulk_update(chunk, fields)
+            # The sale endpoints return the totals.
+            for owner_id in {sale.owner_id for sale in chunk}:
+                read_cache.bump_on_commit(owner_id, 'sales')
+        updated += len(chunk)
+        if stdout is not None:
+            stdout.write(f"Backfilled sales up to id {last_pk}")
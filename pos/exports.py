@@ -0,0 +1,92 @@
+"""
+Streaming exports.
+
+Rows are pulled from the database with ``QuerySet.iterator()`` (a
+server-side cursor on PostgreSQL) and encoded one at a time into a
+StreamingHttpResponse, so memory stays flat however large the export is.
+"""
+import csv
+import itertools
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from . import archive
+from .imports import IMPORT_FIELDS
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose ``write`` just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_lines(header, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def streaming_export(header, rows, fmt, filename):
+    """Stream ``rows`` (tuples matching ``header``) as a CSV or JSON Lines download."""
+    lines = json_lines(header, rows) if fmt in ('jsonl', 'ndjson') else csv_lines(header, rows)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def export_products(products, fmt):
+    """Stream a catalog in the same columns the importer reads."""
+    rows = products.order_by('id').values_list(*IMPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return streaming_export(IMPORT_FIELDS, rows, fmt, 'products')
+
+
+SALE_EXPORT_HEADER = [
+    'receipt_number', 'sale_id', 'created_at', 'payment_method', 'sale_total',
+    'item_id', 'product_id', 'product_name', 'quantity', 'unit_price', 'total_price',
+]
+SALE_EXPORT_COLUMNS = [
+    'sale__receipt_number', 'sale_id', 'sale__created_at', 'sale__payment_method', 'sale__total_amount',
+    'id', 'product_id', 'product__name', 'quantity', 'unit_price', 'total_price',
+]
+
+
+def export_sales(owner, start, end, fmt, filename='sales'):
+    """
+    Stream one row per sale item sold by ``owner`` in ``[start, end)``,
+    flattened with its sale and product name by a single join.
+    """
+    # Archived months (if the range reaches them) come first: they're older.
+    rows = itertools.chain.from_iterable(
+        items.filter(sale__owner=owner)
+        .order_by('sale__created_at', 'sale_id', 'id')
+        .values_list(*SALE_EXPORT_COLUMNS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for items in archive.item_sources(start, end)
+    )
+    created_at = SALE_EXPORT_COLUMNS.index('sale__created_at')
+
+    def localized(rows):
+        for row in rows:
+            row = list(row)
+            row[created_at] = timezone.localtime(row[created_at]).isoformat()
+            yield row
+
+    return streaming_export(SALE_EXPORT_HEADER, localized(rows), fmt, filename)
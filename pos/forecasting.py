@@ -0,0 +1,189 @@
+"""
+Demand forecasts and reorder points.
+
+Each product's daily unit sales are smoothed with an exponentially
+weighted moving average of the mean and variance (West's update), kept in
+`ProductForecast` together with the last day folded in. `update_forecasts`
+reads only the complete local days after that: one grouped ``SaleItem``
+query per chunk of products builds a products x days NumPy matrix, and the
+days are folded in column by column, each step vectorized across the whole
+chunk. Running it daily therefore reads one day of sales.
+
+The reorder point covers the expected demand over the lead time plus a
+safety stock of ``z`` standard deviations:
+
+    ceil(velocity * lead_time + z * std * sqrt(lead_time))
+
+and is at least 1, so anything out of stock is always low. It is written to
+``Product.reorder_point``, where `below_reorder_point` compares it with
+``stock_quantity`` through the (owner, stock_quantity - reorder_point)
+index. Products that were never forecast keep the default of 10.
+
+`update_forecasts` is also a task, so the daily run can be queued for the
+workers with ``update_forecasts.enqueue()``.
+
+Sales recorded later for a day that was already folded in (e.g. an offline
+batch synced days afterwards) are not counted.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import archive
+from .cache import barcode_cache, read_cache
+from .models import Product, ProductForecast
+from .tasks import task
+from .utils import day_bounds
+
+HISTORY_DAYS = 365
+
+
+def below_reorder_point(products):
+    """``products`` whose stock is under their reorder point, as the index expression."""
+    return products.alias(headroom=F('stock_quantity') - F('reorder_point')).filter(headroom__lt=0)
+
+
+def smooth(demand, mean, variance, first_column, alpha):
+    """
+    Fold the columns of ``demand`` (products x days) into each product's
+    running ``mean`` and ``variance``, starting at its ``first_column``.
+    A product whose mean is NaN has no state yet and is seeded from its
+    first day. Returns the new ``(mean, variance)`` arrays.
+    """
+    mean = np.array(mean, dtype=np.float64)
+    variance = np.array(variance, dtype=np.float64)
+    first_column = np.asarray(first_column)
+    for column in range(int(first_column.min(initial=demand.shape[1])), demand.shape[1]):
+        active = first_column <= column
+        units = demand[:, column]
+        seed = active & np.isnan(mean)
+        if seed.any():
+            mean[seed] = units[seed]
+            variance[seed] = 0.0
+            active &= ~seed
+        diff = np.where(active, units - mean, 0.0)
+        increment = alpha * diff
+        mean += increment
+        variance = np.where(active, (1 - alpha) * (variance + diff * increment), variance)
+    return mean, variance
+
+
+def reorder_points(mean, variance, lead_time, z):
+    """Demand over ``lead_time`` days plus ``z`` standard deviations of it, at least 1."""
+    demand = mean * lead_time + z * np.sqrt(np.maximum(variance, 0.0) * lead_time)
+    # Rounding noise must not push an exact integer up to the next one.
+    return np.maximum(np.ceil(np.round(demand, 6)), 1).astype(np.int64)
+
+
+def _daily_units(product_ids, first_day, days):
+    """Units sold per (product, local day) over ``days`` days from ``first_day``."""
+    start, end = day_bounds(first_day, days=days)
+    return [
+        row
+        for items in archive.item_sources(start, end)
+        for row in (
+            items.filter(product_id__in=product_ids)
+            .annotate(day=TruncDate('sale__created_at'))
+            .values('product_id', 'day')
+            .annotate(units=Sum('quantity'))
+            .order_by()
+            .values_list('product_id', 'day', 'units')
+        )
+    ]
+
+
+@task
+def update_forecasts(products=None, today=None, history_days=HISTORY_DAYS, chunk_size=5000):
+    """
+    Fold the complete days before ``today`` into the forecasts of
+    ``products`` (default all) and update their reorder points,
+    ``chunk_size`` products per transaction. A product without a forecast
+    starts from its creation day or ``history_days`` back, whichever is
+    later. Returns the number of forecasts updated.
+    """
+    products = Product.objects.all() if products is None else products
+    today = today or timezone.localdate()
+    last_day = today - timedelta(days=1)
+    earliest = last_day - timedelta(days=history_days)
+    alpha = settings.POS_FORECAST_ALPHA
+    lead_time = settings.POS_FORECAST_LEAD_TIME_DAYS
+    z = settings.POS_FORECAST_SERVICE_Z
+
+    updated = 0
+    last_pk = 0
+    while True:
+        chunk = list(
+            products.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'owner_id', 'created_at')[:chunk_size]
+        )
+        if not chunk:
+            return updated
+        last_pk = chunk[-1][0]
+
+        state = {
+            pk: (velocity, variance, through_day)
+            for pk, velocity, variance, through_day in ProductForecast.objects.filter(
+                product_id__in=[pk for pk, _, _ in chunk]
+            ).values_list('product_id', 'velocity', 'variance', 'through_day')
+        }
+        chunk = [
+            (pk, owner_id, state[pk] if pk in state else (
+                np.nan, 0.0, max(earliest, timezone.localtime(created_at).date() - timedelta(days=1))
+            ))
+            for pk, owner_id, created_at in chunk
+        ]
+        # Only products with complete days still to fold in.
+        chunk = [row for row in chunk if row[2][2] < last_day]
+        if not chunk:
+            continue
+
+        ids = np.array([pk for pk, _, _ in chunk], dtype=np.int64)
+        through = np.array([through_day for _, _, (_, _, through_day) in chunk], dtype='datetime64[D]')
+        first_day = through.min().item() + timedelta(days=1)
+        days = (last_day - first_day).days + 1
+
+        rows = _daily_units(ids.tolist(), first_day, days)
+        demand = np.zeros((len(ids), days), dtype=np.float64)
+        if rows:
+            product_ids, sale_days, units = zip(*rows)
+            columns = (np.array(sale_days, dtype='datetime64[D]') - np.datetime64(first_day, 'D')).astype(np.int64)
+            np.add.at(demand, (np.searchsorted(ids, product_ids), columns), units)
+
+        first_column = (through - np.datetime64(first_day, 'D')).astype(np.int64) + 1
+        mean, variance = smooth(
+            demand,
+            [velocity for _, _, (velocity, _, _) in chunk],
+            [variance for _, _, (_, variance, _) in chunk],
+            first_column,
+            alpha,
+        )
+        # A product that sold nothing yet has no demand, rather than no state.
+        mean = np.nan_to_num(mean)
+        points = reorder_points(mean, variance, lead_time, z)
+
+        with transaction.atomic():
+            ProductForecast.objects.bulk_create(
+                [
+                    ProductForecast(
+                        product_id=pk, velocity=velocity, variance=spread, through_day=last_day, reorder_point=point,
+                    )
+                    for pk, velocity, spread, point in zip(ids.tolist(), mean.tolist(), variance.tolist(), points.tolist())
+                ],
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['velocity', 'variance', 'through_day', 'reorder_point', 'updated_at'],
+            )
+            Product.objects.filter(pk__in=ids.tolist()).update(
+                reorder_point=Subquery(
+                    ProductForecast.objects.filter(product=OuterRef('pk')).values('reorder_point')[:1]
+                )
+            )
+            for owner_id in {owner_id for _, owner_id, _ in chunk}:
+                read_cache.bump_on_commit(owner_id, 'products')
+            changed = ids.tolist()
+            transaction.on_commit(lambda: barcode_cache.invalidate_products(changed))
+        updated += len(ids)
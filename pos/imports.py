@@ -0,0 +1,207 @@
+"""
+Streaming bulk product import.
+
+Rows are parsed incrementally from CSV or JSON Lines, validated a chunk at
+a time, and upserted by barcode with one ``INSERT ... ON CONFLICT DO
+UPDATE`` per chunk. A row for an existing product only changes the
+columns it has (an empty CSV cell counts as missing); new products need a
+name and price, and take the defaults for the rest.
+Each chunk commits on its own, so a large catalog never sits in one long
+transaction or in memory. Rows that fail validation, or whose barcode
+belongs to another store, are reported back by row number. Stock changes
+are recorded in the stock ledger like any other edit.
+"""
+import codecs
+import csv
+import json
+import uuid
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import ledger
+from .cache import barcode_cache, read_cache
+from .models import Product, StockMovement
+
+IMPORT_FIELDS = ['barcode', 'name', 'description', 'price', 'stock_quantity', 'category']
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = IMPORT_FIELDS
+        extra_kwargs = {
+            # Existing barcodes are upserts, not errors; ownership is checked per chunk.
+            'barcode': {'validators': [], 'required': False, 'allow_null': True, 'allow_blank': True},
+        }
+
+
+def detect_format(name='', content_type=''):
+    """Guess the import format from a file name or content type."""
+    name = (name or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_rows(stream, fmt):
+    """Yield one dict per record from a binary ``stream``, without reading it all."""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    yield {'__error__': f"Invalid JSON: {exc}"}
+                    continue
+                yield row if isinstance(row, dict) else {'__error__': "Each line must be a JSON object."}
+    else:
+        for row in csv.DictReader(lines):
+            # Empty cells mean "use the default", like a missing JSON key.
+            yield {key: value for key, value in row.items() if key and value not in ('', None)}
+
+
+def _generate_barcode():
+    # Same scheme as Product.save(), which bulk_create bypasses.
+    return str(uuid.uuid4()).replace('-', '')[:12].upper()
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': len(self.errors),
+            'errors': self.errors,
+        }
+
+
+class _BarcodeTaken(Exception):
+    """Another store created one of the chunk's new barcodes while it was being written."""
+
+
+def _import_chunk(owner, numbered_rows, report):
+    # Partial: a missing column leaves an existing product's value alone.
+    validator = ProductImportSerializer(partial=True)
+    valid = []
+    for row_number, row in numbered_rows:
+        if '__error__' in row:
+            report.errors.append({'row': row_number, 'errors': {'non_field_errors': [row['__error__']]}})
+            continue
+        try:
+            data = validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            report.errors.append({'row': row_number, 'errors': exc.detail})
+            continue
+        data['barcode'] = data.get('barcode') or _generate_barcode()
+        valid.append((row_number, data))
+
+    # Later rows win when a chunk repeats a barcode (one upsert can't touch a row twice).
+    by_barcode = {}
+    for row_number, data in valid:
+        earlier = by_barcode.get(data['barcode'], (None, {}))[1]
+        by_barcode[data['barcode']] = (row_number, {**earlier, **data})
+    while True:
+        try:
+            created, updated, errors = _write_chunk(owner, by_barcode)
+        except _BarcodeTaken:
+            continue  # rolled back; the next attempt sees the other store's row
+        break
+    report.errors.extend(errors)
+    report.created += created
+    report.updated += updated
+
+
+def _write_chunk(owner, by_barcode):
+    with transaction.atomic():
+        # Lock the rows being overwritten so the ownership check holds, the
+        # columns a row leaves out keep their values and the ledger records
+        # the exact change.
+        existing = {
+            row['barcode']: row
+            for row in Product.objects.select_for_update()
+            .filter(barcode__in=list(by_barcode)).order_by('pk')
+            .values('owner_id', *IMPORT_FIELDS)
+        }
+        fields = ProductImportSerializer().fields
+        required = [name for name, field in fields.items() if field.required]
+        products = []
+        errors = []
+        for barcode, (row_number, data) in by_barcode.items():
+            current = existing.get(barcode)
+            if current is None:
+                missing = [name for name in required if name not in data]
+                if missing:
+                    errors.append({
+                        'row': row_number,
+                        'errors': {name: [fields[name].error_messages['required']] for name in missing},
+                    })
+                    continue
+                products.append(Product(owner=owner, **data))
+            elif current['owner_id'] != owner.pk:
+                errors.append({'row': row_number, 'errors': {'barcode': ["Barcode is used by another store."]}})
+            else:
+                values = {name: current[name] for name in IMPORT_FIELDS}
+                values.update(data)
+                products.append(Product(owner=owner, **values))
+
+        barcodes = [p.barcode for p in products]
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['barcode'],
+            update_fields=['name', 'description', 'price', 'stock_quantity', 'category', 'updated_at'],
+        )
+        # Row locks don't cover barcodes that didn't exist yet: if another store
+        # inserted one since, the upsert just overwrote its product. Roll back.
+        if Product.objects.filter(barcode__in=barcodes).exclude(owner=owner).exists():
+            raise _BarcodeTaken
+
+        ids = dict(Product.objects.filter(owner=owner, barcode__in=barcodes).values_list('barcode', 'id'))
+        movements = []
+        for product in products:
+            if product.barcode in existing:
+                change, kind = product.stock_quantity - existing[product.barcode]['stock_quantity'], 'adjustment'
+            else:
+                change, kind = product.stock_quantity, 'opening'
+            if change:
+                movements.append(ledger.record(ids[product.barcode], kind, change, note='Import'))
+        StockMovement.objects.bulk_create(movements)
+
+        updated_ids = [ids[barcode] for barcode in barcodes if barcode in existing]
+        transaction.on_commit(lambda: barcode_cache.invalidate_products(updated_ids))
+        read_cache.bump_on_commit(owner.pk, 'products')
+
+    updated = sum(1 for p in products if p.barcode in existing)
+    return len(products) - updated, updated, errors
+
+
+def import_products(owner, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upsert ``rows`` (an iterable of dicts) into ``owner``'s catalog in
+    chunks of ``chunk_size``. Returns an ImportReport; row numbers are
+    1-based and count data rows only.
+    """
+    report = ImportReport()
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        report.processed += len(chunk)
+        _import_chunk(owner, chunk, report)
+    report.errors.sort(key=lambda error: error['row'])
+    return report
@@ -0,0 +1,190 @@
+"""
+Stock movement ledger.
+
+Every change to ``Product.stock_quantity`` appends `StockMovement` rows in
+the same transaction: sales from the checkout engine, opening balances for
+new products, restocks, returns and adjustments from the stock endpoint,
+and the difference when a product's stock is overwritten by an edit or an
+import. The ledger is append-only; mistakes are corrected with further
+adjustments.
+
+`take_snapshots` records, for products that moved since their last
+snapshot, the current stock and the id of the last movement it includes.
+`stock_as_of` then reads one snapshot through the (product, taken_at)
+index and sums only the movements after it, instead of replaying the
+product's whole history. `verify_ledger` reconciles the ledger against
+``stock_quantity`` a chunk of products at a time.
+
+`take_snapshots` is also a task (``take_snapshots.enqueue()``), so
+compaction can run on the workers rather than in a request or cron job.
+"""
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .cache import barcode_cache, read_cache
+from .models import Product, StockMovement, StockSnapshot
+from .tasks import task
+
+# Kinds a client can record through the stock endpoint, and the sign their quantity must have.
+MANUAL_KINDS = {'restock': 1, 'return': 1, 'adjustment': 0}
+
+
+class StockWouldGoNegative(Exception):
+    """Raised when a movement would take a product below zero."""
+
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f"Only {available} of {product.name} in stock.")
+
+
+def record(product_id, kind, quantity, sale=None, note='', created_at=None):
+    """An unsaved movement; pass a list of them to `StockMovement.objects.bulk_create`."""
+    return StockMovement(
+        product_id=product_id, kind=kind, quantity=quantity, sale=sale, note=note,
+        created_at=created_at or timezone.now(),
+    )
+
+
+def move_stock(product, kind, quantity, note=''):
+    """
+    Apply a restock, return or adjustment of ``quantity`` (signed) to
+    ``product`` and record it. Returns the new stock level.
+    """
+    with transaction.atomic():
+        products = Product.objects.filter(pk=product.pk)
+        if quantity < 0:
+            products = products.filter(stock_quantity__gte=-quantity)
+        if not products.update(stock_quantity=F('stock_quantity') + quantity, updated_at=timezone.now()):
+            available = Product.objects.values_list('stock_quantity', flat=True).get(pk=product.pk)
+            raise StockWouldGoNegative(product, available)
+        StockMovement.objects.bulk_create([record(product.pk, kind, quantity, note=note)])
+        stock = Product.objects.values_list('stock_quantity', flat=True).get(pk=product.pk)
+        transaction.on_commit(lambda: barcode_cache.invalidate_products([product.pk]))
+        read_cache.bump_on_commit(product.owner_id, 'products')
+    return stock
+
+
+def lock_stock_levels(product_ids):
+    """``{product_id: stock_quantity}``, locking the rows until the transaction ends."""
+    return dict(
+        Product.objects.select_for_update().filter(pk__in=list(product_ids))
+        .order_by('pk').values_list('pk', 'stock_quantity')
+    )
+
+
+def record_overwrites(before, products, kind='adjustment', note=''):
+    """
+    Record the difference between the stock levels in ``before`` (from
+    `lock_stock_levels`) and the ``products`` that were just saved over them.
+    """
+    movements = [
+        record(product.pk, kind, product.stock_quantity - before[product.pk], note=note)
+        for product in products
+        if product.pk in before and product.stock_quantity != before[product.pk]
+    ]
+    StockMovement.objects.bulk_create(movements)
+    return movements
+
+
+@task
+def take_snapshots(products=None, chunk_size=1000):
+    """
+    Snapshot every product (of ``products``, default all) whose ledger grew
+    since its last snapshot, ``chunk_size`` products per transaction.
+    Returns the number of snapshots written.
+    """
+    products = Product.objects.all() if products is None else products
+    latest_snapshot = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-taken_at', '-id')
+    stale = products.annotate(
+        last_movement=Max('movements__id'),
+        snapshot_covers=Subquery(latest_snapshot.values('last_movement_id')[:1]),
+    ).filter(
+        Q(snapshot_covers__isnull=True) | Q(snapshot_covers__lt=F('last_movement')),
+        last_movement__isnull=False,
+    ).order_by('pk')
+
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(stale.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+        if not chunk:
+            return written
+        with transaction.atomic():
+            # Locked, so no checkout can move stock between reading it and its ledger position.
+            levels = lock_stock_levels(chunk)
+            positions = dict(
+                StockMovement.objects.filter(product_id__in=chunk).values('product_id')
+                .annotate(last=Max('id')).order_by().values_list('product_id', 'last')
+            )
+            now = timezone.now()
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(product_id=pk, quantity=levels[pk], last_movement_id=positions[pk], taken_at=now)
+                for pk in chunk if pk in levels
+            ])
+        written += len(chunk)
+        last_pk = chunk[-1]
+
+
+def stock_as_of(product, when):
+    """``product``'s stock level at ``when``, from the nearest snapshot plus later movements."""
+    snapshot = (
+        StockSnapshot.objects.filter(product=product, taken_at__lte=when)
+        .order_by('-taken_at', '-id').first()
+    )
+    if snapshot is None:
+        movements = StockMovement.objects.filter(product=product, created_at__lte=when)
+        return movements.aggregate(total=Sum('quantity'))['total'] or 0
+    movements = movements_since(product, when, snapshot.last_movement_id)
+    return snapshot.quantity + (movements.aggregate(total=Sum('quantity'))['total'] or 0)
+
+
+def movements_since(product, when, last_movement_id):
+    """
+    ``product``'s movements after ``last_movement_id`` up to ``when``. Scans
+    the (product, id) index from the snapshot's position, so the cost
+    doesn't grow with the product's history.
+    """
+    return StockMovement.objects.filter(
+        product=product, pk__gt=last_movement_id, created_at__lte=when,
+    ).order_by('pk')
+
+
+def verify_ledger(products=None, chunk_size=1000, fix=False, stdout=None):
+    """
+    Compare the sum of each product's movements with its stock_quantity,
+    ``chunk_size`` products per query. Returns the mismatches as dicts;
+    with ``fix``, records an adjustment that brings each ledger in line.
+    """
+    products = Product.objects.all() if products is None else products
+    mismatches = []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            levels = products.filter(pk__gt=last_pk).order_by('pk')
+            if fix:
+                # Hold the rows so the correction matches the stock it was computed from.
+                levels = levels.select_for_update()
+            chunk = dict(levels.values_list('pk', 'stock_quantity')[:chunk_size])
+            if not chunk:
+                break
+            ledger = dict(
+                StockMovement.objects.filter(product_id__in=list(chunk)).values('product_id')
+                .annotate(total=Sum('quantity')).order_by().values_list('product_id', 'total')
+            )
+            found = [
+                {'product_id': pk, 'stock_quantity': stock, 'ledger': ledger.get(pk, 0)}
+                for pk, stock in chunk.items() if ledger.get(pk, 0) != stock
+            ]
+            if fix:
+                StockMovement.objects.bulk_create([
+                    record(m['product_id'], 'adjustment', m['stock_quantity'] - m['ledger'],
+                           note='Ledger reconciliation')
+                    for m in found
+                ])
+        mismatches.extend(found)
+        last_pk = max(chunk)
+        if stdout is not None:
+            stdout.write(f"Checked products up to id {last_pk}")
+    return mismatches
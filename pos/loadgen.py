@@ -0,0 +1,210 @@
+"""
+Synthetic POS data at production scale, for ``manage.py generate_load_data``.
+
+Each owner gets a catalog and a sales history drawn from distributions
+that look like a real shop rather than uniform noise:
+
+- SKU popularity is Zipfian: the product of rank ``r`` is picked with
+  probability proportional to ``r ** -zipf_s``, so a few products make up
+  most of the sales (and the hot rows, index pages and cache keys are as
+  skewed as in production). Ranks are shuffled, so popularity is unrelated
+  to product id.
+- Sales follow a trading day: none overnight, a lunchtime and an
+  early-evening peak (`HOURLY_WEIGHTS`), and busier weekends.
+- Baskets hold ``1 + Poisson(items_per_sale - 1)`` lines; quantities are
+  geometric, mostly 1. Costs are 55-85% of the price.
+
+Everything is written with chunked ``bulk_create``s, with the side tables
+the signals and checkout would have kept: opening and sale stock movements
+(so ``verify_stock_ledger`` passes), then the daily rollups and demand
+forecasts are rebuilt for the new owners. A fixed ``seed`` reproduces the
+same data.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import forecasting, ledger
+from .checkout import sale_totals
+from .models import Product, Sale, SaleItem, StockMovement
+from .rollups import rebuild_rollups
+from .utils import day_bounds
+
+# Relative share of a day's sales in each local hour.
+HOURLY_WEIGHTS = np.array([
+    0, 0, 0, 0, 0, 0, 0, 1, 3, 4, 5, 7, 10, 9, 6, 5, 6, 8, 10, 9, 6, 3, 1, 0,
+], dtype=np.float64)
+# Monday first.
+WEEKDAY_WEIGHTS = np.array([1.0, 0.95, 0.95, 1.0, 1.15, 1.35, 1.25])
+PAYMENT_METHODS = (('cash', 0.4), ('card', 0.35), ('upi', 0.25))
+
+# noun: (category, typical price)
+CATALOG = {
+    'Tea': ('Beverages', 120), 'Coffee': ('Beverages', 250), 'Cola': ('Beverages', 40),
+    'Juice': ('Beverages', 90), 'Chips': ('Snacks', 20), 'Biscuits': ('Snacks', 30),
+    'Noodles': ('Instant Food', 12), 'Milk': ('Dairy', 60), 'Butter': ('Dairy', 55),
+    'Bread': ('Bakery', 25), 'Rice': ('Staples', 90), 'Flour': ('Staples', 50),
+    'Soap': ('Personal Care', 45), 'Toothpaste': ('Personal Care', 85), 'Shampoo': ('Personal Care', 160),
+}
+ADJECTIVES = ['Classic', 'Green', 'Organic', 'Premium', 'Fresh', 'Spicy', 'Family', 'Lite', 'Gold', 'Masala']
+SIZES = ['100g', '250g', '500g', '1kg', '200ml', '500ml', '1L', 'Pack of 4']
+
+
+def zipf_weights(count, s):
+    """Probabilities of picking each of ``count`` ranks, proportional to ``rank ** -s``."""
+    weights = np.arange(1, count + 1, dtype=np.float64) ** -s
+    return weights / weights.sum()
+
+
+def sale_times(rng, count, days, today=None):
+    """``count`` sorted, aware sale times over the ``days`` local days up to ``today``."""
+    today = today or timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    day_list = [first_day + timedelta(days=offset) for offset in range(days)]
+    day_weights = WEEKDAY_WEIGHTS[[day.weekday() for day in day_list]]
+    day_index = rng.choice(days, size=count, p=day_weights / day_weights.sum())
+    seconds = rng.choice(24, size=count, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum()) * 3600 + rng.integers(0, 3600, count)
+
+    starts = [day_bounds(day)[0] for day in day_list]
+    now = timezone.now()
+    times = []
+    for day, offset in zip(day_index.tolist(), seconds.tolist()):
+        when = starts[day] + timedelta(seconds=offset)
+        if when > now:
+            # Today's sales only go up to now; later ones happened yesterday.
+            when -= timedelta(days=1)
+        times.append(when)
+    times.sort()
+    return times
+
+
+def _catalog(rng, owner, count, prefix):
+    nouns = list(CATALOG)
+    picks = rng.integers(0, len(nouns), count)
+    adjectives = rng.integers(0, len(ADJECTIVES), count)
+    sizes = rng.integers(0, len(SIZES), count)
+    spread = rng.lognormal(0, 0.3, count)
+    markup = rng.uniform(0.55, 0.85, count)
+    products = []
+    for i in range(count):
+        noun = nouns[picks[i]]
+        category, price = CATALOG[noun]
+        price = Decimal(str(round(max(price * spread[i], 1.0), 2)))
+        products.append(Product(
+            owner=owner,
+            name=f'{ADJECTIVES[adjectives[i]]} {noun} {SIZES[sizes[i]]}',
+            category=category,
+            price=price,
+            cost_price=(price * Decimal(str(round(markup[i], 2)))).quantize(Decimal('0.01')),
+            barcode=f'{prefix.upper()}{owner.pk}-{i}',
+        ))
+    return products
+
+
+def generate_owner(rng, owner, products, sales, days, prefix, items_per_sale=2.5, zipf_s=1.1,
+                   chunk_size=5000, today=None, stdout=None):
+    """Create ``products`` products and ``sales`` sales for ``owner``. Returns the number of sale items."""
+    today = today or timezone.localdate()
+    opened_at = day_bounds(today - timedelta(days=days))[0]
+
+    # Draw the whole history first: opening stock has to cover everything sold.
+    lines = np.minimum(1 + rng.poisson(max(items_per_sale - 1, 0), sales), 20)
+    popularity = rng.permutation(products)
+    picks = popularity[rng.choice(products, size=int(lines.sum()), p=zipf_weights(products, zipf_s))]
+    quantities = np.minimum(rng.geometric(0.7, picks.size), 10)
+    sold = np.bincount(picks, weights=quantities, minlength=products).astype(np.int64)
+    closing = rng.integers(0, 300, products)
+    methods = rng.choice(
+        [method for method, _ in PAYMENT_METHODS], size=sales, p=[share for _, share in PAYMENT_METHODS],
+    ).tolist()
+    times = sale_times(rng, sales, days, today=today)
+
+    catalog = _catalog(rng, owner, products, prefix)
+    for product, stock in zip(catalog, closing.tolist()):
+        product.stock_quantity = stock
+    with transaction.atomic():
+        for start in range(0, products, chunk_size):
+            Product.objects.bulk_create(catalog[start:start + chunk_size])
+        # bulk_create stamps auto_now_add fields with "now"; backdate them afterwards.
+        Product.objects.filter(owner=owner).update(created_at=opened_at)
+        StockMovement.objects.bulk_create(
+            [
+                ledger.record(product.pk, 'opening', opening, created_at=opened_at)
+                for product, opening in zip(catalog, (closing + sold).tolist())
+            ],
+            batch_size=chunk_size,
+        )
+    if stdout is not None:
+        stdout.write(f"{owner.username}: {products} products")
+
+    line_offsets = np.concatenate([[0], np.cumsum(lines)])
+    for start in range(0, sales, chunk_size):
+        end = min(start + chunk_size, sales)
+        with transaction.atomic():
+            batch, items, movements = [], [], []
+            for n in range(start, end):
+                sale_lines = range(line_offsets[n], line_offsets[n + 1])
+                sale_items = [
+                    SaleItem(
+                        product=catalog[picks[line]],
+                        quantity=int(quantities[line]),
+                        unit_price=catalog[picks[line]].price,
+                        unit_cost=catalog[picks[line]].cost_price,
+                        total_price=catalog[picks[line]].price * int(quantities[line]),
+                    )
+                    for line in sale_lines
+                ]
+                total_amount = sum(item.total_price for item in sale_items)
+                sale = Sale(
+                    owner=owner,
+                    total_amount=total_amount,
+                    payment_method=methods[n],
+                    receipt_number=f'G{owner.pk:07d}-{n:09d}',
+                    **sale_totals(total_amount, [(item.quantity, item.unit_cost) for item in sale_items]),
+                )
+                batch.append((sale, sale_items))
+            Sale.objects.bulk_create([sale for sale, _ in batch])
+            for n, (sale, _) in enumerate(batch, start=start):
+                sale.created_at = times[n]
+            Sale.objects.bulk_update([sale for sale, _ in batch], ['created_at'])
+            for sale, sale_items in batch:
+                for item in sale_items:
+                    item.sale = sale
+                    items.append(item)
+                    movements.append(
+                        ledger.record(item.product.pk, 'sale', -item.quantity, sale=sale, created_at=sale.created_at)
+                    )
+            SaleItem.objects.bulk_create(items)
+            StockMovement.objects.bulk_create(movements)
+        if stdout is not None:
+            stdout.write(f"{owner.username}: {end}/{sales} sales")
+    return int(lines.sum())
+
+
+def generate(owners, products, sales, days=90, prefix='load', password='password123', seed=0,
+             items_per_sale=2.5, zipf_s=1.1, chunk_size=5000, stdout=None):
+    """
+    Create ``owners`` users named ``<prefix>-<n>``, each with ``products``
+    products and ``sales`` sales over the last ``days`` days. Returns
+    ``{'owners': ..., 'products': ..., 'sales': ..., 'sale_items': ...}``.
+    """
+    rng = np.random.default_rng(seed)
+    User = get_user_model()
+    hashed = make_password(password)
+    users = User.objects.bulk_create([User(username=f'{prefix}-{n}', password=hashed) for n in range(owners)])
+
+    today = timezone.localdate()
+    sale_items = 0
+    for user in users:
+        sale_items += generate_owner(
+            rng, user, products, sales, days, prefix, items_per_sale=items_per_sale, zipf_s=zipf_s,
+            chunk_size=chunk_size, today=today, stdout=stdout,
+        )
+        rebuild_rollups(owner=user)
+    forecasting.update_forecasts(products=Product.objects.filter(owner__in=users), today=today)
+    return {'owners': len(users), 'products': owners * products, 'sales': owners * sales, 'sale_items': sale_items}
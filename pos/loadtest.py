@@ -0,0 +1,199 @@
+"""
+In-process load generator for ``manage.py loadtest``.
+
+Requests go through Django's real WSGI and ASGI handlers (middleware,
+URL routing, request_started/finished and all), without a server or
+sockets in front:
+
+- WSGI: ``concurrency`` threads each call the WSGI application in a loop,
+  like a threaded WSGI server (e.g. gunicorn's gthread worker).
+- ASGI: ``concurrency`` coroutines share one event loop and call the ASGI
+  application, like a single uvicorn worker.
+
+Both report requests/second, latency percentiles and the number of
+database connections opened, so the sync and async endpoints (and
+connection settings) can be compared on the same machine and database.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def summarize(latencies, elapsed, statuses, connections_opened=0):
+    """req/s, p50/p90/p99 latency (ms), status counts and connections opened for one run."""
+    latencies = np.array(latencies) * 1000
+    codes, counts = np.unique(np.array(statuses), return_counts=True)
+    return {
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p90_ms': round(float(np.percentile(latencies, 90)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'statuses': {int(code): int(count) for code, count in zip(codes, counts)},
+        'connections_opened': connections_opened,
+    }
+
+
+class ConnectionCounter:
+    """Counts the database connections opened, from any thread, while in a ``with`` block."""
+
+    def __init__(self):
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        connection_created.connect(self.count)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.count)
+
+    def count(self, sender, connection, **kwargs):
+        with self._lock:
+            self.opened += 1
+
+
+def _environ(url, headers, host):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': host,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def run_wsgi(urls, requests, concurrency, headers=None, host='localhost', before_request=None):
+    """Issue ``requests`` GETs, cycling through ``urls``, from ``concurrency`` threads."""
+    application = get_wsgi_application()
+    headers = headers or {}
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies, statuses = [], []
+
+    def worker():
+        try:
+            serve()
+        finally:
+            connections.close_all()  # connections kept open between requests end with the thread
+
+    def serve():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            if before_request is not None:
+                before_request()
+            status = []
+            started = time.perf_counter()
+            result = application(
+                _environ(urls[index % len(urls)], headers, host),
+                lambda code, response_headers, exc_info=None: status.append(int(code.split()[0])),
+            )
+            try:
+                for _ in result:
+                    pass
+            finally:
+                result.close()  # fires request_finished, which releases the thread's connection
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status[0])
+
+    with ConnectionCounter() as connections_opened:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, statuses, connections_opened.opened)
+
+
+async def _asgi_request(application, url, headers, host):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', host.encode())] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': (host, 80),
+    }
+    finished = asyncio.Event()
+    sent_request = False
+    status = []
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def run_asgi(urls, requests, concurrency, headers=None, host='localhost', before_request=None):
+    """Issue ``requests`` GETs, cycling through ``urls``, from ``concurrency`` coroutines."""
+    application = get_asgi_application()
+    headers = headers or {}
+    latencies, statuses = [], []
+
+    async def main():
+        counter = iter(range(requests))
+
+        async def worker():
+            for index in counter:
+                if before_request is not None:
+                    before_request()
+                started = time.perf_counter()
+                statuses.append(await _asgi_request(application, urls[index % len(urls)], headers, host))
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    with ConnectionCounter() as connections_opened:
+        started = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, statuses, connections_opened.opened)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pos.archive import add_months, archive_months
+
+
+class Command(BaseCommand):
+    help = 'Move closed months of sales out of the live sales tables, into the archive tables or NDJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months', type=int, default=settings.POS_ARCHIVE_KEEP_MONTHS,
+            help='Complete months to keep live before the current one',
+        )
+        parser.add_argument(
+            '--to', choices=['table', 'file'], default='table',
+            help='Archive to the (on PostgreSQL, partitioned) archive tables or to gzipped NDJSON files',
+        )
+        parser.add_argument('--directory', default=settings.POS_ARCHIVE_DIR, help='Where --to file writes')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Sales moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 0:
+            raise CommandError('--keep-months must not be negative')
+        before = add_months(timezone.localdate(), -options['keep_months'])
+        try:
+            archived = archive_months(
+                before, storage=options['to'], directory=options['directory'],
+                chunk_size=options['chunk_size'], stdout=self.stdout,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully archived {sum(archived.values())} sales from {len(archived)} months!'
+        ))
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.checkout import backfill_sale_totals
+from pos.models import Sale
+
+
+class Command(BaseCommand):
+    help = 'Fill in the line, unit, cost and margin totals of sales recorded before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='Only backfill sales of this username')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Sales updated per transaction')
+        parser.add_argument('--all', action='store_true', help='Recompute every sale, not only those never computed')
+        parser.add_argument(
+            '--assume-current-cost', action='store_true',
+            help="Give lines sold without a recorded cost their product's current cost price",
+        )
+
+    def handle(self, *args, **options):
+        sales = Sale.objects.all() if options['all'] else Sale.objects.filter(line_count=0)
+        if options['owner']:
+            try:
+                sales = sales.filter(owner=get_user_model().objects.get(username=options['owner']))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['owner']!r}")
+
+        updated = backfill_sale_totals(
+            sales, chunk_size=options['chunk_size'], assume_current_cost=options['assume_current_cost'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled {updated} sales!'))
@@ -0,0 +1,52 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.bench import CASES, compare, run
+
+
+class Command(BaseCommand):
+    help = 'Time the key POS endpoints for one owner and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='load-0', help='Username to benchmark as (default: load-0)')
+        parser.add_argument('--case', choices=CASES, action='append', help='Case(s) to run (default: all)')
+        parser.add_argument('--iterations', type=int, default=200, help='Measured requests per case and mode')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests before each run')
+        parser.add_argument('--host', default='localhost', help='Host header (must be in ALLOWED_HOSTS)')
+        parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+        parser.add_argument('--compare', metavar='BASELINE', help='Print p50 changes against an earlier report')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}; create one with generate_load_data")
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('--iterations must be at least 1 and --warmup not negative')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Can't read {options['compare']}: {exc}")
+
+        report = run(
+            user, cases=options['case'], iterations=options['iterations'], warmup=options['warmup'],
+            host=options['host'], stdout=self.stderr if not options['output'] else self.stdout,
+        )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline is not None:
+            out = self.stdout if options['output'] else self.stderr
+            out.write(f"p50 against {baseline.get('commit') or options['compare']}:")
+            for case, mode, before, after, change in compare(baseline, report):
+                delta = f'{change:+.1%}' if change is not None else 'n/a'
+                out.write(f"  {case:16} {mode:5} {before:8.2f}ms -> {after:8.2f}ms  {delta}")
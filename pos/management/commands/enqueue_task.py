@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import tasks
+
+
+class Command(BaseCommand):
+    help = 'Queue a registered background task, e.g. from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Task name, e.g. pos.ledger.take_snapshots')
+        parser.add_argument('--kwargs', default='{}', help='Keyword arguments as a JSON object')
+
+    def handle(self, *args, **options):
+        try:
+            kwargs = json.loads(options['kwargs'])
+        except ValueError as exc:
+            raise CommandError(f'--kwargs is not valid JSON: {exc}')
+        if not isinstance(kwargs, dict):
+            raise CommandError('--kwargs must be a JSON object')
+        try:
+            queued = tasks.enqueue(options['name'], kwargs=kwargs)
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        if queued is None:
+            self.stdout.write(self.style.SUCCESS(f"Ran {options['name']} (eager backend)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Queued {options['name']} as task {queued.pk}."))
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.loadgen import generate
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create owners, products and sales with realistic distributions for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=1, help='Owners to create')
+        parser.add_argument('--products', type=int, default=1000, help='Products per owner')
+        parser.add_argument('--sales', type=int, default=10000, help='Sales per owner')
+        parser.add_argument('--days', type=int, default=90, help='Days of sales history, up to today')
+        parser.add_argument('--items-per-sale', type=float, default=2.5, help='Mean lines per sale')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of product popularity')
+        parser.add_argument('--prefix', default='load', help='Owners are named <prefix>-0, <prefix>-1, ...')
+        parser.add_argument('--password', default='password123', help='Password of the created owners')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        if min(options['owners'], options['products'], options['days'], options['chunk_size']) < 1:
+            raise CommandError('--owners, --products, --days and --chunk-size must be at least 1')
+        if options['sales'] < 0 or options['items_per_sale'] < 1:
+            raise CommandError('--sales must not be negative and --items-per-sale must be at least 1')
+        if get_user_model().objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users named {options['prefix']}-* already exist; choose another --prefix")
+
+        counts = generate(
+            options['owners'], options['products'], options['sales'], days=options['days'],
+            prefix=options['prefix'], password=options['password'], seed=options['seed'],
+            items_per_sale=options['items_per_sale'], zipf_s=options['zipf'],
+            chunk_size=options['chunk_size'], stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully created {counts['owners']} owners, {counts['products']} products, "
+            f"{counts['sales']} sales and {counts['sale_items']} sale items!"
+        ))
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.imports import DEFAULT_CHUNK_SIZE, FORMATS, detect_format, import_products, iter_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import (upsert by barcode) products from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file to import')
+        parser.add_argument('--owner', required=True, help='Username that will own the products')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows upserted per statement')
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}")
+
+        fmt = options['format'] or detect_format(options['path'])
+        with open(options['path'], 'rb') as stream:
+            report = import_products(owner, iter_rows(stream, fmt), chunk_size=options['chunk_size'])
+
+        for error in report.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {report.processed} rows: {report.created} created, "
+            f"{report.updated} updated, {len(report.errors)} failed."
+        ))
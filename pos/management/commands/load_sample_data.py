@@ -1,11 +1,20 @@
-from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
 from pos.models import Product
 from decimal import Decimal
 
 class Command(BaseCommand):
-    help = 'Load sample data for testing'
+    help = 'Load sample data for testing (see generate_load_data for large datasets)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', required=True, help='Username to load the sample products for')
 
     def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}")
+
         sample_products = [
             {
                 'name': 'Coca Cola 500ml',
@@ -89,13 +98,14 @@ class Command(BaseCommand):
             }
         ]
         
-        # Clear existing products
-        Product.objects.all().delete()
+        # Clear the owner's existing products
+        Product.objects.filter(owner=owner).delete()
         self.stdout.write("Cleared existing products")
         
-        # Create new products
+        # Create new products; barcodes are unique across owners
         for product_data in sample_products:
-            product = Product.objects.create(**product_data)
+            product_data['barcode'] = f"{owner.pk}-{product_data['barcode']}"
+            product = Product.objects.create(owner=owner, **product_data)
             self.stdout.write(f"Created: {product.name} - ₹{product.price}")
         
         self.stdout.write(
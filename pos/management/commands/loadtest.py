@@ -0,0 +1,70 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from pos.cache import read_cache
+from pos.loadtest import run_asgi, run_wsgi
+
+ENDPOINTS = [
+    '/api/products/search/?q=tea',
+    '/api/products/low_stock/',
+    '/api/sales/dashboard_stats/',
+    '/api/sales/today_sales/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/second and latency of the sync and async read endpoints under WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='*',
+            help='Paths to load (default: the search, low_stock, dashboard_stats and '
+                 'today_sales endpoints, sync and /api/async/ versions)',
+        )
+        parser.add_argument('--user', required=True, help='Username to make the requests as')
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], action='append',
+                            help='Handler(s) to drive (default: both)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per URL and handler')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--host', default='localhost', help='Host header (must be in ALLOWED_HOSTS)')
+        parser.add_argument('--bust-cache', action='store_true',
+                            help="Invalidate the user's cached reads before every request")
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {'Authorization': f'Token {token.key}'}
+        urls = options['urls'] or [
+            path for url in ENDPOINTS for path in (url, url.replace('/api/', '/api/async/', 1))
+        ]
+        before_request = None
+        if options['bust_cache']:
+            before_request = lambda: read_cache.bump(user.pk, 'products', 'sales')  # noqa: E731
+
+        results = []
+        for interface in options['interface'] or ['wsgi', 'asgi']:
+            run = run_wsgi if interface == 'wsgi' else run_asgi
+            for url in urls:
+                summary = run(
+                    [url], options['requests'], options['concurrency'],
+                    headers=headers, host=options['host'], before_request=before_request,
+                )
+                results.append({'interface': interface, 'url': url, **summary})
+                if not options['json']:
+                    self.stdout.write(
+                        f"{interface:4}  {url:45}  {summary['requests_per_second']:8.1f} req/s  "
+                        f"p50 {summary['p50_ms']:7.2f}ms  p99 {summary['p99_ms']:7.2f}ms  "
+                        f"{summary['connections_opened']:4} connections  statuses {summary['statuses']}"
+                    )
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup table from existing sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='Only rebuild rollups for this username')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Sales aggregated per query')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            try:
+                owner = get_user_model().objects.get(username=options['owner'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['owner']!r}")
+
+        written = rebuild_rollups(owner=owner, chunk_size=options['chunk_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {written} daily rollup rows!'))
@@ -0,0 +1,82 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# pos.tasks is imported inside the functions below: spawned worker processes
+# import this module before Django is set up.
+
+
+def _worker(stop, options):
+    import django
+
+    django.setup()
+    # Ctrl-C reaches the whole process group; let the parent stop us between tasks.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from pos import tasks
+
+    tasks.work(burst=options['burst'], poll_interval=options['poll_interval'], lease=options['lease'], stop=stop)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (see pos/tasks.py) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when nothing is due')
+        parser.add_argument(
+            '--lease', type=int, default=settings.POS_TASK_LEASE_SECONDS,
+            help='Seconds a task may run before another worker may take it over',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        from pos import tasks
+
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        if options['concurrency'] == 1:
+            stop = threading.Event()
+            previous = self._stop_on_signals(stop)
+            try:
+                succeeded, failed = tasks.work(
+                    burst=options['burst'], poll_interval=options['poll_interval'], lease=options['lease'],
+                    stop=stop, stdout=self.stdout if options['verbosity'] > 1 else None,
+                )
+            finally:
+                for signum, handler in previous.items():
+                    signal.signal(signum, handler)
+            self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} task(s); {failed} failed.'))
+            return
+
+        # Spawned rather than forked, so it also works where fork isn't available.
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        worker_options = {key: options[key] for key in ('burst', 'poll_interval', 'lease')}
+        processes = [
+            context.Process(target=_worker, args=(stop, worker_options), name=f'pos-worker-{number}')
+            for number in range(options['concurrency'])
+        ]
+        for process in processes:
+            process.start()
+        self._stop_on_signals(stop)
+        self.stdout.write(f"Started {len(processes)} workers.")
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
+
+    @staticmethod
+    def _stop_on_signals(stop):
+        """
+        Finish the task in hand, then exit, on Ctrl-C or SIGTERM. Returns the
+        handlers it replaced.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        return {
+            signum: signal.signal(signum, lambda *_: stop.set())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pos.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the stock of every product that moved since its last snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products snapshotted per transaction')
+
+    def handle(self, *args, **options):
+        written = take_snapshots(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully wrote {written} stock snapshots!'))
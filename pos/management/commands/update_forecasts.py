@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.forecasting import HISTORY_DAYS, update_forecasts
+from pos.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Fold the days since the last run into every product\'s demand forecast and reorder point'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='Only forecast products of this username')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Products forecast per transaction')
+        parser.add_argument(
+            '--history-days', type=int, default=HISTORY_DAYS,
+            help='Days of sales history to start new forecasts from',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['owner']:
+            try:
+                products = products.filter(owner=get_user_model().objects.get(username=options['owner']))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['owner']!r}")
+
+        updated = update_forecasts(
+            products, history_days=options['history_days'], chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated {updated} forecasts!'))
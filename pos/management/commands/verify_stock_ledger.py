@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.ledger import verify_ledger
+from pos.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Check that every product\'s stock ledger adds up to its stock_quantity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='Only check products of this username')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products checked per query')
+        parser.add_argument('--fix', action='store_true', help='Record adjustments that reconcile mismatches')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['owner']:
+            try:
+                products = products.filter(owner=get_user_model().objects.get(username=options['owner']))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['owner']!r}")
+
+        mismatches = verify_ledger(products, chunk_size=options['chunk_size'], fix=options['fix'], stdout=self.stdout)
+        for mismatch in mismatches:
+            self.stdout.write(
+                f"Product {mismatch['product_id']}: stock_quantity {mismatch['stock_quantity']}, "
+                f"ledger {mismatch['ledger']}"
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Stock ledger matches every product.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {len(mismatches)} product(s).'))
+        else:
+            raise CommandError(f'{len(mismatches)} product(s) do not match their ledger; rerun with --fix to reconcile.')
@@ -0,0 +1,234 @@
+"""
+Request metrics.
+
+`RequestMetricsMiddleware` (pos/middleware.py) gives every request a
+`RequestProfile` in a context variable. A database ``execute_wrapper``,
+installed on each connection as it is opened, adds every query's duration
+to the current profile; the context variable follows the request into the
+threads ``sync_to_async`` runs queries in, so async views are measured too.
+Identical SQL (placeholders, not values) run more than once in a request
+is counted as duplicates, the signature of an N+1 loop. `timed` measures
+serialization, minus any queries run inside it.
+
+When the request finishes its numbers go into the in-process histograms
+of `registry`, labelled by view (``SaleViewSet.today_sales``) and method,
+which ``/api/metrics/`` renders in the Prometheus text format. Each worker
+process keeps its own histograms. With ``POS_SLOW_REQUEST_MS`` set, slower
+requests are logged to ``pos.slow_requests`` with their SQL.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_profile = contextvars.ContextVar('pos_request_profile', default=None)
+
+
+class RequestProfile:
+    """Database and serializer time spent on one request so far."""
+
+    def __init__(self, capture_sql=False, max_captured=50):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter()
+        self.captured = [] if capture_sql else None
+        self.max_captured = max_captured
+
+    @property
+    def duplicate_queries(self):
+        """Executions of SQL this request had already run."""
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements[sql] += 1
+        if self.captured is not None and len(self.captured) < self.max_captured:
+            # The SQL text only: parameters can hold credentials (token keys) and customer data.
+            self.captured.append((duration, sql))
+
+
+def current_profile():
+    return _profile.get()
+
+
+def start_profile(capture_sql=False):
+    """Begin profiling the current request; returns a token for `end_profile`."""
+    return _profile.set(RequestProfile(capture_sql=capture_sql))
+
+
+def end_profile(token):
+    profile = _profile.get()
+    _profile.reset(token)
+    return profile
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Database ``execute_wrapper`` adding each query to the current profile."""
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, time.perf_counter() - started)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """``connection_created`` receiver: wrap every query on the new connection."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def timed(section='serializer'):
+    """Add the time spent in the block, less its queries, to the profile's ``section`` time."""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    db_before = profile.db_time
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (profile.db_time - db_before)
+        setattr(profile, f'{section}_time', getattr(profile, f'{section}_time') + max(elapsed, 0.0))
+
+
+class Histogram:
+    """A labelled Prometheus histogram: cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self, label_values):
+        """``(count, sum)`` observed for ``label_values``, or None."""
+        series = self._series.get(tuple(label_values))
+        return None if series is None else (series[2], series[1])
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for label_values, (counts, total, count) in series:
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {_number(total)}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class CounterMetric:
+    """A labelled Prometheus counter."""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{{{_labels(self.labels, labels)}}} {_number(value)}' for labels, value in values)
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """The request metrics of this process."""
+
+    def __init__(self):
+        labels = ('view', 'method')
+        self.requests = CounterMetric('pos_requests_total', 'Requests handled.', labels + ('status',))
+        self.duration = Histogram(
+            'pos_request_duration_seconds', 'Wall time of requests.', labels, DURATION_BUCKETS)
+        self.db_time = Histogram(
+            'pos_request_db_seconds', 'Time spent in SQL queries per request.', labels, DURATION_BUCKETS)
+        self.serializer_time = Histogram(
+            'pos_request_serializer_seconds', 'Time spent serializing per request, excluding queries.',
+            labels, DURATION_BUCKETS)
+        self.queries = Histogram(
+            'pos_request_queries', 'SQL queries per request.', labels, QUERY_BUCKETS)
+        self.duplicate_queries = CounterMetric(
+            'pos_request_duplicate_queries_total',
+            'Queries repeating SQL already run in the same request (N+1 patterns).', labels)
+        self.metrics = [
+            self.requests, self.duration, self.db_time, self.serializer_time, self.queries, self.duplicate_queries,
+        ]
+
+    def observe(self, view, method, status, duration, profile):
+        labels = (view, method)
+        self.requests.inc(1, view, method, str(status))
+        self.duration.observe(duration, *labels)
+        self.db_time.observe(profile.db_time, *labels)
+        self.serializer_time.observe(profile.serializer_time, *labels)
+        self.queries.observe(profile.queries, *labels)
+        duplicates = profile.duplicate_queries
+        if duplicates:
+            self.duplicate_queries.inc(duplicates, *labels)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.__init__()
+
+
+registry = Registry()
+
+
+def enabled():
+    return getattr(settings, 'POS_METRICS_ENABLED', True)
@@ -0,0 +1,93 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+slow_request_logger = logging.getLogger('pos.slow_requests')
+
+
+def view_label(request):
+    """
+    The metrics label for the view that handled ``request``: the viewset
+    and action for DRF views (``SaleViewSet.today_sales``), else the view
+    function's dotted path.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is not None:
+        actions = getattr(match.func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        return f'{view_class.__name__}.{action}' if action else view_class.__name__
+    return match._func_path
+
+
+class RequestMetricsMiddleware:
+    """
+    Profile each request (see pos/metrics.py) and record it in the metrics
+    registry, logging it with its SQL when slower than ``POS_SLOW_REQUEST_MS``.
+    Put it first in MIDDLEWARE so the wall time covers the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not metrics.enabled():
+            return self.get_response(request)
+        token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile = metrics.end_profile(token)
+        self.finish(request, response, profile, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics.enabled():
+            return await self.get_response(request)
+        token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile = metrics.end_profile(token)
+        self.finish(request, response, profile, time.perf_counter() - started)
+        return response
+
+    def start(self):
+        token = metrics.start_profile(capture_sql=bool(settings.POS_SLOW_REQUEST_MS))
+        return token, time.perf_counter()
+
+    def finish(self, request, response, profile, duration):
+        view = view_label(request)
+        metrics.registry.observe(view, request.method, response.status_code, duration, profile)
+        threshold = settings.POS_SLOW_REQUEST_MS
+        if threshold and duration * 1000 >= threshold:
+            log_slow_request(request, response, view, duration, profile)
+
+
+def log_slow_request(request, response, view, duration, profile):
+    lines = [
+        f'Slow request: {request.method} {request.get_full_path()} -> {response.status_code} ({view}) '
+        f'in {duration * 1000:.1f}ms: {profile.queries} queries in {profile.db_time * 1000:.1f}ms '
+        f'({profile.duplicate_queries} duplicate), serializer {profile.serializer_time * 1000:.1f}ms'
+    ]
+    for query_time, sql in profile.captured:
+        lines.append(f'  {query_time * 1000:7.2f}ms  {sql}')
+    if profile.queries > len(profile.captured):
+        lines.append(f'  ... {profile.queries - len(profile.captured)} more queries not captured')
+    repeated = [(count, sql) for sql, count in profile.statements.most_common() if count > 1]
+    for count, sql in repeated[:5]:
+        lines.append(f'  repeated {count}x: {sql}')
+    slow_request_logger.warning('\n'.join(lines))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:33
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0007_stock_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('velocity', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('through_day', models.DateField()),
+                ('reorder_point', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='pos_product_owner_stock_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_point',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('owner'), django.db.models.expressions.CombinedExpression(models.F('stock_quantity'), '-', models.F('reorder_point')), name='pos_product_owner_reorder_idx'),
+        ),
+        migrations.AddField(
+            model_name='productforecast',
+            name='product',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='pos.product'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_archive_tables(apps, schema_editor):
+    """
+    On PostgreSQL, recreate the (new, empty) archive tables partitioned by
+    range of created_at, with a default partition for anything outside the
+    monthly ones pos.archive creates. The primary key of a partitioned
+    table has to include the partition key.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in ['pos_archivedsale', 'pos_archivedsaleitem']:
+        schema_editor.execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+        schema_editor.execute(
+            f'CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)'
+        )
+        schema_editor.execute(f'DROP TABLE {table}_unpartitioned')
+        schema_editor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)')
+        schema_editor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0010_sale_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('storage', models.CharField(choices=[('table', 'Archive tables'), ('file', 'NDJSON file')], max_length=10)),
+                ('location', models.CharField(blank=True, max_length=500)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSale',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI')], max_length=10)),
+                ('receipt_number', models.CharField(max_length=20)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('unit_count', models.PositiveIntegerField(default=0)),
+                ('cost_total', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('gross_margin', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('owner', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSaleItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pos.product')),
+                ('sale', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='items', to='pos.archivedsale')),
+            ],
+        ),
+        # Before the indexes, so they're created on the partitioned tables.
+        migrations.RunPython(partition_archive_tables, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='archivedsale',
+            index=models.Index(fields=['owner', 'created_at'], name='pos_archsale_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsaleitem',
+            index=models.Index(fields=['sale'], name='pos_architem_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsaleitem',
+            index=models.Index(fields=['product', 'created_at'], name='pos_architem_product_time_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0011_sales_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'id'], name='pos_movement_product_id_idx'),
+        ),
+    ]
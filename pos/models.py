@@ -1,15 +1,22 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
 from decimal import Decimal
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
 class Product(models.Model):
-    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Indexed through the composite (owner, ...) indexes below.
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # What a unit costs the owner; None if unknown. Copied onto each sale line.
+    cost_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     stock_quantity = models.IntegerField(default=0)
+    # Low stock below this level; maintained by the demand forecasts (pos/forecasting.py).
+    reorder_point = models.IntegerField(default=10)
     barcode = models.CharField(max_length=50, unique=True, blank=True, null=True)
     category = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,6 +24,13 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['owner', 'name'], name='pos_product_owner_name_idx'),
+            # Serves low stock lookups, which compare the two columns.
+            models.Index(
+                F('owner'), F('stock_quantity') - F('reorder_point'), name='pos_product_owner_reorder_idx',
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.barcode:
@@ -39,29 +53,259 @@ class Sale(models.Model):
     
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS)
-    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     receipt_number = models.CharField(max_length=20, unique=True)
+    # Client-generated key so a till can safely replay a sale after a network failure.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # Totals over the items, written with the sale so reads don't aggregate SaleItem
+    # (backfilled by `manage.py backfill_sale_totals`). The cost and margin are
+    # None unless every line's cost is known.
+    line_count = models.PositiveIntegerField(default=0)
+    unit_count = models.PositiveIntegerField(default=0)
+    cost_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    gross_margin = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='pos_sale_owner_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'idempotency_key'], name='unique_sale_idempotency_key'),
+        ]
     
     def __str__(self):
         return f"Sale #{self.receipt_number} - ₹{self.total_amount}"
 
 class SaleItem(models.Model):
-    sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
+    sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE, db_index=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The product's cost_price when sold.
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['sale', 'product'], name='pos_saleitem_sale_product_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if self.unit_price is None:
             self.unit_price = self.product.price
+            if self.unit_cost is None:
+                self.unit_cost = self.product.cost_price
         self.total_price = self.quantity * self.unit_price
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
+
+
+class ArchivedSale(models.Model):
+    """
+    A sale moved out of `Sale` by ``manage.py archive_sales``, keeping its
+    id and totals. No constraints reference or are enforced on the archive
+    tables, so on PostgreSQL they are partitioned by month of ``created_at``
+    (see pos/archive.py).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, db_index=False, db_constraint=False,
+    )
+    created_at = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_METHODS)
+    receipt_number = models.CharField(max_length=20)
+    line_count = models.PositiveIntegerField(default=0)
+    unit_count = models.PositiveIntegerField(default=0)
+    cost_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    gross_margin = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', 'created_at'], name='pos_archsale_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived sale #{self.receipt_number} - ₹{self.total_amount}"
+
+
+class ArchivedSaleItem(models.Model):
+    """A line of an `ArchivedSale`, with the sale's ``created_at`` to partition on."""
+    id = models.BigIntegerField(primary_key=True)
+    sale = models.ForeignKey(
+        ArchivedSale, related_name='items', on_delete=models.DO_NOTHING, db_index=False, db_constraint=False,
+    )
+    product = models.ForeignKey(
+        Product, related_name='+', on_delete=models.DO_NOTHING, db_index=False, db_constraint=False,
+    )
+    created_at = models.DateTimeField()
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sale'], name='pos_architem_sale_idx'),
+            models.Index(fields=['product', 'created_at'], name='pos_architem_product_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity}"
+
+
+class ArchivedPeriod(models.Model):
+    """
+    A local calendar month whose sales were moved out of `Sale`: into the
+    archive tables, or into a gzipped NDJSON file at ``location``. Reads
+    look here to decide whether a date range needs the archive tables.
+    """
+    STORAGE_CHOICES = [
+        ('table', 'Archive tables'),
+        ('file', 'NDJSON file'),
+    ]
+
+    month = models.DateField(unique=True)  # the first day
+    storage = models.CharField(max_length=10, choices=STORAGE_CHOICES)
+    location = models.CharField(max_length=500, blank=True)
+    sale_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.sale_count} sales ({self.storage})"
+
+
+class DailySalesRollup(models.Model):
+    """
+    Per-owner, per-day, per-payment-method sales totals, kept up to date in
+    the same transaction as the sale so dashboards never scan `Sale`.
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_METHODS)
+    sale_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+
+    class Meta:
+        ordering = ['-day', 'payment_method']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day', 'payment_method'], name='unique_daily_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_method}: {self.sale_count} sales, ₹{self.revenue}"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of stock changes. ``quantity`` is the signed change
+    (negative for sales), so a product's stock is the sum of its movements.
+    Written in the same transaction as the change it records.
+    """
+    KINDS = [
+        ('opening', 'Opening balance'),
+        ('sale', 'Sale'),
+        ('restock', 'Restock'),
+        ('adjustment', 'Adjustment'),
+        ('return', 'Return'),
+    ]
+
+    # Indexed through the (product, created_at) index below.
+    product = models.ForeignKey(Product, related_name='movements', on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    quantity = models.IntegerField()
+    sale = models.ForeignKey(Sale, related_name='stock_movements', on_delete=models.SET_NULL, null=True, blank=True)
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='pos_movement_product_time_idx'),
+            # Serves "movements since a snapshot", which are bounded by id.
+            models.Index(fields=['product', 'id'], name='pos_movement_product_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} {self.quantity:+d} ({self.kind})"
+
+
+class StockSnapshot(models.Model):
+    """
+    A product's stock at ``taken_at``, including every movement up to
+    ``last_movement_id``. Stock at any time is the nearest earlier snapshot
+    plus the few movements after it.
+    """
+    product = models.ForeignKey(Product, related_name='snapshots', on_delete=models.CASCADE, db_index=False)
+    quantity = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['product', 'taken_at'], name='pos_snapshot_product_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.quantity} at {self.taken_at}"
+
+
+class ProductForecast(models.Model):
+    """
+    Exponentially smoothed daily demand for a product, folded in up to and
+    including ``through_day``. Updating it only needs the days after that.
+    """
+    product = models.OneToOneField(Product, related_name='forecast', on_delete=models.CASCADE)
+    velocity = models.FloatField(default=0)  # units per day
+    variance = models.FloatField(default=0)
+    through_day = models.DateField()
+    reorder_point = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def days_of_cover(self, stock):
+        """Days ``stock`` lasts at the current velocity (None if nothing sells)."""
+        return round(stock / self.velocity, 1) if self.velocity > 0 else None
+
+    def __str__(self):
+        return f"{self.product.name}: {self.velocity:.2f}/day through {self.through_day}"
+
+
+class Task(models.Model):
+    """
+    Deferred work queued by `pos.tasks.enqueue`. Rows are deleted once the
+    task succeeds; ``run_at`` is when it is next due, or when a running
+    worker's lease on it expires.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='pos_task_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
@@ -0,0 +1,36 @@
+"""
+Keyset (cursor) pagination for the owner-scoped list endpoints.
+
+Page-number pagination runs a COUNT(*) over all of the owner's rows and an
+OFFSET scan that grows with the page number. DRF's cursor holds only the
+value of the first ordering field at the end of the page, plus how many
+rows there share it. The next page is an indexed range read on that field
+(``WHERE created_at < <position> ORDER BY ... LIMIT n OFFSET <ties>``), so
+the OFFSET only skips rows tied with the last one seen, not earlier pages.
+The trailing ``id`` in each ordering never reaches the WHERE clause; it
+keeps tied rows in the same order on every request, so that OFFSET skips
+the right ones. Cursors are opaque base64 tokens returned in
+``next``/``previous``.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class OwnerCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class SaleCursorPagination(OwnerCursorPagination):
+    # Served by the (owner, -created_at) index; id orders sales with the same timestamp.
+    ordering = ('-created_at', '-id')
+
+
+class ProductCursorPagination(OwnerCursorPagination):
+    # Served by the (owner, name) index; id orders products with the same name.
+    ordering = ('name', 'id')
+
+
+class MovementCursorPagination(OwnerCursorPagination):
+    # Served by the (product, created_at) index; id orders movements written together.
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,13 @@
+from rest_framework.parsers import BaseParser
+
+
+class RawUploadParser(BaseParser):
+    """
+    Accept an uploaded file sent as the raw request body (e.g. ``curl
+    --data-binary @catalog.csv``) and hand the unread stream to the view
+    as ``request.data['file']``, so it can be consumed incrementally.
+    """
+    media_type = '*/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return {'file': stream, 'content_type': media_type or ''}
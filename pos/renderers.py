@@ -0,0 +1,85 @@
+"""
+Renderers for the POS endpoints.
+
+The exports themselves are StreamingHttpResponses, which DRF passes through
+without rendering; `CSVRenderer` and `JSONLinesRenderer` let content
+negotiation accept ``?format=csv`` / ``?format=jsonl`` / ``?format=ndjson`` and render the small
+non-streamed responses (errors) in the requested format.
+
+`FastJSONRenderer` is the JSON renderer used in fast serialization mode.
+"""
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional: FastJSONRenderer falls back to the stdlib encoder
+    orjson = None
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class JSONLinesRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode(self.charset)
+
+
+class NDJSONRenderer(JSONLinesRenderer):
+    """The same JSON Lines output, negotiated with ``?format=ndjson``."""
+    format = 'ndjson'
+
+
+def _refuse(value):
+    raise TypeError
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, when installed, for compact
+    output. orjson writes strings, ints, bools, lists and dicts exactly as
+    DRF's compact encoder does. Types it would format differently
+    (datetimes, Decimals and other objects DRF's encoder converts) are
+    refused, and the payload goes through JSONRenderer instead. The fast
+    serializers never emit floats, whose exponent notation differs.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=_refuse,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict-javascript-subset escaping as JSONRenderer.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,117 @@
+"""
+Maintenance of the `DailySalesRollup` table.
+
+`record_sale` is called (through the Sale signals) inside the transaction
+that creates or deletes the sale. It queues the change as an
+`apply_to_rollup` task, so with a queueing task backend the checkout
+doesn't wait on (or hold a lock on) the busy rollup row; the task carries
+the amounts, so additions and removals can apply in any order.
+`rebuild_rollups` recomputes the table from the live and archived sales; let
+the workers drain the queue first, or queued changes are counted twice.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import archive
+from .cache import read_cache
+from .models import ArchivedPeriod, ArchivedSale, DailySalesRollup, Sale
+from .tasks import task
+
+
+def add_to_rollup(owner_id, day, payment_method, sale_count, revenue):
+    """Atomically add ``sale_count`` sales worth ``revenue`` to one rollup row."""
+    rollup = DailySalesRollup.objects.filter(owner_id=owner_id, day=day, payment_method=payment_method)
+    changes = {'sale_count': F('sale_count') + sale_count, 'revenue': F('revenue') + revenue}
+    if rollup.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(
+                owner_id=owner_id, day=day, payment_method=payment_method,
+                sale_count=sale_count, revenue=revenue,
+            )
+    except IntegrityError:
+        # Another checkout created the row first.
+        rollup.update(**changes)
+
+
+@task
+def apply_to_rollup(owner_id, day, payment_method, sale_count, revenue):
+    """`add_to_rollup` with JSON arguments (``day`` ISO, ``revenue`` a decimal string)."""
+    add_to_rollup(owner_id, date.fromisoformat(day), payment_method, sale_count, Decimal(revenue))
+    read_cache.bump_on_commit(owner_id, 'sales')
+
+
+def queue_rollup(owner_id, day, payment_method, sale_count, revenue):
+    """Queue adding ``sale_count`` sales worth ``revenue`` to one rollup row."""
+    apply_to_rollup.enqueue(owner_id, day.isoformat(), payment_method, sale_count, str(revenue))
+
+
+def record_sale(sale, sign=1):
+    """Add (or with ``sign=-1`` remove) one sale to its owner's rollup."""
+    if sale.owner_id is None:
+        return
+    queue_rollup(
+        sale.owner_id,
+        timezone.localdate(sale.created_at),
+        sale.payment_method,
+        sign,
+        sign * Decimal(sale.total_amount),
+    )
+
+
+def rebuild_rollups(owner=None, chunk_size=10000, stdout=None):
+    """
+    Recompute rollups from `Sale` and the archived sales, aggregating
+    ``chunk_size`` sales per query so the scan never holds the whole
+    history at once. Days of months archived to files can't be recomputed,
+    so their rows are kept. Returns the number of rollup rows written.
+    """
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for sales in [ArchivedSale.objects.all(), Sale.objects.all()]:
+        sales = sales.filter(owner__isnull=False)
+        if owner is not None:
+            sales = sales.filter(owner=owner)
+        last_id = 0
+        while True:
+            chunk_ids = list(
+                sales.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not chunk_ids:
+                break
+            rows = (
+                sales.filter(pk__gt=last_id, pk__lte=chunk_ids[-1])
+                .annotate(day=TruncDate('created_at'))
+                .values('owner_id', 'day', 'payment_method')
+                .annotate(sale_count=Count('id'), revenue=Sum('total_amount'))
+                .order_by()
+            )
+            for row in rows:
+                entry = totals[(row['owner_id'], row['day'], row['payment_method'])]
+                entry[0] += row['sale_count']
+                entry[1] += row['revenue']
+            last_id = chunk_ids[-1]
+            if stdout is not None:
+                stdout.write(f"Aggregated {sales.model._meta.verbose_name_plural} up to id {last_id}")
+
+    offline = set(ArchivedPeriod.objects.filter(storage='file').values_list('month', flat=True))
+    rollups = [
+        DailySalesRollup(owner_id=owner_id, day=day, payment_method=method, sale_count=count, revenue=revenue)
+        for (owner_id, day, method), (count, revenue) in totals.items()
+        if archive.month_start(day) not in offline
+    ]
+    existing = DailySalesRollup.objects.all()
+    for month in offline:
+        existing = existing.exclude(day__gte=month, day__lt=archive.next_month(month))
+    if owner is not None:
+        existing = existing.filter(owner=owner)
+    with transaction.atomic():
+        existing.delete()
+        DailySalesRollup.objects.bulk_create(rollups, batch_size=chunk_size)
+    return len(rollups)
@@ -0,0 +1,158 @@
+"""
+Product search for the POS catalog.
+
+Lookups go through, in order:
+
+1. an exact barcode match on the unique barcode index, for scanner input;
+2. an indexed text match on name and category, ranked by relevance:
+   - PostgreSQL: ``pg_trgm`` GIN indexes serve the substring match and
+     ``TrigramSimilarity`` ranks it;
+   - SQLite: an FTS5 trigram table (kept in sync by triggers) serves the
+     match and ``bm25`` ranks it;
+   - anything else: a plain ``icontains`` scan ranked in Python;
+3. a name prefix match for queries too short to have a trigram.
+
+Name-prefix matches always rank first. Results are limited and paged with
+``limit``/``offset``.
+"""
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Product
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MIN_TRIGRAM_LENGTH = 3
+
+FTS_TABLE = 'pos_product_fts'
+
+SQLITE_SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, category, content='pos_product', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, category ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Django's icontains compiles to UPPER(col) LIKE UPPER(%s), so index that expression.
+    "CREATE INDEX IF NOT EXISTS pos_product_name_trgm ON pos_product USING gin (UPPER(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS pos_product_category_trgm ON pos_product USING gin (UPPER(category) gin_trgm_ops)",
+]
+
+
+def install_search_index(sender=None, using='default', **kwargs):
+    """
+    Create the text search index for the database vendor. Connected to
+    post_migrate so it's (re)created after every migrate; SQLite drops the
+    sync triggers whenever a migration rebuilds pos_product.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_a_'],
+            )
+            triggers_intact = cursor.fetchone()[0] == 3
+            for statement in SQLITE_SEARCH_DDL:
+                cursor.execute(statement)
+            if not triggers_intact:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            for statement in POSTGRES_SEARCH_DDL:
+                cursor.execute(statement)
+
+
+def clamp_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT, minimum=1):
+    """Parse a ``limit``-style query parameter, clamped to ``[minimum, maximum]``."""
+    try:
+        return max(minimum, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+def _like_prefix(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def _sqlite_search(owner, query, limit, offset):
+    phrase = '"' + query.replace('"', '""') + '"'
+    return list(Product.objects.raw(
+        f"""
+        SELECT p.* FROM {FTS_TABLE} f
+        JOIN pos_product p ON p.id = f.rowid
+        WHERE {FTS_TABLE} MATCH %s AND p.owner_id = %s
+        ORDER BY (p.name LIKE %s ESCAPE '\\') DESC, bm25({FTS_TABLE}, 10.0, 1.0), p.name, p.id
+        LIMIT %s OFFSET %s
+        """,
+        [phrase, owner.pk, _like_prefix(query), limit, offset],
+    ))
+
+
+def _prefix_rank(products, query):
+    return products.annotate(
+        prefix_match=Case(
+            When(name__istartswith=query, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def _postgres_search(products, query, limit, offset):
+    matches = _prefix_rank(
+        products.filter(Q(name__icontains=query) | Q(category__icontains=query)), query
+    ).annotate(rank=TrigramSimilarity('name', query) + TrigramSimilarity('category', query) / 4)
+    return list(matches.order_by('-prefix_match', '-rank', 'name', 'id')[offset:offset + limit])
+
+
+def _fallback_search(products, query, limit, offset):
+    needle = query.casefold()
+
+    def relevance(product):
+        name = product.name.casefold()
+        return (
+            not name.startswith(needle),
+            needle not in name,
+            len(name),
+            product.name,
+            product.id,
+        )
+
+    matches = products.filter(Q(name__icontains=query) | Q(category__icontains=query))
+    return sorted(matches, key=relevance)[offset:offset + limit]
+
+
+def search_products(owner, query, limit=DEFAULT_LIMIT, offset=0):
+    """Return up to ``limit`` of ``owner``'s products matching ``query``, best first."""
+    products = Product.objects.filter(owner=owner)
+    query = query.strip()
+    if not query:
+        return list(products.order_by('name', 'id')[offset:offset + limit])
+
+    if offset == 0:
+        scanned = products.filter(barcode=query).first()
+        if scanned is not None:
+            return [scanned]
+
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return list(products.filter(name__istartswith=query).order_by('name', 'id')[offset:offset + limit])
+
+    vendor = connections[products.db].vendor
+    if vendor == 'sqlite':
+        return _sqlite_search(owner, query, limit, offset)
+    if vendor == 'postgresql':
+        return _postgres_search(products, query, limit, offset)
+    return _fallback_search(products, query, limit, offset)
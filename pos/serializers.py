@@ -1,7 +1,7 @@
 from rest_framework import serializers
-from .models import Product, Sale, SaleItem
-from decimal import Decimal
-from django.db import transaction
+from .ledger import MANUAL_KINDS
+from .models import Product, Sale, SaleItem, StockMovement
+from .checkout import checkout, checkout_batch, InsufficientStock, ProductsNotFound
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,84 +10,100 @@ class ProductSerializer(serializers.ModelSerializer):
 
         read_only_fields = ['id', 'owner', 'created_at', 'updated_at', 'is_in_stock', 'barcode']
 
+class StockMovementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'kind', 'quantity', 'sale', 'note', 'created_at']
+
+class StockChangeSerializer(serializers.Serializer):
+    """A restock, return or adjustment; ``quantity`` is the signed change in stock."""
+    kind = serializers.ChoiceField(choices=list(MANUAL_KINDS))
+    quantity = serializers.IntegerField()
+    note = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        sign = MANUAL_KINDS[data['kind']]
+        if data['quantity'] == 0 or (sign and data['quantity'] * sign < 0):
+            raise serializers.ValidationError(
+                {'quantity': ["Must be positive." if sign else "Must not be zero."]}
+            )
+        return data
+
 class SaleItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     
     class Meta:
         model = SaleItem
-        fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'total_price']
+        fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'unit_cost', 'total_price']
 
 class SaleSerializer(serializers.ModelSerializer):
     items = SaleItemSerializer(many=True, read_only=True)
     
     class Meta:
         model = Sale
-        fields = ['id', 'total_amount', 'payment_method', 'created_at', 'receipt_number', 'items']
-        read_only_fields = ['receipt_number']
+        fields = [
+            'id', 'total_amount', 'payment_method', 'created_at', 'receipt_number',
+            'line_count', 'unit_count', 'cost_total', 'gross_margin', 'items',
+        ]
+        read_only_fields = fields
 
 class WriteSaleItemSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
 
 class CreateSaleSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    receipt_number = serializers.CharField(read_only=True)
     items = WriteSaleItemSerializer(many=True) 
     payment_method = serializers.ChoiceField(choices=Sale.PAYMENT_METHODS)
     
     def create(self, validated_data):
         # We will get the owner from the view via serializer.save(owner=...)
         owner = validated_data.pop('owner')
-        items_data = validated_data.pop('items')
-        
-        # Use a transaction to ensure all database operations succeed or fail together
-        with transaction.atomic():
-            # --- Efficiently fetch all products at once ---
-            product_ids = [item['product_id'] for item in items_data]
-            products = Product.objects.filter(id__in=product_ids, owner=owner)
-
-            # Check if all requested products were found and belong to the user
-            if len(products) != len(product_ids):
-                raise serializers.ValidationError("One or more products not found or do not belong to you.")
-            
-            product_map = {product.id: product for product in products}
-            total_amount = Decimal('0')
-            sale_items_to_create = []
-
-            for item_data in items_data:
-                product = product_map[item_data['product_id']]
-                quantity = item_data['quantity']
-
-                if product.stock_quantity < quantity:
-                    raise serializers.ValidationError(f"Not enough stock for {product.name}.")
-
-                total_amount += product.price * quantity
-                
-                sale_items_to_create.append(
-                    SaleItem(
-                        product=product,
-                        quantity=quantity,
-                        unit_price=product.price,
-                        total_price=product.price * quantity
-                    )
-                )
-                # Prepare stock update
-                product.stock_quantity -= quantity
-
-            import uuid
-
-            receipt_number = f"RCP{uuid.uuid4().hex[:8].upper()}"
-            sale = Sale.objects.create(
-                owner=owner,
-                total_amount=total_amount,
-                payment_method=validated_data['payment_method'],
-                receipt_number=receipt_number
+        try:
+            return checkout(
+                owner,
+                validated_data['items'],
+                validated_data['payment_method'],
+                idempotency_key=validated_data.get('idempotency_key'),
             )
+        except ProductsNotFound:
+            raise serializers.ValidationError("One or more products not found or do not belong to you.")
+        except InsufficientStock as exc:
+            raise serializers.ValidationError({
+                'detail': "Not enough stock for one or more items.",
+                'failed_items': exc.failures,
+            })
+
 
-            # --- Link SaleItems to the new Sale and create them in bulk ---
-            for item in sale_items_to_create:
-                item.sale = sale
-            SaleItem.objects.bulk_create(sale_items_to_create)
+class BatchSaleEntrySerializer(CreateSaleSerializer):
+    idempotency_key = serializers.CharField(max_length=64)
+
+
+class BatchSaleSerializer(serializers.Serializer):
+    """
+    Many queued sales in one request. Entries are validated one by one so
+    a malformed sale is reported as ``invalid`` instead of failing the batch.
+    """
+    MAX_SALES = 500
+
+    sales = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=MAX_SALES)
+
+    def create(self, validated_data):
+        owner = validated_data.pop('owner')
+        results = []
+        entries = []
+        for raw in validated_data['sales']:
+            entry = BatchSaleEntrySerializer(data=raw)
+            if entry.is_valid():
+                results.append(None)
+                entries.append(entry.validated_data)
+            else:
+                results.append({
+                    'idempotency_key': raw.get('idempotency_key'),
+                    'status': 'invalid',
+                    'errors': entry.errors,
+                })
 
-            # --- Update product stock in bulk ---
-            Product.objects.bulk_update([p for p in product_map.values()], ['stock_quantity'])
-            
-            return sale
\ No newline at end of file
+        ingested = iter(checkout_batch(owner, entries) if entries else [])
+        return [result or next(ingested) for result in results]
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ledger
+from .cache import barcode_cache, read_cache
+from .models import Product, Sale, StockMovement
+from .rollups import record_sale
+
+
+@receiver(post_save, sender=Sale)
+def add_sale_to_rollup(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_sale(instance)
+    read_cache.bump_on_commit(instance.owner_id, 'sales')
+
+
+@receiver(post_delete, sender=Sale)
+def remove_sale_from_rollup(sender, instance, **kwargs):
+    record_sale(instance, sign=-1)
+    read_cache.bump_on_commit(instance.owner_id, 'sales')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: barcode_cache.invalidate_products([product_id]))
+    read_cache.bump_on_commit(instance.owner_id, 'products')
+
+
+@receiver(post_save, sender=Product)
+def record_opening_stock(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.stock_quantity:
+        StockMovement.objects.bulk_create([
+            ledger.record(instance.pk, 'opening', instance.stock_quantity, created_at=instance.created_at)
+        ])
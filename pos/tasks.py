@@ -0,0 +1,210 @@
+"""
+Deferred work, queued in the database.
+
+Functions decorated with `task` can be queued with ``func.enqueue(...)``
+instead of running inside the request. The `Task` row is written in the
+caller's transaction, so the work is queued if and only if the change that
+asked for it commits, and there is no broker to run or lose messages.
+
+``manage.py run_workers`` claims due tasks with a lease and runs each in a
+transaction that also deletes its row. A task's database writes therefore
+apply once: if a worker dies half way its transaction rolls back, and the
+task is claimed again when the lease expires. A task that raises is
+retried with exponential backoff until ``max_attempts``, then kept as
+``failed`` for inspection in the admin. Arguments must be JSON values.
+
+``POS_TASK_BACKEND`` chooses how queued work runs:
+
+- ``eager`` (default): inline, inside the caller's transaction, as if the
+  function had been called directly. Nothing else needs to run.
+- ``database``: queued for ``run_workers``.
+- ``local``: queued, and handed to a thread pool in the enqueuing process
+  once the transaction commits. Tasks a stopped process leaves behind are
+  picked up by ``run_workers``.
+"""
+import json
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Task
+
+BACKENDS = ('eager', 'database', 'local')
+
+_registry = {}
+_local_pool = None
+_local_pool_lock = threading.Lock()
+
+
+class LeaseExpired(Exception):
+    """Raised when a task's lease ran out and another worker claimed it first."""
+
+    def __init__(self, task):
+        self.task = task
+        super().__init__(f"Lease on task {task.pk} ({task.name}) expired before it finished.")
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register ``func`` as a task and give it an ``enqueue(*args, **kwargs)``
+    method. The function itself is returned unchanged otherwise.
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        _registry[task_name] = func
+        func.task_name = task_name
+        func.enqueue = lambda *args, **kwargs: enqueue(task_name, args, kwargs, max_attempts=max_attempts)
+        return func
+
+    return register if func is None else register(func)
+
+
+def enqueue(name, args=(), kwargs=None, delay=0, max_attempts=None):
+    """
+    Queue the task registered as ``name``, due in ``delay`` seconds.
+    Returns the `Task`, or None when the eager backend ran it inline.
+    """
+    if name not in _registry:
+        raise LookupError(f"No task named {name!r} is registered.")
+    # Round-trip through JSON even when eager, so tests catch arguments a worker couldn't receive.
+    payload = json.loads(json.dumps({'args': list(args), 'kwargs': kwargs or {}}))
+    backend = settings.POS_TASK_BACKEND
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(f"POS_TASK_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}.")
+    if backend == 'eager':
+        _registry[name](*payload['args'], **payload['kwargs'])
+        return None
+
+    queued = Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts or settings.POS_TASK_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if backend == 'local':
+        task_id = queued.pk
+        transaction.on_commit(lambda: _local_executor().submit(_run_local, task_id))
+    return queued
+
+
+def backoff(attempt):
+    """Seconds to wait before retrying after failed attempt number ``attempt``, with jitter."""
+    delay = min(settings.POS_TASK_RETRY_MAX_DELAY, settings.POS_TASK_RETRY_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(1, 1.25)
+
+
+def claim(task_id=None, lease=None):
+    """
+    Lease the next due task (or the task ``task_id`` if it is due) to the
+    caller. Returns the `Task`, or None if nothing is due.
+    """
+    lease = settings.POS_TASK_LEASE_SECONDS if lease is None else lease
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            # Running tasks are due again once their lease has expired.
+            due = Task.objects.filter(status__in=['queued', 'running'], run_at__lte=now)
+            if task_id is not None:
+                due = due.filter(pk=task_id)
+            claimed = due.select_for_update(skip_locked=True).order_by('run_at', 'id').first()
+            if claimed is None:
+                return None
+            if claimed.attempts >= claimed.max_attempts:
+                # Every attempt so far died without reporting back.
+                claimed.status = 'failed'
+                claimed.last_error = claimed.last_error or 'Lease expired on the last attempt.'
+                claimed.save(update_fields=['status', 'last_error'])
+                continue
+            claimed.status = 'running'
+            claimed.attempts += 1
+            claimed.run_at = now + timedelta(seconds=lease)
+            claimed.save(update_fields=['status', 'attempts', 'run_at'])
+        return claimed
+
+
+def run(claimed):
+    """
+    Run a task from `claim`. Its writes commit together with the removal of
+    its row; if it raises, it is rescheduled or marked failed. Returns True
+    if it succeeded.
+    """
+    func = _registry.get(claimed.name)
+    try:
+        if func is None:
+            raise LookupError(f"No task named {claimed.name!r} is registered.")
+        with transaction.atomic():
+            func(*claimed.payload.get('args', []), **claimed.payload.get('kwargs', {}))
+            # The attempt number fences off a worker whose lease was taken over.
+            if not Task.objects.filter(pk=claimed.pk, attempts=claimed.attempts).delete()[0]:
+                raise LeaseExpired(claimed)
+    except LeaseExpired:
+        return False
+    except Exception as exc:
+        final = claimed.attempts >= claimed.max_attempts
+        Task.objects.filter(pk=claimed.pk, attempts=claimed.attempts).update(
+            status='failed' if final else 'queued',
+            run_at=timezone.now() + timedelta(seconds=0 if final else backoff(claimed.attempts)),
+            last_error=''.join(traceback.format_exception(exc)),
+        )
+        return False
+    return True
+
+
+def work(burst=False, poll_interval=1.0, lease=None, stop=None, stdout=None):
+    """
+    Claim and run due tasks until ``stop`` (an Event) is set or, with
+    ``burst``, nothing is due. Returns ``(succeeded, failed)`` counts.
+    """
+    succeeded = failed = 0
+    while stop is None or not stop.is_set():
+        if not connection.in_atomic_block:
+            close_old_connections()  # like the end of a request: drop broken or expired connections
+        claimed = claim(lease=lease)
+        if claimed is None:
+            if burst:
+                break
+            if stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        started = time.perf_counter()
+        if run(claimed):
+            succeeded += 1
+            outcome = 'done'
+        else:
+            failed += 1
+            outcome = 'failed'
+        if stdout is not None:
+            stdout.write(
+                f"{claimed.name} #{claimed.pk} attempt {claimed.attempts}: {outcome} "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+    return succeeded, failed
+
+
+def _local_executor():
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = ThreadPoolExecutor(
+                max_workers=settings.POS_TASK_LOCAL_THREADS, thread_name_prefix='pos-task',
+            )
+        return _local_pool
+
+
+def _run_local(task_id):
+    try:
+        claimed = claim(task_id=task_id)
+        if claimed is not None:
+            run(claimed)
+    finally:
+        connection.close()  # each pool thread has its own connection
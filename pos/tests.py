@@ -1,11 +1,80 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+
+import numpy as np
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework.test import APITestCase
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, models
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor, PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import Product, Sale, SaleItem
+from .cache import auth_cache, barcode_cache, read_cache
+from .models import (
+    ArchivedPeriod, ArchivedSale, ArchivedSaleItem, DailySalesRollup, Product, ProductForecast, Sale, SaleItem,
+    StockMovement, Task,
+)
+from . import archive, forecasting, ledger, metrics, tasks
+from .fast import compile_serializer
+from .loadtest import run_wsgi
+from .pagination import SaleCursorPagination
+from .renderers import FastJSONRenderer
+from .serializers import ProductSerializer, SaleSerializer
+from .views import SaleViewSet, dashboard_aggregates, with_sale_items
+from .checkout import DuplicateSale, backfill_sale_totals, checkout, checkout_batch
+from .tasks import task
+from .utils import day_bounds, generate_receipt_number
 
 # Get the User model
 User = get_user_model()
 
+# Benchmarks build large datasets and print timings; they're opt-in.
+benchmark = skipUnless(os.environ.get('POS_BENCHMARKS'), "Set POS_BENCHMARKS=1 to run benchmarks.")
+
+
+class QueryCountAssertionsMixin:
+    """
+    Helpers for asserting an endpoint runs a bounded number of queries
+    no matter how many rows it returns.
+    """
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def assertQueryCountConstant(self, url, grow, rounds=2):
+        """
+        Call ``grow()`` ``rounds`` times, hitting ``url`` after each one,
+        and fail if the number of queries changes as the data grows.
+        """
+        grow()
+        baseline = self.count_queries(url)
+        for _ in range(rounds):
+            grow()
+            self.assertEqual(
+                self.count_queries(url), baseline,
+                f"{url} ran a different number of queries as rows were added (N+1?)",
+            )
+        return baseline
+
 class ProductViewSetTests(APITestCase):
     def setUp(self):
         """
@@ -87,7 +156,476 @@ class ProductViewSetTests(APITestCase):
         self.assertEqual(response.data[0]['name'], 'Laptop')
 
 
-class SaleViewSetTests(APITestCase):
+    def test_product_list_cursor_pagination(self):
+        """
+        Ensure the product list pages by cursor in (name, id) order without gaps or repeats.
+        """
+        for i in range(5):
+            Product.objects.create(owner=self.user1, name='Cable', price=5.00, stock_quantity=10 + i)
+
+        url = '/api/products/?page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend((p['name'], p['id']) for p in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_product_list_page_size_is_capped(self):
+        """
+        Ensure clients can't request pages larger than the cap.
+        """
+        Product.objects.bulk_create([
+            Product(owner=self.user1, name=f'Item {i:03}', price=1.00, barcode=f'CAP{i}') for i in range(250)
+        ])
+        response = self.client.get('/api/products/?page_size=1000', format='json')
+        self.assertEqual(len(response.data['results']), 200)
+
+
+    def test_search_exact_barcode(self):
+        """
+        Ensure scanner input resolves through the exact barcode match.
+        """
+        response = self.client.get(f'/api/products/search/?q={self.product2_user1.barcode}', format='json')
+        self.assertEqual([p['name'] for p in response.data], ['Mouse'])
+
+        # Another owner's barcode is never resolved.
+        response = self.client.get(f'/api/products/search/?q={self.product3_user2.barcode}', format='json')
+        self.assertEqual(response.data, [])
+
+    def test_search_ranks_prefix_matches_first(self):
+        """
+        Ensure name-prefix matches outrank substring and category matches.
+        """
+        Product.objects.create(owner=self.user1, name='Wireless Mouse Pad', price=9.00, stock_quantity=10)
+        Product.objects.create(owner=self.user1, name='Mousetrap', price=3.00, stock_quantity=10)
+        Product.objects.create(owner=self.user1, name='Cheese', category='Mouse food', price=3.00, stock_quantity=10)
+        Product.objects.create(owner=self.user2, name='Mouse', price=25.00, stock_quantity=5)
+
+        response = self.client.get('/api/products/search/?q=mouse', format='json')
+        names = [p['name'] for p in response.data]
+        self.assertEqual(sorted(names[:2]), ['Mouse', 'Mousetrap'])
+        self.assertEqual(set(names[2:]), {'Wireless Mouse Pad', 'Cheese'})
+
+    def test_search_limit_and_offset(self):
+        """
+        Ensure search results are limited and can be paged.
+        """
+        for i in range(5):
+            Product.objects.create(owner=self.user1, name=f'Charger {i}', price=9.00, stock_quantity=10)
+
+        first = self.client.get('/api/products/search/?q=charger&limit=2', format='json').data
+        second = self.client.get('/api/products/search/?q=charger&limit=2&offset=2', format='json').data
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({p['id'] for p in first} & {p['id'] for p in second})
+
+    def test_search_short_query_and_renames(self):
+        """
+        Ensure short queries fall back to a prefix match and renamed products are re-indexed.
+        """
+        response = self.client.get('/api/products/search/?q=la', format='json')
+        self.assertEqual([p['name'] for p in response.data], ['Laptop'])
+
+        self.product1_user1.name = 'Notebook'
+        self.product1_user1.save()
+        self.assertEqual(self.client.get('/api/products/search/?q=laptop', format='json').data, [])
+        response = self.client.get('/api/products/search/?q=ebook', format='json')
+        self.assertEqual([p['name'] for p in response.data], ['Notebook'])
+
+
+    def test_by_barcode_cache_hit_and_miss(self):
+        """
+        Ensure a scanned barcode is served from the cache after the first lookup.
+        """
+        barcode_cache.clear()
+        url = f'/api/products/by-barcode/{self.product1_user1.barcode}/'
+
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, {
+            'id': self.product1_user1.id,
+            'name': 'Laptop',
+            'price': '1200.00',
+            'stock_quantity': 50,
+            'barcode': self.product1_user1.barcode,
+        })
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, format='json')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(barcode_cache.stats()['hits'], 1)
+        self.assertEqual(barcode_cache.stats()['misses'], 1)
+
+    def test_by_barcode_is_owner_scoped(self):
+        """
+        Ensure another owner's barcode (or an unknown one) returns 404.
+        """
+        barcode_cache.clear()
+        response = self.client.get(f'/api/products/by-barcode/{self.product3_user2.barcode}/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/products/by-barcode/NOPE/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_by_barcode_invalidated_on_save_and_sale(self):
+        """
+        Ensure product edits and sales drop the cached payload.
+        """
+        barcode_cache.clear()
+        url = f'/api/products/by-barcode/{self.product1_user1.barcode}/'
+        self.client.get(url, format='json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{self.product1_user1.id}/', {'price': '999.00'}, format='json')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['price'], '999.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/sales/', {
+                "payment_method": "cash",
+                "items": [{"product_id": self.product1_user1.id, "quantity": 4}],
+            }, format='json')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock_quantity'], 46)
+
+
+
+class ProductImportExportTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.existing = Product.objects.create(owner=self.user1, name='Tea', price=100.00, stock_quantity=5, barcode='111')
+        self.foreign = Product.objects.create(owner=self.user2, name='Coffee', price=200.00, barcode='222')
+        self.client.force_authenticate(user=self.user1)
+
+    def test_import_csv_upserts_and_reports_errors(self):
+        """
+        Ensure a CSV upload creates new rows, updates by barcode and reports bad rows.
+        """
+        csv_data = (
+            "barcode,name,price,stock_quantity,category\n"
+            "111,Green Tea,120.00,7,Beverages\n"
+            "333,Biscuits,15.00,,Snacks\n"
+            ",No Barcode,5.00,3,\n"
+            "444,Broken,not-a-price,1,\n"
+            "222,Stolen,1.00,1,\n"
+        )
+        upload = SimpleUploadedFile('catalog.csv', csv_data.encode(), content_type='text/csv')
+        response = self.client.post('/api/products/import/?chunk_size=2', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['processed'], 5)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([e['row'] for e in response.data['errors']], [4, 5])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.stock_quantity), ('Green Tea', 7))
+        self.assertEqual(Product.objects.get(barcode='333').stock_quantity, 0)
+        self.assertTrue(Product.objects.get(name='No Barcode').barcode)
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.name, 'Coffee')
+
+    def test_import_partial_rows_only_update_given_columns(self):
+        """
+        Ensure a row without some columns updates an existing product and leaves the rest alone.
+        """
+        Product.objects.filter(pk=self.existing.pk).update(description='Loose leaf', category='Beverages')
+        csv_data = (
+            "barcode,price,stock_quantity,category\n"
+            "111,110.00,,\n"
+            "888,9.00,4,Snacks\n"
+        )
+        upload = SimpleUploadedFile('prices.csv', csv_data.encode(), content_type='text/csv')
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+        self.assertEqual(response.data['errors'], [{'row': 2, 'errors': {'name': ["This field is required."]}}])
+        self.existing.refresh_from_db()
+        self.assertEqual(
+            (self.existing.name, self.existing.description, float(self.existing.price),
+             self.existing.stock_quantity, self.existing.category),
+            ('Tea', 'Loose leaf', 110.00, 5, 'Beverages'),
+        )
+        self.assertFalse(StockMovement.objects.filter(product=self.existing, note='Import').exists())
+        self.assertFalse(Product.objects.filter(barcode='888').exists())
+
+        body = '{"barcode": "111", "stock_quantity": 9}\n{"barcode": "111", "name": "Chai"}\n'
+        response = self.client.post('/api/products/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['updated'], 1)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, float(self.existing.price), self.existing.stock_quantity), ('Chai', 110.00, 9))
+        self.assertEqual(ledger.stock_as_of(self.existing, timezone.now()), 9)
+
+    def test_import_jsonl_raw_body(self):
+        """
+        Ensure a JSON Lines body can be posted directly.
+        """
+        body = (
+            '{"barcode": "555", "name": "Soap", "price": "45.00", "stock_quantity": 10}\n'
+            '\n'
+            '{not json}\n'
+            '5\n'
+            '["a list"]\n'
+        )
+        response = self.client.post('/api/products/import/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([e['row'] for e in response.data['errors']], [2, 3, 4])
+        self.assertEqual(
+            response.data['errors'][1]['errors'], {'non_field_errors': ["Each line must be a JSON object."]}
+        )
+        self.assertEqual(Product.objects.get(barcode='555').owner, self.user1)
+
+    def test_import_never_overwrites_a_barcode_created_meanwhile(self):
+        """
+        Ensure a barcode another store creates between the ownership check and the upsert is reported, not taken.
+        """
+        from . import imports
+        write_chunk = imports._write_chunk
+
+        def racing(owner, by_barcode):
+            if not Product.objects.filter(barcode='666').exists():
+                Product.objects.create(owner=self.user2, name='Theirs', price=1, barcode='666')
+                # The lookup already ran without seeing it.
+                with mock.patch.object(Product.objects, 'select_for_update', return_value=Product.objects.none()):
+                    return write_chunk(owner, by_barcode)
+            return write_chunk(owner, by_barcode)
+
+        body = '{"barcode": "666", "name": "Mine", "price": "2.00"}\n{"barcode": "777", "name": "New", "price": "3.00"}\n'
+        with mock.patch.object(imports, '_write_chunk', side_effect=racing):
+            response = self.client.post('/api/products/import/', body, content_type='application/x-ndjson')
+
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 0))
+        self.assertEqual(response.data['errors'], [{'row': 1, 'errors': {'barcode': ["Barcode is used by another store."]}}])
+        theirs = Product.objects.get(barcode='666')
+        self.assertEqual((theirs.owner, theirs.name), (self.user2, 'Theirs'))
+        self.assertEqual(Product.objects.get(barcode='777').owner, self.user1)
+
+    def test_export_round_trips_through_import(self):
+        """
+        Ensure the streamed export only contains the owner's catalog and can be re-imported.
+        """
+        response = self.client.get('/api/products/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.splitlines(), [
+            'barcode,name,description,price,stock_quantity,category',
+            '111,Tea,,100.00,5,',
+        ])
+
+        response = self.client.get('/api/products/export/?format=jsonl')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"price":"100.00"', lines[0])
+
+        Product.objects.filter(owner=self.user1).update(name='Renamed')
+        upload = SimpleUploadedFile('products.jsonl', '\n'.join(lines).encode())
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['updated'], 1)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Tea')
+
+    def test_import_products_command(self):
+        """
+        Ensure the management command imports a file for the given owner.
+        """
+        path = os.path.join(self._tmpdir(), 'catalog.csv')
+        with open(path, 'w') as handle:
+            handle.write("barcode,name,price,stock_quantity\n777,Bread,25.00,20\n")
+        out = io.StringIO()
+        call_command('import_products', path, owner='user1', chunk_size=100, stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertEqual(Product.objects.get(barcode='777').owner, self.user1)
+
+    def _tmpdir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return directory
+
+
+class CachedReadTests(APITestCase):
+    def setUp(self):
+        read_cache.reset_stats()
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.product = Product.objects.create(owner=self.user1, name='Tea', price=10.00, stock_quantity=5)
+        Product.objects.create(owner=self.user2, name='Coffee', price=10.00, stock_quantity=5)
+        self.client.force_authenticate(user=self.user1)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        """
+        Ensure a second identical read runs no queries and is counted as a hit.
+        """
+        for url in ['/api/products/', '/api/products/low_stock/', '/api/sales/dashboard_stats/',
+                    '/api/sales/today_sales/', '/api/products/search/?q=tea']:
+            first = self.client.get(url, format='json')
+            self.assertEqual(first['X-Cache'], 'MISS')
+            with self.assertNumQueries(0):
+                second = self.client.get(url, format='json')
+            self.assertEqual(second['X-Cache'], 'LOCAL')
+            self.assertEqual(second.data, first.data)
+
+        stats = read_cache.stats()
+        self.assertEqual((stats['local_hits'], stats['misses']), (5, 5))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_shared_tier_serves_other_workers(self):
+        """
+        Ensure a value cached by one process is found in the shared backend by another.
+        """
+        self.client.get('/api/products/', format='json')
+        read_cache.local.clear()  # as if this request landed on a different worker
+        response = self.client.get('/api/products/', format='json')
+        self.assertEqual(response['X-Cache'], 'SHARED')
+
+    def test_writes_invalidate_only_the_owners_entries(self):
+        """
+        Ensure product edits and checkouts invalidate the owner's cached reads and nobody else's.
+        """
+        self.client.get('/api/products/low_stock/', format='json')
+        self.client.get('/api/sales/dashboard_stats/', format='json')
+
+        self.client.force_authenticate(user=self.user2)
+        self.client.get('/api/products/', format='json')
+        Product.objects.create(owner=self.user1, name='Sugar', price=1.00, stock_quantity=1)
+        self.assertEqual(self.client.get('/api/products/', format='json')['X-Cache'], 'LOCAL')
+
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get('/api/products/low_stock/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data), 2)
+
+        self.client.post('/api/sales/', {
+            "payment_method": "cash", "items": [{"product_id": self.product.id, "quantity": 5}],
+        }, format='json')
+        response = self.client.get('/api/sales/dashboard_stats/', format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['today_sales'], 1)
+
+    def test_evicted_version_counter_never_reuses_old_entries(self):
+        """
+        Ensure losing a version counter can't resurrect data cached under an older version.
+        """
+        self.client.get('/api/products/', format='json')
+        caches['default'].delete(read_cache._version_key(self.user1.pk, 'products'))
+        self.assertEqual(self.client.get('/api/products/', format='json')['X-Cache'], 'MISS')
+
+    def test_unchanged_reads_answer_304(self):
+        """
+        Ensure a matching If-None-Match gets a 304 without queries, and a write changes the ETag.
+        """
+        for url in ['/api/products/', '/api/sales/', '/api/sales/dashboard_stats/']:
+            etag = self.client.get(url, format='json')['ETag']
+            read_cache.local.clear()
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+        etag = self.client.get('/api/products/', format='json')['ETag']
+        self.client.patch(f'/api/products/{self.product.id}/', {'price': '12.00'}, format='json')
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etags_differ_per_owner_and_url(self):
+        """
+        Ensure one owner's ETag never validates another owner's copy or another page.
+        """
+        etag = self.client.get('/api/products/', format='json')['ETag']
+        self.assertNotEqual(self.client.get('/api/products/low_stock/', format='json')['ETag'], etag)
+        self.client.force_authenticate(user=self.user2)
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        """
+        Ensure Last-Modified is sent once settled and If-Modified-Since is honoured.
+        """
+        with mock.patch('pos.views.time.time', return_value=time.time() + 5):
+            last_modified = self.client.get('/api/products/', format='json')['Last-Modified']
+            response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(f'/api/products/{self.product.id}/', {'price': '12.00'}, format='json')
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Modified within the last second: no Last-Modified, so the ETag is the only validator.
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class FastSerializationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.other = User.objects.create_user(username='user2', password='password123')
+        tea = Product.objects.create(
+            owner=self.user, name='Tea \u2028 "Earl Grey" \u00e9', description='line\nbreak',
+            price='10.50', stock_quantity=5, category='Drinks',
+        )
+        sugar = Product.objects.create(owner=self.user, name='Sugar', price=1, stock_quantity=100, barcode=None)
+        Product.objects.filter(pk=sugar.pk).update(barcode=None)
+        Product.objects.create(owner=self.other, name='Coffee', price=3, stock_quantity=1)
+        for quantity in (1, 2):
+            checkout(self.user, [{'product_id': tea.id, 'quantity': quantity},
+                                 {'product_id': sugar.id, 'quantity': 3}], 'card')
+        self.client.force_authenticate(user=self.user)
+
+    def _fetch(self, url, fast):
+        read_cache.local.clear()
+        caches['default'].clear()
+        with self.settings(POS_FAST_SERIALIZERS=fast):
+            return self.client.get(url, format='json')
+
+    def test_fast_mode_is_byte_compatible(self):
+        """
+        Ensure every fast-path endpoint renders exactly the same bytes as the serializers.
+        """
+        for url in ['/api/products/', '/api/products/?page_size=1', '/api/sales/', '/api/sales/?page_size=1',
+                    '/api/products/low_stock/', '/api/products/search/?q=tea', '/api/products/search/?q=Su',
+                    '/api/sales/today_sales/']:
+            slow = self._fetch(url, fast=False)
+            quick = self._fetch(url, fast=True)
+            self.assertEqual(slow.status_code, status.HTTP_200_OK)
+            self.assertEqual(quick.content, slow.content, url)
+
+    def test_fast_mode_pages_follow_the_cursor(self):
+        """
+        Ensure cursors built from fast-path rows walk the same pages.
+        """
+        url = '/api/products/?page_size=1'
+        names = []
+        while url:
+            page = self._fetch(url, fast=True).json()
+            names.extend(product['name'] for product in page['results'])
+            url = page['next']
+        self.assertEqual(names, list(Product.objects.filter(owner=self.user).order_by('name', 'id')
+                                     .values_list('name', flat=True)))
+
+    def test_fast_sales_load_items_in_one_query(self):
+        """
+        Ensure a fast sales page costs the page query plus one query for every page's items.
+        """
+        read_cache.local.clear()
+        caches['default'].clear()
+        with self.settings(POS_FAST_SERIALIZERS=True), CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/sales/', format='json')
+        self.assertEqual(len([q for q in queries if 'pos_saleitem' in q['sql']]), 1)
+
+
+class SaleViewSetTests(QueryCountAssertionsMixin, APITestCase):
     def setUp(self):
         """
         Set up the test environment for sales.
@@ -167,4 +705,1867 @@ class SaleViewSetTests(APITestCase):
         # Check some of the stats based on our setUp data
         self.assertEqual(response.data['total_products'], 2) # user1 has 2 products
         self.assertEqual(response.data['today_sales'], 1)
-        self.assertEqual(float(response.data['today_revenue']), 100.00)
\ No newline at end of file
+        self.assertEqual(float(response.data['today_revenue']), 100.00)
+
+    def test_create_sale_insufficient_stock_reports_failed_items(self):
+        """
+        Ensure a checkout that can't be fulfilled reports every failing line
+        and leaves all stock untouched.
+        """
+        url = '/api/sales/'
+        data = {
+            "payment_method": "cash",
+            "items": [
+                {"product_id": self.product1.id, "quantity": 3},
+                {"product_id": self.product2.id, "quantity": 51},
+            ]
+        }
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        failed = response.data['failed_items']
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(int(failed[0]['product_id']), self.product2.id)
+        self.assertEqual(int(failed[0]['available']), 50)
+
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock_quantity, 100)
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_create_sale_repeated_product_lines(self):
+        """
+        Ensure the same product on two lines is checked against its combined quantity.
+        """
+        url = '/api/sales/'
+        data = {
+            "payment_method": "card",
+            "items": [
+                {"product_id": self.product2.id, "quantity": 30},
+                {"product_id": self.product2.id, "quantity": 30},
+            ]
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data['items'][1]['quantity'] = 20
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.stock_quantity, 0)
+        self.assertEqual(SaleItem.objects.count(), 2)
+
+
+    def test_checkout_updates_daily_rollup(self):
+        """
+        Ensure each checkout is added to the owner's rollup for its payment method.
+        """
+        for method in ['cash', 'cash', 'upi']:
+            data = {"payment_method": method, "items": [{"product_id": self.product1.id, "quantity": 2}]}
+            response = self.client.post('/api/sales/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        cash = DailySalesRollup.objects.get(owner=self.user1, payment_method='cash')
+        self.assertEqual(cash.sale_count, 2)
+        self.assertEqual(float(cash.revenue), 40.00)
+        self.assertEqual(DailySalesRollup.objects.get(owner=self.user1, payment_method='upi').sale_count, 1)
+
+        Sale.objects.filter(payment_method='upi').get().delete()
+        self.assertEqual(DailySalesRollup.objects.get(owner=self.user1, payment_method='upi').sale_count, 0)
+
+    def test_sales_cannot_be_edited(self):
+        """
+        Ensure a sale can't be edited behind its rollup, so deleting it afterwards leaves the rollup at zero.
+        """
+        data = {"payment_method": "cash", "items": [{"product_id": self.product1.id, "quantity": 1}]}
+        sale_id = self.client.post('/api/sales/', data, format='json').data['id']
+        url = f'/api/sales/{sale_id}/'
+        response = self.client.patch(url, {'total_amount': '999.00', 'payment_method': 'card'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.put(url, {'total_amount': '999.00', 'payment_method': 'card'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(self.client.get('/api/sales/dashboard_stats/').data['today_revenue'], 10)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(DailySalesRollup.objects.filter(owner=self.user1).values_list('payment_method', 'sale_count', 'revenue')),
+            [('cash', 0, 0)],
+        )
+
+    def test_dashboard_stats_queries(self):
+        """
+        Ensure dashboard stats come from three aggregate queries regardless of history size.
+        """
+        queries = self.assertQueryCountConstant('/api/sales/dashboard_stats/', self._add_sales)
+        self.assertEqual(queries, 3)
+
+        response = self.client.get('/api/sales/dashboard_stats/', format='json')
+        self.assertEqual(response.data['week_sales'], 9)
+        self.assertEqual(float(response.data['week_revenue']), 270.00)
+        self.assertEqual(response.data['low_stock_products'], 27)
+
+    def test_rebuild_sales_rollup_command(self):
+        """
+        Ensure the rebuild command reproduces the rollups from the sales table.
+        """
+        self._add_sales(count=4, lines=1)
+        Sale.objects.create(owner=self.user1, total_amount=5.00, payment_method='card', receipt_number='RCPCARD')
+        expected = sorted(DailySalesRollup.objects.values_list('day', 'payment_method', 'sale_count', 'revenue'))
+        DailySalesRollup.objects.all().delete()
+
+        call_command('rebuild_sales_rollup', chunk_size=2, stdout=io.StringIO())
+
+        rebuilt = sorted(DailySalesRollup.objects.values_list('day', 'payment_method', 'sale_count', 'revenue'))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(len(rebuilt), 2)
+
+    def test_batch_sales_ingestion(self):
+        """
+        Ensure a batch creates each valid sale, rejects the ones without stock
+        and reports malformed entries, with one result per sale.
+        """
+        data = {"sales": [
+            {"idempotency_key": "k1", "payment_method": "cash",
+             "items": [{"product_id": self.product1.id, "quantity": 60}]},
+            {"idempotency_key": "k2", "payment_method": "card",
+             "items": [{"product_id": self.product1.id, "quantity": 50}]},
+            {"idempotency_key": "k3", "payment_method": "upi",
+             "items": [{"product_id": self.product1.id, "quantity": 40},
+                       {"product_id": self.product2.id, "quantity": 5}]},
+            {"idempotency_key": "k4", "payment_method": "bitcoin", "items": []},
+            {"idempotency_key": "k5", "payment_method": "cash",
+             "items": [{"product_id": self.product3_user2.id, "quantity": 1}]},
+            {"idempotency_key": "k1", "payment_method": "cash",
+             "items": [{"product_id": self.product1.id, "quantity": 60}]},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sales/batch/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(
+            [(r['idempotency_key'], r['status']) for r in results],
+            [('k1', 'created'), ('k2', 'rejected'), ('k3', 'created'), ('k4', 'invalid'),
+             ('k5', 'rejected'), ('k1', 'duplicate')],
+        )
+        self.assertEqual(results[1]['errors']['failed_items'][0]['available'], 40)
+        self.assertEqual(results[5]['sale_id'], results[0]['sale_id'])
+
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product1.stock_quantity, 0)
+        self.assertEqual(self.product2.stock_quantity, 45)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(SaleItem.objects.count(), 3)
+        self.assertEqual(DailySalesRollup.objects.get(payment_method='upi').revenue, 500)
+
+    def test_batch_sales_replay_is_safe(self):
+        """
+        Ensure replaying a batch returns the recorded sales without selling twice.
+        """
+        data = {"sales": [
+            {"idempotency_key": f"till-1-{i}", "payment_method": "cash",
+             "items": [{"product_id": self.product2.id, "quantity": 2}]}
+            for i in range(3)
+        ]}
+        first = self.client.post('/api/sales/batch/', data, format='json').data['results']
+        with self.assertNumQueries(1):
+            replay = self.client.post('/api/sales/batch/', data, format='json').data['results']
+
+        self.assertEqual([r['status'] for r in replay], ['duplicate'] * 3)
+        self.assertEqual([r['receipt_number'] for r in replay], [r['receipt_number'] for r in first])
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.stock_quantity, 44)
+
+    def test_batch_sales_query_count_is_constant(self):
+        """
+        Ensure a batch runs a fixed number of statements regardless of its size.
+        """
+        def post(size, offset):
+            data = {"sales": [
+                {"idempotency_key": f"q-{offset + i}", "payment_method": "cash",
+                 "items": [{"product_id": self.product1.id, "quantity": 1},
+                           {"product_id": self.product2.id, "quantity": 1}]}
+                for i in range(size)
+            ]}
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post('/api/sales/batch/', data, format='json')
+            return len(ctx.captured_queries)
+
+        post(1, 1000)  # creates today's rollup row
+        self.assertEqual(post(2, 0), post(20, 100))
+
+    def test_idempotency_key_replays_recorded_sale(self):
+        """
+        Ensure retrying a checkout with the same Idempotency-Key returns the
+        original sale and doesn't take stock twice.
+        """
+        data = {"payment_method": "cash", "items": [{"product_id": self.product1.id, "quantity": 5}]}
+        first = self.client.post('/api/sales/', data, format='json', HTTP_IDEMPOTENCY_KEY='till-7-0001')
+        replay = self.client.post('/api/sales/', data, format='json', HTTP_IDEMPOTENCY_KEY='till-7-0001')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock_quantity, 95)
+
+        other = self.client.post('/api/sales/', data, format='json', HTTP_IDEMPOTENCY_KEY='till-7-0002')
+        self.assertNotEqual(other.data['receipt_number'], first.data['receipt_number'])
+
+        response = self.client.post('/api/sales/', data, format='json', HTTP_IDEMPOTENCY_KEY='x' * 65)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_concurrent_idempotent_retry_is_a_duplicate(self):
+        """
+        Ensure a retry that loses the insert race gets the recorded sale, not a 500.
+        """
+        items = [{"product_id": self.product2.id, "quantity": 1}]
+        sale = checkout(self.user1, items, 'cash', idempotency_key='race')
+        with self.assertRaises(DuplicateSale) as raised:
+            checkout(self.user1, items, 'cash', idempotency_key='race')
+        self.assertEqual(raised.exception.sale, sale)
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.stock_quantity, 49)
+
+    def test_receipt_numbers_are_unique_and_time_ordered(self):
+        """
+        Ensure generated receipt numbers fit the column, never repeat and sort by creation.
+        """
+        receipts = [generate_receipt_number() for _ in range(10000)]
+        self.assertEqual(len(set(receipts)), len(receipts))
+        self.assertEqual(receipts, sorted(receipts))
+        self.assertTrue(all(len(r) <= Sale._meta.get_field('receipt_number').max_length for r in receipts))
+
+    def _add_sales(self, count=3, lines=3):
+        for _ in range(count):
+            sale = Sale.objects.create(
+                owner=self.user1, total_amount=30.00, payment_method='cash',
+                receipt_number=f'RCP{Sale.objects.count() + 1}',
+            )
+            for _ in range(lines):
+                product = Product.objects.create(owner=self.user1, name='Line', price=10.00, stock_quantity=1)
+                SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price)
+
+    def test_sale_list_query_count_is_constant(self):
+        """
+        Ensure listing sales doesn't run per-sale or per-item queries.
+        """
+        self.assertQueryCountConstant('/api/sales/', self._add_sales)
+
+    def test_today_sales_query_count_is_constant(self):
+        """
+        Ensure today's sales summary doesn't run per-sale or per-item queries.
+        """
+        queries = self.assertQueryCountConstant('/api/sales/today_sales/', self._add_sales)
+        self.assertLessEqual(queries, 2)
+
+        response = self.client.get('/api/sales/today_sales/', format='json')
+        self.assertEqual(response.data['total_sales'], 9)
+        self.assertEqual(float(response.data['total_revenue']), 270.00)
+        self.assertEqual(response.data['sales'][0]['items'][0]['product_name'], 'Line')
+
+    def test_sale_retrieve_query_count_is_constant(self):
+        """
+        Ensure a single sale loads its items and product names in bulk.
+        """
+        self._add_sales(count=1, lines=1)
+        sale = Sale.objects.get()
+        url = f'/api/sales/{sale.id}/'
+        baseline = self.count_queries(url)
+        for _ in range(5):
+            product = Product.objects.create(owner=self.user1, name='Extra', price=1.00, stock_quantity=1)
+            SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price)
+        self.assertEqual(self.count_queries(url), baseline)
+
+
+    def test_sale_list_cursor_pagination(self):
+        """
+        Ensure sales page newest first, and ties on created_at are broken by id.
+        """
+        now = timezone.now()
+        Sale.objects.bulk_create([
+            Sale(owner=self.user1, total_amount=1.00, payment_method='cash', receipt_number=f'RCP{i}', created_at=now)
+            for i in range(5)
+        ])
+        first = self.client.get('/api/sales/?page_size=2', format='json').data
+        ids = [sale['id'] for sale in first['results']]
+        url = first['next']
+        while url:
+            page = self.client.get(url, format='json').data
+            ids.extend(sale['id'] for sale in page['results'])
+            url = page['next']
+        self.assertEqual(ids, sorted(Sale.objects.values_list('id', flat=True), reverse=True))
+
+    def test_sales_export_streams_items_in_range(self):
+        """
+        Ensure the export streams one row per item sold by the owner in the requested days.
+        """
+        checkout(self.user1, [{'product_id': self.product1.id, 'quantity': 2},
+                              {'product_id': self.product2.id, 'quantity': 1}], 'card')
+        old = checkout(self.user1, [{'product_id': self.product1.id, 'quantity': 1}], 'cash')
+        Sale.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=40))
+        checkout(self.user2, [{'product_id': self.product3_user2.id, 'quantity': 1}], 'cash')
+
+        response = self.client.get('/api/sales/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], 'receipt_number,sale_id,created_at,payment_method,sale_total,'
+                                  'item_id,product_id,product_name,quantity,unit_price,total_price')
+        self.assertEqual([row.split(',')[7:] for row in rows[1:]], [
+            ['Test Product 1', '2', '10.00', '20.00'],
+            ['Test Product 2', '1', '20.00', '20.00'],
+        ])
+
+        start = (timezone.localdate() - timezone.timedelta(days=60)).isoformat()
+        response = self.client.get(f'/api/sales/export/?from={start}&format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['sale_id'], old.pk)
+        self.assertEqual(lines[0]['sale_total'], '10.00')
+
+    def test_sales_export_rejects_bad_ranges(self):
+        """
+        Ensure malformed or inverted date ranges are rejected.
+        """
+        for query in ['from=yesterday', 'to=2026-02-30', 'from=2026-03-02&to=2026-03-01']:
+            response = self.client.get(f'/api/sales/export/?{query}&format=ndjson')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+
+class StockLedgerTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.product = Product.objects.create(owner=self.user, name='Tea', price=10, stock_quantity=10, barcode='111')
+        self.client.force_authenticate(user=self.user)
+
+    def assertLedgerBalanced(self):
+        self.assertEqual(ledger.verify_ledger(), [])
+
+    def test_every_stock_change_is_recorded(self):
+        """
+        Ensure sales, batches, edits, imports and manual moves all land in the ledger.
+        """
+        checkout(self.user, [{'product_id': self.product.id, 'quantity': 2}], 'cash')
+        self.client.post('/api/sales/batch/', {'sales': [
+            {'idempotency_key': 'a', 'payment_method': 'cash', 'items': [{'product_id': self.product.id, 'quantity': 1}]},
+        ]}, format='json')
+        self.client.patch(f'/api/products/{self.product.id}/', {'stock_quantity': 20}, format='json')
+        self.client.patch(f'/api/products/{self.product.id}/', {'name': 'Green Tea'}, format='json')
+        self.client.post(f'/api/products/{self.product.id}/stock/', {'kind': 'return', 'quantity': 1}, format='json')
+        upload = SimpleUploadedFile('p.csv', b'barcode,name,price,stock_quantity\n111,Tea,10,30\n222,Bun,4,6\n')
+        self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+
+        self.assertLedgerBalanced()
+        kinds = list(self.product.movements.order_by('id').values_list('kind', 'quantity'))
+        self.assertEqual(kinds, [
+            ('opening', 10), ('sale', -2), ('sale', -1), ('adjustment', 13), ('return', 1), ('adjustment', 9),
+        ])
+        self.assertEqual(StockMovement.objects.get(product__barcode='222').kind, 'opening')
+        self.assertEqual(self.product.movements.filter(kind='sale').exclude(sale=None).count(), 2)
+
+    def test_manual_moves_are_validated(self):
+        """
+        Ensure restocks must add stock and adjustments can't take it below zero.
+        """
+        url = f'/api/products/{self.product.id}/stock/'
+        response = self.client.post(url, {'kind': 'restock', 'quantity': -5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'kind': 'adjustment', 'quantity': -11, 'note': 'Breakage'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {'kind': 'adjustment', 'quantity': -4, 'note': 'Breakage'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['stock_quantity'], 6)
+        page = self.client.get(f'/api/products/{self.product.id}/movements/?page_size=1').data
+        self.assertEqual([(m['kind'], m['quantity'], m['note']) for m in page['results']], [('adjustment', -4, 'Breakage')])
+        self.assertIsNotNone(page['next'])
+        self.assertLedgerBalanced()
+
+    def test_stock_as_of_uses_the_nearest_snapshot(self):
+        """
+        Ensure historical stock is the snapshot plus later movements, in two queries.
+        """
+        now = timezone.now()
+        ledger.move_stock(self.product, 'restock', 5)
+        StockMovement.objects.filter(kind='opening').update(created_at=now - timezone.timedelta(hours=3))
+        StockMovement.objects.filter(kind='restock').update(created_at=now - timezone.timedelta(hours=2))
+        self.assertEqual(ledger.take_snapshots(), 1)
+        self.assertEqual(ledger.take_snapshots(), 0)  # nothing moved since
+        checkout(self.user, [{'product_id': self.product.id, 'quantity': 3}], 'cash')
+
+        self.assertEqual(ledger.stock_as_of(self.product, now - timezone.timedelta(hours=4)), 0)
+        self.assertEqual(ledger.stock_as_of(self.product, now - timezone.timedelta(minutes=150)), 10)
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger.stock_as_of(self.product, timezone.now()), 12)
+        self.assertEqual(ledger.take_snapshots(), 1)
+
+        when = (now - timezone.timedelta(hours=1)).isoformat()
+        response = self.client.get(f'/api/products/{self.product.id}/stock/', {'as_of': when})
+        self.assertEqual(response.data['stock_quantity'], 15)
+        response = self.client.get(f'/api/products/{self.product.id}/stock/', {'as_of': 'last week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_verify_stock_ledger_command(self):
+        """
+        Ensure the command reports stock changed behind the ledger's back and can reconcile it.
+        """
+        call_command('verify_stock_ledger', stdout=io.StringIO())
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=7)
+        with self.assertRaises(CommandError):
+            call_command('verify_stock_ledger', chunk_size=1, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('verify_stock_ledger', fix=True, stdout=out)
+        self.assertIn('Reconciled 1 product', out.getvalue())
+        self.assertLedgerBalanced()
+        self.assertEqual(self.product.movements.order_by('id').last().quantity, -3)
+
+
+class AnalyticsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        other = User.objects.create_user(username='user2', password='password123')
+        self.tea = Product.objects.create(owner=self.user, name='Tea', category='Drinks', price=10, stock_quantity=100)
+        self.bun = Product.objects.create(owner=self.user, name='Bun', category='Bakery', price=4, stock_quantity=100)
+        self.today = timezone.localdate()
+        # Two days ago: 3 teas by card. Today: a tea and 5 buns in cash, at 09:xx.
+        self._sell(2, 9, [(self.tea, 3)], 'card')
+        self._sell(0, 9, [(self.tea, 1), (self.bun, 5)], 'cash')
+        coffee = Product.objects.create(owner=other, name='Coffee', category='Drinks', price=99, stock_quantity=9)
+        checkout(other, [{'product_id': coffee.id, 'quantity': 1}], 'card')
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.client.force_authenticate(user=self.user)
+
+    def _sell(self, days_ago, hour, lines, payment_method):
+        sale = checkout(self.user, [{'product_id': p.id, 'quantity': q} for p, q in lines], payment_method)
+        start, _ = day_bounds(self.today - timezone.timedelta(days=days_ago))
+        Sale.objects.filter(pk=sale.pk).update(created_at=start + timezone.timedelta(hours=hour, minutes=15))
+
+    def _range(self, days):
+        return f'from={(self.today - timezone.timedelta(days=days)).isoformat()}&to={self.today.isoformat()}'
+
+    def test_daily_revenue_fills_gaps_and_averages(self):
+        """
+        Ensure every day is present, empty days are zero, and the moving average trails.
+        """
+        response = self.client.get(f'/api/analytics/revenue/?{self._range(2)}&window=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(point['sales'], point['revenue'], point['moving_average']) for point in response.data['series']],
+            [(1, '30.00', '30.00'), (0, '0.00', '15.00'), (1, '30.00', '15.00')],
+        )
+        self.assertEqual(response.data['series'][0]['start'], (self.today - timezone.timedelta(days=2)).isoformat())
+
+    def test_hourly_and_weekly_buckets(self):
+        """
+        Ensure hourly series cover every hour of the range and weekly ones sum their days.
+        """
+        series = self.client.get(f'/api/analytics/revenue/?{self._range(2)}&bucket=hour').data['series']
+        self.assertEqual(len(series), 72)
+        busy = [point for point in series if point['sales']]
+        self.assertEqual([point['start'][-5:] for point in busy], ['09:00', '09:00'])
+
+        series = self.client.get(f'/api/analytics/revenue/?{self._range(2)}&bucket=week').data['series']
+        self.assertEqual(sum(point['sales'] for point in series), 2)
+        self.assertEqual(sum(float(point['revenue']) for point in series), 60.0)
+        for point in series:
+            self.assertEqual(timezone.datetime.fromisoformat(point['start']).weekday(), 0)
+
+    def test_top_products_categories_and_payment_mix(self):
+        """
+        Ensure the breakdowns are grouped in SQL per owner and carry their shares.
+        """
+        top = self.client.get(f'/api/analytics/top_products/?{self._range(7)}').data
+        self.assertEqual([(p['name'], p['quantity'], p['revenue']) for p in top],
+                         [('Tea', 4, '40.00'), ('Bun', 5, '20.00')])
+        self.assertEqual(top[0]['revenue_share'], 0.6667)
+        top = self.client.get(f'/api/analytics/top_products/?{self._range(7)}&order_by=quantity&limit=1').data
+        self.assertEqual([p['name'] for p in top], ['Bun'])
+
+        categories = self.client.get(f'/api/analytics/category_mix/?{self._range(7)}').data
+        self.assertEqual([(c['category'], c['revenue_share']) for c in categories],
+                         [('Drinks', 0.6667), ('Bakery', 0.3333)])
+
+        methods = self.client.get(f'/api/analytics/payment_mix/?{self._range(7)}').data
+        self.assertEqual([(m['payment_method'], m['sales'], m['revenue']) for m in methods],
+                         [('card', 1, '30.00'), ('cash', 1, '30.00')])
+
+    def test_overview_and_validation(self):
+        """
+        Ensure the overview combines every section and bad parameters are rejected.
+        """
+        response = self.client.get('/api/analytics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['revenue']), 1)
+        self.assertEqual(response.data['top_products'][0]['name'], 'Bun')
+
+        for url in ['/api/analytics/revenue/?bucket=minute', '/api/analytics/top_products/?order_by=name',
+                    f'/api/analytics/revenue/?bucket=hour&{self._range(200)}']:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST, url)
+
+
+class ForecastingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.today = timezone.localdate()
+        self.fast = Product.objects.create(owner=self.user, name='Milk', price=2, stock_quantity=1000)
+        self.slow = Product.objects.create(owner=self.user, name='Saffron', price=30, stock_quantity=1000)
+        Product.objects.update(created_at=timezone.now() - timezone.timedelta(days=20))
+        # Milk sells 8 a day for the last 20 days; saffron never sells.
+        for days_ago in range(1, 21):
+            self._sell(days_ago, self.fast, 8)
+        Product.objects.filter(pk=self.fast.pk).update(stock_quantity=50)
+        Product.objects.filter(pk=self.slow.pk).update(stock_quantity=5)
+        self.client.force_authenticate(user=self.user)
+
+    def _sell(self, days_ago, product, quantity):
+        sale = checkout(self.user, [{'product_id': product.id, 'quantity': quantity}], 'cash')
+        start, _ = day_bounds(self.today - timezone.timedelta(days=days_ago))
+        Sale.objects.filter(pk=sale.pk).update(created_at=start + timezone.timedelta(hours=12))
+
+    def test_smooth_matches_scalar_updates(self):
+        """
+        Ensure the vectorized fold matches step-by-step EWMA updates and skips folded days.
+        """
+        demand = np.array([[3.0, 0.0, 5.0, 1.0], [2.0, 4.0, 4.0, 0.0]])
+        mean, variance = forecasting.smooth(demand, [1.0, np.nan], [0.5, 0.0], [0, 2], 0.2)
+
+        def fold(mean, variance, values):
+            for value in values:
+                diff = value - mean
+                mean += 0.2 * diff
+                variance = 0.8 * (variance + diff * 0.2 * diff)
+            return mean, variance
+
+        np.testing.assert_allclose([mean[0], variance[0]], fold(1.0, 0.5, [3.0, 0.0, 5.0, 1.0]))
+        # Seeded from day 2, then folds day 3.
+        np.testing.assert_allclose([mean[1], variance[1]], fold(4.0, 0.0, [0.0]))
+
+    def test_reorder_points_drive_low_stock(self):
+        """
+        Ensure low_stock flags a fast seller with days of stock left and not a slow mover under 10.
+        """
+        self.assertEqual(
+            [p['name'] for p in self.client.get('/api/products/low_stock/', format='json').data], ['Saffron'],
+        )
+        self.assertEqual(forecasting.update_forecasts(today=self.today), 2)
+
+        self.fast.refresh_from_db()
+        self.slow.refresh_from_db()
+        self.assertEqual(self.slow.reorder_point, 1)
+        # 8 a day over a 7 day lead time, with no variance to cover.
+        self.assertEqual(self.fast.reorder_point, 56)
+        response = self.client.get('/api/products/low_stock/', format='json')
+        self.assertEqual([(p['name'], p['reorder_point']) for p in response.data], [('Milk', 56)])
+        self.assertEqual(self.client.get('/api/sales/dashboard_stats/').data['low_stock_products'], 1)
+
+        forecast = self.client.get(f'/api/products/{self.fast.pk}/forecast/').data
+        self.assertEqual((forecast['velocity'], forecast['std'], forecast['days_of_cover']), (8.0, 0.0, 6.2))
+        self.assertEqual(forecast['through_day'], self.today - timezone.timedelta(days=1))
+        self.assertIsNone(self.client.get(f'/api/products/{self.slow.pk}/forecast/').data['days_of_cover'])
+
+    def test_incremental_update_matches_full_recompute(self):
+        """
+        Ensure folding in one more day reads only that day and ends where a fresh forecast does.
+        """
+        yesterday = self.today - timezone.timedelta(days=1)
+        forecasting.update_forecasts(today=yesterday)
+        self._sell(1, self.fast, 30)
+        self.assertEqual(forecasting.update_forecasts(today=yesterday), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(forecasting.update_forecasts(today=self.today), 2)
+        sale_reads = [q['sql'] for q in queries.captured_queries if 'pos_saleitem' in q['sql']]
+        self.assertEqual(len(sale_reads), 1)
+        incremental = dict(ProductForecast.objects.values_list('product_id', 'velocity'))
+
+        ProductForecast.objects.all().delete()
+        forecasting.update_forecasts(today=self.today)
+        for product_id, velocity in ProductForecast.objects.values_list('product_id', 'velocity'):
+            self.assertAlmostEqual(incremental[product_id], velocity)
+        self.fast.refresh_from_db()
+        self.assertGreater(self.fast.reorder_point, 56)
+
+    def test_update_forecasts_command(self):
+        """
+        Ensure the management command forecasts the named owner's products only.
+        """
+        other = User.objects.create_user(username='user2', password='password123')
+        Product.objects.create(owner=other, name='Other', price=1, stock_quantity=1)
+        out = io.StringIO()
+        call_command('update_forecasts', owner='user1', stdout=out)
+        self.assertIn('updated 2 forecasts', out.getvalue())
+        self.assertEqual(ProductForecast.objects.count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('update_forecasts', owner='nobody', stdout=io.StringIO())
+
+
+@task(name='pos.tests.restock_or_fail', max_attempts=3)
+def restock_or_fail(product_id, failures):
+    """Restocks one unit, after raising on the first ``failures`` attempts."""
+    Product.objects.filter(pk=product_id).update(stock_quantity=models.F('stock_quantity') + 1)
+    restock_or_fail.calls += 1
+    if restock_or_fail.calls <= failures:
+        raise RuntimeError(f"attempt {restock_or_fail.calls} failed")
+
+
+@override_settings(POS_TASK_BACKEND='database')
+class TaskQueueTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.product = Product.objects.create(owner=self.user, name='Tea', price=10, stock_quantity=100)
+        self.client.force_authenticate(user=self.user)
+        restock_or_fail.calls = 0
+
+    def _due_now(self):
+        Task.objects.update(run_at=timezone.now())
+
+    def test_checkout_queues_rollup_for_workers(self):
+        """
+        Ensure checkout only queues the rollup change and a worker applies it once.
+        """
+        data = {"payment_method": "cash", "items": [{"product_id": self.product.id, "quantity": 2}]}
+        for _ in range(3):
+            self.assertEqual(self.client.post('/api/sales/', data, format='json').status_code, 201)
+        Sale.objects.first().delete()
+        self.assertFalse(DailySalesRollup.objects.exists())
+        self.assertEqual(Task.objects.filter(name='pos.rollups.apply_to_rollup').count(), 4)
+
+        out = io.StringIO()
+        call_command('run_workers', burst=True, stdout=out)
+        self.assertIn('Ran 4 task(s); 0 failed.', out.getvalue())
+        rollup = DailySalesRollup.objects.get(owner=self.user, payment_method='cash')
+        self.assertEqual((rollup.sale_count, float(rollup.revenue)), (2, 40.0))
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(self.client.get('/api/sales/dashboard_stats/').data['today_sales'], 2)
+
+    def test_failed_attempts_roll_back_and_retry_with_backoff(self):
+        """
+        Ensure a failing task's writes are undone, retries back off, and it ends failed.
+        """
+        restock_or_fail.enqueue(self.product.pk, 5)
+        self.assertEqual(tasks.work(burst=True), (0, 1))
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('attempt 1 failed', queued.last_error)
+        delay = (queued.run_at - timezone.now()).total_seconds()
+        self.assertTrue(settings.POS_TASK_RETRY_DELAY * 0.9 < delay <= settings.POS_TASK_RETRY_DELAY * 1.25)
+        self.assertEqual(tasks.work(burst=True), (0, 0))  # not due yet
+
+        self._due_now()
+        tasks.work(burst=True)
+        second_delay = (Task.objects.get().run_at - timezone.now()).total_seconds()
+        self.assertGreater(second_delay, delay * 1.5)
+
+        self._due_now()
+        tasks.work(burst=True)
+        failed = Task.objects.get()
+        self.assertEqual((failed.status, failed.attempts), ('failed', 3))
+        self._due_now()
+        self.assertEqual(tasks.work(burst=True), (0, 0))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 100)
+
+    def test_retry_succeeds_once(self):
+        """
+        Ensure a task that fails once applies exactly once on the retry.
+        """
+        restock_or_fail.enqueue(self.product.pk, 1)
+        tasks.work(burst=True)
+        self._due_now()
+        self.assertEqual(tasks.work(burst=True), (1, 0))
+        self.assertFalse(Task.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 101)
+
+    def test_expired_lease_is_taken_over_and_fenced(self):
+        """
+        Ensure a worker that outlives its lease can't complete a task another worker took over.
+        """
+        restock_or_fail.enqueue(self.product.pk, 0)
+        stale = tasks.claim(lease=60)
+        self.assertIsNone(tasks.claim())
+        self._due_now()
+        current = tasks.claim()
+        self.assertEqual(current.attempts, 2)
+
+        self.assertFalse(tasks.run(stale))
+        self.assertTrue(tasks.run(current))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 101)
+
+    def test_enqueue_validation_and_eager_backend(self):
+        """
+        Ensure unknown tasks and non-JSON arguments are refused, and eager runs inline.
+        """
+        with self.assertRaises(LookupError):
+            tasks.enqueue('pos.tests.nothing')
+        with self.assertRaises(TypeError):
+            restock_or_fail.enqueue(self.product.pk, timezone.now())
+        with self.assertRaises(CommandError):
+            call_command('enqueue_task', 'pos.tests.nothing', stdout=io.StringIO())
+
+        call_command('enqueue_task', 'pos.tests.restock_or_fail',
+                     kwargs=json.dumps({'product_id': self.product.pk, 'failures': 0}), stdout=io.StringIO())
+        self.assertEqual(Task.objects.get().payload['kwargs']['failures'], 0)
+        with self.settings(POS_TASK_BACKEND='eager'):
+            self.assertIsNone(restock_or_fail.enqueue(self.product.pk, 0))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 101)
+        self.assertEqual(Task.objects.count(), 1)
+
+
+class AsyncViewTests(APITestCase):
+    """
+    The /api/async/ endpoints must return exactly what their sync versions do.
+    """
+    URLS = [
+        '/api/products/search/?q=tea', '/api/products/low_stock/',
+        '/api/sales/dashboard_stats/', '/api/sales/today_sales/',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        tea = Product.objects.create(owner=self.user, name='Green Tea', category='Drinks', price='2.50', stock_quantity=30)
+        Product.objects.create(owner=self.user, name='Teapot', price='19.99', stock_quantity=1)
+        other = User.objects.create_user(username='user2', password='password123')
+        Product.objects.create(owner=other, name='Black Tea', price=3, stock_quantity=0)
+        checkout(self.user, [{'product_id': tea.id, 'quantity': 2}], 'card')
+        self.client.force_authenticate(user=self.user)
+
+    def _aget(self, url, **headers):
+        headers.setdefault('Authorization', f'Token {self.token.key}')
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def test_payloads_match_sync_endpoints(self):
+        """
+        Ensure each async endpoint returns the sync endpoint's JSON, in both serializer modes.
+        """
+        for fast_mode in (False, True):
+            with self.settings(POS_FAST_SERIALIZERS=fast_mode):
+                for url in self.URLS:
+                    expected = self.client.get(url)
+                    response = self._aget(url.replace('/api/', '/api/async/', 1))
+                    self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+                    self.assertEqual(response.json(), json.loads(expected.content), url)
+                    self.assertIn(response['X-Cache'], ('MISS', 'LOCAL'))
+
+    def test_cache_and_conditional_get(self):
+        """
+        Ensure the async views share the versioned cache, ETags and invalidation.
+        """
+        url = '/api/async/products/low_stock/'
+        first = self._aget(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self._aget(url)['X-Cache'], 'LOCAL')
+        self.assertEqual(self._aget(url, **{'If-None-Match': first['ETag']}).status_code, 304)
+
+        Product.objects.create(owner=self.user, name='Tea Cosy', price=5, stock_quantity=0)
+        response = self._aget(url, **{'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.json()], ['Tea Cosy', 'Teapot'])
+
+    def test_authentication(self):
+        """
+        Ensure the async views accept tokens and sessions and reject everyone else.
+        """
+        url = '/api/async/sales/dashboard_stats/'
+        self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, 401)
+        response = self._aget(url, Authorization='Token nope')
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Token'))
+        self.assertEqual(self._aget(url).json()['today_sales'], 1)
+
+        async_to_sync(self.async_client.alogin)(username='user1', password='password123')
+        self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, 200)
+        self.assertEqual(async_to_sync(self.async_client.post)(url).status_code, 405)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    URL = '/api/products/low_stock/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        Product.objects.create(owner=self.user, name='Teapot', price='19.99', stock_quantity=1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_the_auth_query(self):
+        """
+        Ensure a repeated request resolves its token without touching the database.
+        """
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_200_OK)
+        auth_cache.clear()  # the shared tier alone must be enough
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_and_inactive_user_are_rejected(self):
+        """
+        Ensure cached entries are dropped when the token goes or the user is deactivated.
+        """
+        self.client.get(self.URL)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_200_OK)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = async_to_sync(self.async_client.get)(
+            '/api/async' + self.URL[4:], headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_the_token(self):
+        """
+        Ensure a token is rejected right after logging out through dj_rest_auth.
+        """
+        self.client.get(self.URL)
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(POS_AUTH_SIGNED_TOKENS=True)
+    def test_signed_tokens(self):
+        """
+        Ensure signed tokens authenticate without a token row and stop working after a password change.
+        """
+        signed = self.client.post('/api/auth/signed-token/').json()['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {signed}')
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_200_OK)
+        async_response = async_to_sync(self.async_client.get)(
+            '/api/async' + self.URL[4:], headers={'Authorization': f'Token {signed}'},
+        )
+        self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {signed[:-2]}xx')
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.post(
+            '/api/auth/password/change/', {'new_password1': 'n3w-Passw0rd!x', 'new_password2': 'n3w-Passw0rd!x'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {signed}')
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with self.settings(POS_AUTH_SIGNED_TOKEN_MAX_AGE=-1):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            expired = self.client.post('/api/auth/signed-token/').json()['token']
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {expired}')
+            self.assertEqual(self.client.get(self.URL).json()['detail'], 'Token expired.')
+
+    def test_signed_tokens_off_by_default(self):
+        self.assertEqual(self.client.post('/api/auth/signed-token/').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.user.pk}:forged:signature')
+        self.assertEqual(self.client.get(self.URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        product = Product.objects.create(owner=self.user, name='Tea', price='2.50', stock_quantity=30)
+        checkout(self.user, [{'product_id': product.id, 'quantity': 2}], 'card')
+        self.client.force_authenticate(user=self.user)
+
+    def test_records_time_and_queries_per_view_action(self):
+        """
+        Ensure a request is recorded under its viewset action with its queries, DB and serializer time.
+        """
+        self.assertEqual(self.client.get('/api/sales/today_sales/').status_code, status.HTTP_200_OK)
+        labels = ('SaleViewSet.today_sales', 'GET')
+        count, seconds = metrics.registry.duration.samples(labels)
+        self.assertEqual(count, 1)
+        queries, db_seconds = metrics.registry.queries.samples(labels)[1], metrics.registry.db_time.samples(labels)[1]
+        self.assertGreater(queries, 0)
+        self.assertGreater(db_seconds, 0)
+        self.assertLess(db_seconds, seconds)
+        self.assertEqual(metrics.registry.serializer_time.samples(labels)[0], 1)
+        self.assertEqual(metrics.registry.requests.value('SaleViewSet.today_sales', 'GET', '200'), 1)
+
+        serialized = metrics.registry.serializer_time.samples(labels)[1]
+        self.assertEqual(self.client.get('/api/sales/today_sales/')['X-Cache'], 'LOCAL')
+        self.assertEqual(metrics.registry.duration.samples(labels)[0], 2)
+        # The cached response is served without serializing anything again.
+        self.assertEqual(metrics.registry.serializer_time.samples(labels)[1], serialized)
+
+    def test_async_views_are_measured(self):
+        """
+        Ensure queries the async ORM runs in other threads count towards the request.
+        """
+        response = async_to_sync(self.async_client.get)(
+            '/api/async/sales/dashboard_stats/', headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(metrics.registry.queries.samples(('pos.async_views.dashboard_stats', 'GET'))[1], 0)
+
+    def test_duplicate_queries(self):
+        """
+        Ensure SQL repeated within a request is counted as duplicates, whatever its parameters.
+        """
+        token = metrics.start_profile()
+        try:
+            for product in Product.objects.all():
+                list(SaleItem.objects.filter(product=product))
+                list(SaleItem.objects.filter(product_id=product.pk + 1))
+        finally:
+            profile = metrics.end_profile(token)
+        self.assertEqual(profile.queries, 3)
+        self.assertEqual(profile.duplicate_queries, 1)
+        self.assertIsNone(metrics.current_profile())
+
+    def test_metrics_endpoint(self):
+        """
+        Ensure /api/metrics/ serves the Prometheus text format to staff or the scrape token only.
+        """
+        self.client.get('/api/sales/today_sales/')
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.login(username='user1', password='password123')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.logout()
+
+        with self.settings(POS_METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE pos_request_duration_seconds histogram', body)
+        self.assertIn('pos_request_duration_seconds_bucket{view="SaleViewSet.today_sales",method="GET",le="+Inf"} 1', body)
+        self.assertIn('pos_requests_total{view="SaleViewSet.today_sales",method="GET",status="200"} 1', body)
+
+        User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.login(username='admin', password='password123')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_200_OK)
+
+    @override_settings(POS_SLOW_REQUEST_MS=0.001)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        """
+        Ensure requests over POS_SLOW_REQUEST_MS are logged with the queries they ran.
+        """
+        with self.assertLogs('pos.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/sales/today_sales/')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('(SaleViewSet.today_sales)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(POS_SLOW_REQUEST_MS=0.001)
+    def test_slow_request_log_leaves_out_query_parameters(self):
+        """
+        Ensure the slow-request log shows the SQL but not its parameters, such as the token key.
+        """
+        self.client.force_authenticate(user=None)
+        auth_cache.clear()
+        with self.assertLogs('pos.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/sales/today_sales/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertIn('authtoken_token', logs.output[0])
+        self.assertNotIn(self.token.key, logs.output[0])
+
+
+@skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "The load generator's threads need a file-backed SQLite database or PostgreSQL.",
+)
+class LoadTestCommandTests(TransactionTestCase):
+    def test_loadtest_drives_wsgi_and_asgi(self):
+        """
+        Ensure the harness runs requests through both handlers and reports on them.
+        """
+        User.objects.create_user(username='bench', password='password123')
+        out = io.StringIO()
+        call_command('loadtest', '/api/sales/dashboard_stats/', '/api/async/sales/dashboard_stats/',
+                     user='bench', requests=12, concurrency=3, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual([(r['interface'], r['url']) for r in results], [
+            ('wsgi', '/api/sales/dashboard_stats/'), ('wsgi', '/api/async/sales/dashboard_stats/'),
+            ('asgi', '/api/sales/dashboard_stats/'), ('asgi', '/api/async/sales/dashboard_stats/'),
+        ])
+        for result in results:
+            self.assertEqual(result['statuses'], {'200': 12})
+            self.assertGreaterEqual(result['connections_opened'], 0)
+            self.assertGreater(result['requests_per_second'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class SaleTotalsTests(APITestCase):
+    """
+    The line, unit, cost and margin totals stored on each sale.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.tea = Product.objects.create(
+            owner=self.user, name='Tea', price='10.00', cost_price='6.50', stock_quantity=100,
+        )
+        self.bun = Product.objects.create(
+            owner=self.user, name='Bun', price='4.00', cost_price='1.00', stock_quantity=100,
+        )
+        self.loose = Product.objects.create(owner=self.user, name='Loose', price='3.00', stock_quantity=100)
+
+    def _totals(self, sale):
+        sale.refresh_from_db()
+        return sale.line_count, sale.unit_count, sale.cost_total, sale.gross_margin
+
+    def test_checkout_stores_totals(self):
+        """
+        Ensure single and batch checkouts record counts, cost and margin, with the unit costs sold at.
+        """
+        sale = checkout(self.user, [{'product_id': self.tea.id, 'quantity': 2}, {'product_id': self.bun.id, 'quantity': 3}], 'cash')
+        self.assertEqual(self._totals(sale), (2, 5, Decimal('16.00'), Decimal('16.00')))
+        self.assertEqual(sorted(sale.items.values_list('unit_cost', flat=True)), [Decimal('1.00'), Decimal('6.50')])
+
+        [result] = checkout_batch(self.user, [
+            {'idempotency_key': 'k1', 'payment_method': 'card', 'items': [{'product_id': self.tea.id, 'quantity': 1}]},
+        ])
+        self.assertEqual(result['status'], 'created')
+        batched = Sale.objects.get(pk=result['sale_id'])
+        self.assertEqual(self._totals(batched), (1, 1, Decimal('6.50'), Decimal('3.50')))
+
+        # A line of unknown cost leaves the sale's cost and margin unknown.
+        sale = checkout(self.user, [{'product_id': self.tea.id, 'quantity': 1}, {'product_id': self.loose.id, 'quantity': 1}], 'cash')
+        self.assertEqual(self._totals(sale), (2, 2, None, None))
+
+        self.client.force_authenticate(user=self.user)
+        data = self.client.get(f'/api/sales/{sale.pk}/').data
+        self.assertEqual((data['line_count'], data['unit_count'], data['gross_margin']), (2, 2, None))
+
+    def test_backfill(self):
+        """
+        Ensure the backfill fills sales recorded before the totals, optionally costing them at today's cost.
+        """
+        sale = checkout(self.user, [{'product_id': self.tea.id, 'quantity': 2}, {'product_id': self.bun.id, 'quantity': 3}], 'cash')
+        Sale.objects.update(line_count=0, unit_count=0, cost_total=None, gross_margin=None)
+        SaleItem.objects.update(unit_cost=None)
+
+        self.assertEqual(backfill_sale_totals(chunk_size=1), 1)
+        self.assertEqual(self._totals(sale), (2, 5, None, None))
+        self.assertEqual(backfill_sale_totals(), 0)
+
+        out = io.StringIO()
+        call_command('backfill_sale_totals', owner='user1', all=True, assume_current_cost=True, stdout=out)
+        self.assertIn('Successfully backfilled 1 sales!', out.getvalue())
+        self.assertEqual(self._totals(sale), (2, 5, Decimal('16.00'), Decimal('16.00')))
+        with self.assertRaises(CommandError):
+            call_command('backfill_sale_totals', owner='nobody', stdout=io.StringIO())
+
+    def test_basket_analytics(self):
+        """
+        Ensure basket sizes cover every sale and the margin only those with a known cost.
+        """
+        checkout(self.user, [{'product_id': self.tea.id, 'quantity': 2}, {'product_id': self.bun.id, 'quantity': 3}], 'cash')
+        checkout(self.user, [{'product_id': self.loose.id, 'quantity': 1}], 'card')
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/analytics/baskets/').data
+        self.assertFalse([q for q in queries.captured_queries if 'pos_saleitem' in q['sql']])
+        self.assertEqual(data, {
+            'sales': 2, 'average_lines': 1.5, 'average_units': 3.0, 'average_value': '17.50',
+            'costed_sales': 1, 'cost': '16.00', 'gross_margin': '16.00', 'margin_rate': 0.5,
+        })
+        self.assertEqual(self.client.get('/api/analytics/').data['baskets'], data)
+
+
+class SalesArchiveTests(APITestCase):
+    """
+    archive_sales and the range reads routed over the live and archived sales.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.tea = Product.objects.create(
+            owner=self.user, name='Tea', category='Drinks', price='10.00', cost_price='6.00', stock_quantity=100,
+        )
+        self.bun = Product.objects.create(owner=self.user, name='Bun', category='Bakery', price='4.00', stock_quantity=100)
+        self.today = timezone.localdate()
+        self.old_day = archive.add_months(self.today, -3) + timezone.timedelta(days=9)
+        self.old = [
+            self._sell(self.old_day, [(self.tea, 2), (self.bun, 1)], 'cash'),
+            self._sell(self.old_day, [(self.tea, 1)], 'card'),
+        ]
+        self.recent = checkout(self.user, [{'product_id': self.bun.id, 'quantity': 3}], 'upi')
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.client.force_authenticate(user=self.user)
+        self.range = f'from={self.old_day.isoformat()}&to={self.today.isoformat()}'
+
+    def _sell(self, day, lines, payment_method):
+        sale = checkout(self.user, [{'product_id': p.id, 'quantity': q} for p, q in lines], payment_method)
+        Sale.objects.filter(pk=sale.pk).update(created_at=day_bounds(day)[0] + timezone.timedelta(hours=9))
+        return sale
+
+    def _reads(self):
+        analytics = {
+            name: self.client.get(f'/api/analytics/{name}/?{self.range}').data
+            for name in ['top_products', 'category_mix', 'baskets']
+        }
+        revenue = self.client.get(
+            f'/api/analytics/revenue/?from={self.old_day.isoformat()}&to={self.old_day.isoformat()}&bucket=hour'
+        ).data['series']
+        export = b''.join(self.client.get(f'/api/sales/export/?{self.range}').streaming_content).decode()
+        units = sorted(forecasting._daily_units([self.tea.id, self.bun.id], self.old_day, 1))
+        rollups = sorted(DailySalesRollup.objects.values_list('day', 'payment_method', 'sale_count', 'revenue'))
+        return analytics, revenue, export, units, rollups
+
+    def _archive(self, **options):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_sales', keep_months=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_archive_to_tables_is_transparent_to_range_reads(self):
+        """
+        Ensure archived months leave the live tables but range reads, rollups and the ledger don't change.
+        """
+        before = self._reads()
+        self.assertEqual([(p['name'], p['quantity']) for p in before[0]['top_products']], [('Tea', 3), ('Bun', 4)])
+        self.assertEqual(sum(point['sales'] for point in before[1]), 2)
+        self.assertEqual(len(before[2].splitlines()), 5)
+        self.assertIn('Successfully archived 2 sales from 1 months!', self._archive())
+
+        self.assertEqual(list(Sale.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(sorted(ArchivedSale.objects.values_list('pk', flat=True)), [sale.pk for sale in self.old])
+        self.assertEqual(ArchivedSaleItem.objects.count(), 3)
+        archived = ArchivedSale.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.line_count, archived.unit_count, archived.cost_total), (2, 3, None))
+        period = ArchivedPeriod.objects.get()
+        self.assertEqual((period.month, period.storage, period.sale_count), (self.old_day.replace(day=1), 'table', 2))
+        self.assertEqual(StockMovement.objects.filter(kind='sale', sale__isnull=True).count(), 3)
+        self.assertEqual(ledger.verify_ledger(Product.objects.all()), [])
+
+        self.assertEqual(self._reads(), before)
+        self.assertEqual(len(self.client.get('/api/sales/').data['results']), 1)
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.assertEqual(self._reads()[4], before[4])
+
+        # A range after the archived months doesn't touch the archive tables.
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/analytics/baskets/?from={self.today.isoformat()}')
+        self.assertFalse([q for q in queries.captured_queries if 'pos_archivedsale' in q['sql']])
+
+        self.assertIn('Successfully archived 0 sales from 0 months!', self._archive())
+
+    def test_archive_to_files(self):
+        """
+        Ensure months archived to files hold every sale with its items and keep their rollups.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rollups = self._reads()[4]
+        self._archive(to='file', directory=directory)
+
+        period = ArchivedPeriod.objects.get()
+        self.assertEqual(period.storage, 'file')
+        [path] = archive.month_files(period)
+        self.assertEqual(path.name, f'sales-{self.old_day:%Y-%m}.ndjson.gz')
+        sales = list(archive.read_archive_file(path))
+        self.assertEqual([sale['id'] for sale in sales], [sale.pk for sale in self.old])
+        self.assertEqual(
+            [(item['product_id'], item['quantity'], item['unit_cost']) for item in sales[0]['items']],
+            [(self.tea.id, 2, '6.00'), (self.bun.id, 1, None)],
+        )
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertFalse(ArchivedSale.objects.exists())
+
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.assertEqual(self._reads()[4], rollups)
+
+        # More sales in that month go to a second file, never to the tables.
+        self._sell(self.old_day, [(self.bun, 1)], 'cash')
+        with self.assertRaises(CommandError):
+            self._archive()
+        self._archive(to='file', directory=directory)
+        self.assertEqual(len(archive.month_files(period)), 2)
+        period.refresh_from_db()
+        self.assertEqual(period.sale_count, 3)
+
+
+class LoadDataTests(TestCase):
+    """
+    generate_load_data and bench, at a small scale, and load_sample_data.
+    """
+
+    def test_sample_data_loads_for_several_owners(self):
+        """
+        Ensure each owner gets their own sample catalog, and reloading replaces it.
+        """
+        owners = [User.objects.create_user(username=f'shop{n}', password='password123') for n in range(2)]
+        for owner in owners + owners[:1]:
+            call_command('load_sample_data', owner=owner.username, stdout=io.StringIO())
+        for owner in owners:
+            self.assertEqual(Product.objects.filter(owner=owner).count(), 10)
+        self.assertEqual(Product.objects.get(owner=owners[0], name='Dove Soap').barcode, f'{owners[0].pk}-1234567890129')
+
+    def test_generated_data_is_consistent_and_skewed(self):
+        """
+        Ensure the generator's sales follow the trading day and Zipf popularity, and its side tables add up.
+        """
+        call_command('generate_load_data', owners=2, products=40, sales=400, days=14, seed=7, stdout=io.StringIO())
+        owners = User.objects.filter(username__startswith='load-')
+        self.assertEqual(owners.count(), 2)
+        self.assertEqual(Product.objects.filter(owner__in=owners).count(), 80)
+        sales = Sale.objects.filter(owner=owners[0])
+        self.assertEqual(sales.count(), 400)
+
+        hours = {timezone.localtime(created).hour for created in sales.values_list('created_at', flat=True)}
+        self.assertFalse(hours & {0, 1, 2, 3, 4, 5, 6, 23})
+        self.assertLessEqual(sales.order_by('-created_at').first().created_at, timezone.now())
+        self.assertGreater(sales.order_by('created_at').first().created_at, timezone.now() - timezone.timedelta(days=14))
+
+        units = sorted(
+            SaleItem.objects.filter(sale__owner=owners[0]).values('product').annotate(units=models.Sum('quantity'))
+            .values_list('units', flat=True), reverse=True,
+        )
+        # Zipf with s=1.1 over 40 products: the top 4 sell about half the units; uniform would be a tenth.
+        self.assertGreater(sum(units[:4]) / sum(units), 0.35)
+
+        for sale in sales.prefetch_related('items')[:20]:
+            self.assertEqual(sale.total_amount, sum(item.total_price for item in sale.items.all()))
+        self.assertEqual(ledger.verify_ledger(Product.objects.filter(owner__in=owners)), [])
+        self.assertEqual(DailySalesRollup.objects.filter(owner=owners[0]).aggregate(n=models.Sum('sale_count'))['n'], 400)
+        self.assertEqual(ProductForecast.objects.filter(product__owner__in=owners).count(), 80)
+        self.assertEqual(
+            set(Product.objects.filter(owner__in=owners).values_list('created_at', flat=True)),
+            {day_bounds(timezone.localdate() - timezone.timedelta(days=14))[0]},
+        )
+        # The backdating must not leak into ordinary saves.
+        self.assertTrue(Sale._meta.get_field('created_at').auto_now_add)
+        self.assertTrue(Product._meta.get_field('created_at').auto_now_add)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', owners=1, products=1, sales=1, stdout=io.StringIO())
+
+    def test_bench_writes_comparable_json(self):
+        """
+        Ensure bench times each case and its JSON report can be compared with an earlier one.
+        """
+        call_command('generate_load_data', products=30, sales=200, days=3, stdout=io.StringIO())
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = os.path.join(directory, 'baseline.json')
+        call_command('bench', iterations=3, warmup=1, output=baseline, stdout=io.StringIO())
+        with open(baseline) as f:
+            report = json.load(f)
+        self.assertEqual(report['scale']['products'], 30)
+        self.assertEqual(
+            [(result['case'], result['mode']) for result in report['results']],
+            [('search', 'cold'), ('search', 'warm'), ('today_sales', 'cold'), ('today_sales', 'warm'),
+             ('dashboard_stats', 'cold'), ('dashboard_stats', 'warm'), ('sale_create', 'write')],
+        )
+        for result in report['results']:
+            self.assertEqual(result['errors'], 0, result)
+            self.assertEqual(result['requests'], 3)
+        self.assertEqual(report['results'][1]['queries'], 0)  # warm search is served from the cache
+        self.assertEqual(Sale.objects.filter(owner__username='load-0').count(), 204)
+
+        out = io.StringIO()
+        call_command('bench', case=['dashboard_stats'], iterations=2, warmup=0,
+                     output=os.path.join(directory, 'after.json'), compare=baseline, stdout=out)
+        self.assertIn('dashboard_stats  cold', out.getvalue())
+
+
+@benchmark
+class PaginationBenchmark(APITestCase):
+    """
+    Compare page-1000 latency for page-number vs cursor pagination on sales.
+    """
+    PAGE = 1000
+    PAGE_SIZE = 20
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bench', password='password123')
+        start = timezone.now()
+        total = (self.PAGE + 1) * self.PAGE_SIZE
+        Sale.objects.bulk_create([
+            Sale(owner=self.user, total_amount=1.00, payment_method='cash', receipt_number=f'RCP{i}',
+                 created_at=start - timezone.timedelta(seconds=i))
+            for i in range(total)
+        ], batch_size=2000)
+        self.client.force_authenticate(user=self.user)
+
+    def _time(self, url, runs=20):
+        timings = []
+        for _ in range(runs):
+            read_cache.local.clear()
+            caches['default'].clear()
+            started = time.perf_counter()
+            response = self.client.get(url, format='json')
+            timings.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(timings)[len(timings) // 2], response
+
+    def test_page_1000_latency(self):
+        with mock.patch.object(SaleViewSet, 'pagination_class', PageNumberPagination):
+            offset_time, offset_response = self._time(f'/api/sales/?page={self.PAGE}')
+
+        # Build the cursor a client would hold after reading 999 pages.
+        boundary = Sale.objects.order_by('-created_at', '-id')[(self.PAGE - 1) * self.PAGE_SIZE - 1]
+        paginator = SaleCursorPagination()
+        paginator.base_url = 'http://testserver/api/sales/'
+        paginator.cursor_query_param = 'cursor'
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(boundary.created_at)))
+        cursor_time, cursor_response = self._time(url)
+
+        self.assertEqual(
+            [s['id'] for s in cursor_response.data['results']],
+            [s['id'] for s in offset_response.data['results']],
+        )
+        print(f"\npage {self.PAGE}: page-number {offset_time * 1000:.1f}ms, cursor {cursor_time * 1000:.1f}ms")
+
+
+@benchmark
+class SearchBenchmark(APITestCase):
+    """
+    Time catalog search over a 100k-SKU catalog against the old icontains scan.
+    """
+    CATALOG = 100_000
+    WORDS = ['Amul', 'Tata', 'Parle', 'Britannia', 'Maggi', 'Dove', 'Colgate', 'Lays', 'Sunfeast', 'Haldiram']
+    KINDS = ['Milk', 'Tea', 'Biscuits', 'Bread', 'Noodles', 'Soap', 'Toothpaste', 'Chips', 'Namkeen', 'Juice']
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bench', password='password123')
+        Product.objects.bulk_create([
+            Product(
+                owner=self.user,
+                name=f'{self.WORDS[i % 10]} {self.KINDS[(i // 10) % 10]} {i}',
+                category=self.KINDS[(i // 10) % 10],
+                price=10.00,
+                barcode=f'890{i:010}',
+            )
+            for i in range(self.CATALOG)
+        ], batch_size=5000)
+        self.client.force_authenticate(user=self.user)
+
+    def _median_ms(self, url, runs=15):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            self.client.get(url, format='json')
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[runs // 2] * 1000
+
+    def test_search_100k_catalog(self):
+        queries = {'barcode': '8900000054321', 'prefix': 'Britannia', 'substring': 'oodles 4242', 'short': 'Ta'}
+        print(f"\nsearch over {self.CATALOG} SKUs ({connection.vendor}):")
+        for label, query in queries.items():
+            indexed = self._median_ms(f'/api/products/search/?q={query}')
+            started = time.perf_counter()
+            list(Product.objects.filter(owner=self.user).filter(
+                models.Q(name__icontains=query) | models.Q(barcode__icontains=query)
+            ))
+            scan = (time.perf_counter() - started) * 1000
+            print(f"  {label:<10} indexed endpoint {indexed:7.2f}ms   old icontains query alone {scan:7.2f}ms")
+
+
+@benchmark
+class BarcodeCacheBenchmark(APITestCase):
+    """
+    Measure warm-cache barcode resolution latency (target: p99 under 1ms).
+    """
+    SKUS = 5000
+    LOOKUPS = 20000
+
+    def setUp(self):
+        barcode_cache.clear()
+        self.user = User.objects.create_user(username='bench', password='password123')
+        Product.objects.bulk_create([
+            Product(owner=self.user, name=f'SKU {i}', price=10.00, barcode=f'890{i:010}') for i in range(self.SKUS)
+        ], batch_size=2000)
+        self.client.force_authenticate(user=self.user)
+
+    @staticmethod
+    def _p99_ms(timings):
+        return sorted(timings)[int(len(timings) * 0.99)] * 1000
+
+    def test_warm_lookup_latency(self):
+        barcodes = [f'890{i:010}' for i in range(self.SKUS)]
+        for code in barcodes:
+            self.client.get(f'/api/products/by-barcode/{code}/')
+
+        timings = []
+        for i in range(self.LOOKUPS):
+            started = time.perf_counter()
+            payload = barcode_cache.lookup(self.user.pk, barcodes[i % self.SKUS])
+            timings.append(time.perf_counter() - started)
+            self.assertIsNotNone(payload)
+        cache_p99 = self._p99_ms(timings)
+
+        timings = []
+        for i in range(2000):
+            started = time.perf_counter()
+            self.client.get(f'/api/products/by-barcode/{barcodes[i % self.SKUS]}/')
+            timings.append(time.perf_counter() - started)
+
+        print(f"\nwarm barcode cache p99 {cache_p99:.4f}ms, endpoint p99 {self._p99_ms(timings):.3f}ms, "
+              f"stats {barcode_cache.stats()}")
+        self.assertLess(cache_p99, 1.0)
+
+
+@benchmark
+class BatchIngestionBenchmark(APITestCase):
+    """
+    Compare sales/second for replaying a queue one POST at a time vs /api/sales/batch/.
+    """
+    SALES = 500
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bench', password='password123')
+        self.products = [
+            Product.objects.create(owner=self.user, name=f'SKU {i}', price=10.00, stock_quantity=10 ** 6)
+            for i in range(50)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def _queue(self, prefix):
+        return [
+            {"idempotency_key": f"{prefix}-{i}", "payment_method": "cash",
+             "items": [{"product_id": self.products[(i + j) % 50].id, "quantity": 1} for j in range(3)]}
+            for i in range(self.SALES)
+        ]
+
+    def test_batch_vs_single_throughput(self):
+        started = time.perf_counter()
+        for sale in self._queue('single'):
+            self.client.post('/api/sales/', sale, format='json')
+        single = self.SALES / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        response = self.client.post('/api/sales/batch/', {"sales": self._queue('batch')}, format='json')
+        batch = self.SALES / (time.perf_counter() - started)
+
+        self.assertTrue(all(r['status'] == 'created' for r in response.data['results']))
+        print(f"\n{self.SALES} sales: single POSTs {single:.0f} sales/s, batch {batch:.0f} sales/s "
+              f"({batch / single:.1f}x)")
+
+
+@benchmark
+@skipUnless(os.path.exists('/proc/self/statm'), "Reads resident memory from /proc.")
+class SalesExportBenchmark(TestCase):
+    """
+    Stream 1M sale items and check resident memory stays under a fixed ceiling.
+    """
+    SALES = 200_000
+    LINES = 5
+    RSS_CEILING_MB = 64
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='password123')
+        products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'SKU {i}', price='2.50', barcode=f'EXP{i}') for i in range(cls.LINES)
+        ])
+        now = timezone.now()
+        for offset in range(0, cls.SALES, 10_000):
+            sales = Sale.objects.bulk_create([
+                Sale(owner=cls.user, total_amount='12.50', payment_method='cash',
+                     receipt_number=f'RCP{i}', created_at=now - timezone.timedelta(seconds=i))
+                for i in range(offset, offset + 10_000)
+            ])
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sale, product=product, quantity=1, unit_price='2.50', total_price='2.50')
+                for sale in sales for product in products
+            ], batch_size=10_000)
+
+    @staticmethod
+    def _rss_mb():
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+    def test_export_1m_items_in_constant_memory(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        start = (timezone.localdate() - timezone.timedelta(days=7)).isoformat()
+        baseline = self._rss_mb()
+        peak = baseline
+        lines = 0
+        started = time.perf_counter()
+        response = client.get(f'/api/sales/export/?from={start}')
+        for chunk in response.streaming_content:
+            lines += 1
+            if lines % 10_000 == 0:
+                peak = max(peak, self._rss_mb())
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(lines, self.SALES * self.LINES + 1)
+        print(f"\nexported {lines - 1:,} items in {elapsed:.1f}s, RSS {baseline:.0f}MB -> peak {peak:.0f}MB")
+        self.assertLess(peak - baseline, self.RSS_CEILING_MB)
+
+
+@benchmark
+class AnalyticsBenchmark(TestCase):
+    """
+    Time the analytics endpoints over a year of sales (target: well under a second each).
+    """
+    SALES = 100_000
+    LINES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='password123')
+        products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'SKU {i}', category=f'Category {i % 12}', price='2.50', barcode=f'AN{i}')
+            for i in range(500)
+        ])
+        now = timezone.now()
+        step = 365 * 24 * 3600 // cls.SALES
+        for offset in range(0, cls.SALES, 10_000):
+            sales = Sale.objects.bulk_create([
+                Sale(owner=cls.user, total_amount='7.50', payment_method=('cash', 'card', 'upi')[i % 3],
+                     receipt_number=f'RCP{i}')
+                for i in range(offset, offset + 10_000)
+            ])
+            # bulk_create stamps them all "now"; spread them over the year afterwards.
+            for i, sale in enumerate(sales, start=offset):
+                sale.created_at = now - timezone.timedelta(seconds=i * step)
+            Sale.objects.bulk_update(sales, ['created_at'], batch_size=1000)
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sale, product=products[(sale.pk * 7 + line) % len(products)],
+                         quantity=1, unit_price='2.50', total_price='2.50')
+                for sale in sales for line in range(cls.LINES)
+            ], batch_size=10_000)
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+
+    def test_year_of_sales(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        today = timezone.localdate()
+        year = f'from={today - timezone.timedelta(days=364)}&to={today}'
+        quarter = f'from={today - timezone.timedelta(days=90)}&to={today}'
+        timings = {}
+        for name, url in [
+            ('daily', f'/api/analytics/revenue/?{year}'),
+            ('weekly', f'/api/analytics/revenue/?{year}&bucket=week'),
+            ('hourly (90 days)', f'/api/analytics/revenue/?{quarter}&bucket=hour'),
+            ('top products', f'/api/analytics/top_products/?{year}'),
+            ('category mix', f'/api/analytics/category_mix/?{year}'),
+            ('payment mix', f'/api/analytics/payment_mix/?{year}'),
+        ]:
+            read_cache.local.clear()
+            caches['default'].clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            timings[name] = time.perf_counter() - started
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        print('\n' + ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items()))
+        self.assertLess(max(timings.values()), 1.0)
+
+
+@benchmark
+class FastSerializationBenchmark(TestCase):
+    """
+    Compare rows/second for the DRF serializers vs the fast serializers.
+    """
+    PRODUCTS = 5000
+    SALES = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='password123')
+        Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'SKU {i}', price='9.99', stock_quantity=i, barcode=f'890{i:010}')
+            for i in range(cls.PRODUCTS)
+        ], batch_size=2000)
+        products = list(Product.objects.filter(owner=cls.user)[:3])
+        sales = Sale.objects.bulk_create([
+            Sale(owner=cls.user, total_amount='29.97', payment_method='cash', receipt_number=f'RCP{i}')
+            for i in range(cls.SALES)
+        ], batch_size=2000)
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=product, quantity=1, unit_price='9.99', total_price='9.99')
+            for sale in sales for product in products
+        ], batch_size=2000)
+
+    @staticmethod
+    def _rate(rows, serialize, renderer):
+        started = time.perf_counter()
+        body = renderer.render(serialize())
+        return rows / (time.perf_counter() - started), body
+
+    def _compare(self, label, rows, queryset, serializer_class):
+        fast = compile_serializer(serializer_class)
+        slow_rate, slow_body = self._rate(
+            rows, lambda: serializer_class(list(queryset), many=True).data, JSONRenderer())
+        fast_rate, fast_body = self._rate(
+            rows, lambda: fast.serialize(queryset.prefetch_related(None)), FastJSONRenderer())
+        self.assertEqual(fast_body, slow_body)
+        print(f"\n{label}: serializer {slow_rate:,.0f} rows/s, fast {fast_rate:,.0f} rows/s "
+              f"({fast_rate / slow_rate:.1f}x)")
+
+    def test_products(self):
+        self._compare('products', self.PRODUCTS, Product.objects.filter(owner=self.user), ProductSerializer)
+
+    def test_sales(self):
+        self._compare('sales', self.SALES, with_sale_items(Sale.objects.filter(owner=self.user)), SaleSerializer)
+
+
+@benchmark
+class ForecastingBenchmark(TestCase):
+    """
+    Time forecasting 50k SKUs over a year of daily demand (target: a few seconds).
+    """
+    SKUS = 50_000
+    DAYS = 365
+
+    def test_smooth_year_of_demand(self):
+        rng = np.random.default_rng(0)
+        demand = rng.poisson(rng.gamma(0.5, 4.0, size=(self.SKUS, 1)), size=(self.SKUS, self.DAYS)).astype(np.float64)
+        started = time.perf_counter()
+        mean, variance = forecasting.smooth(
+            demand, np.full(self.SKUS, np.nan), np.zeros(self.SKUS), np.zeros(self.SKUS, dtype=np.int64), 0.1,
+        )
+        points = forecasting.reorder_points(mean, variance, 7, 1.65)
+        elapsed = time.perf_counter() - started
+        print(f"\nsmoothed {self.SKUS:,} SKUs x {self.DAYS} days in {elapsed:.2f}s")
+        self.assertEqual(points.shape, (self.SKUS,))
+        self.assertLess(elapsed, 5.0)
+
+    def test_update_forecasts(self):
+        user = User.objects.create_user(username='bench', password='password123')
+        products = Product.objects.bulk_create([
+            Product(owner=user, name=f'SKU {i}', price='1.00', stock_quantity=100, barcode=f'FC{i}')
+            for i in range(self.SKUS)
+        ], batch_size=5000)
+        now = timezone.now()
+        Product.objects.filter(owner=user).update(created_at=now - timezone.timedelta(days=self.DAYS + 1))
+        sales = Sale.objects.bulk_create([
+            Sale(owner=user, total_amount='1.00', payment_method='cash', receipt_number=f'RCP{i}')
+            for i in range(20_000)
+        ], batch_size=5000)
+        for i, sale in enumerate(sales):
+            sale.created_at = now - timezone.timedelta(days=1 + i % self.DAYS)
+        Sale.objects.bulk_update(sales, ['created_at'], batch_size=1000)
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=products[(sale.pk * 31 + line) % self.SKUS],
+                     quantity=1 + line, unit_price='1.00', total_price='1.00')
+            for sale in sales for line in range(10)
+        ], batch_size=10_000)
+
+        started = time.perf_counter()
+        updated = forecasting.update_forecasts(history_days=self.DAYS)
+        elapsed = time.perf_counter() - started
+        print(f"\nforecast {updated:,} products from {len(sales) * 10:,} sale lines in {elapsed:.2f}s")
+        self.assertEqual(updated, self.SKUS)
+
+        started = time.perf_counter()
+        forecasting.update_forecasts(history_days=self.DAYS)
+        print(f"nothing new to fold: {time.perf_counter() - started:.2f}s")
+
+
+@benchmark
+class CheckoutLatencyBenchmark(APITestCase):
+    """
+    Compare checkout latency with the rollup applied inline vs queued for the
+    workers. SQLite serializes all writers, so the gain there is small; on
+    PostgreSQL queued rollups also stop concurrent tills of one owner waiting
+    on the same rollup row lock.
+    """
+    CHECKOUTS = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='password123')
+        cls.products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'SKU {i}', price='2.50', stock_quantity=100_000, barcode=f'CL{i}')
+            for i in range(50)
+        ])
+
+    def _latencies(self):
+        self.client.force_authenticate(user=self.user)
+        latencies = []
+        for i in range(self.CHECKOUTS):
+            data = {"payment_method": ('cash', 'card')[i % 2], "items": [
+                {"product_id": self.products[(i + line) % 50].id, "quantity": 1} for line in range(3)
+            ]}
+            started = time.perf_counter()
+            response = self.client.post('/api/sales/', data, format='json')
+            latencies.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return np.array(latencies) * 1000
+
+    def test_checkout_p99(self):
+        self._latencies()  # warm up
+        inline = self._latencies()
+        with self.settings(POS_TASK_BACKEND='database'):
+            queued = self._latencies()
+        started = time.perf_counter()
+        succeeded, _ = tasks.work(burst=True)
+        drained = time.perf_counter() - started
+        for label, latencies in [('inline rollups', inline), ('queued rollups', queued)]:
+            print(f"\n{label}: p50 {np.percentile(latencies, 50):.2f}ms, p99 {np.percentile(latencies, 99):.2f}ms")
+        print(f"workers drained {succeeded} tasks in {drained:.2f}s")
+        self.assertEqual(succeeded, self.CHECKOUTS)
+
+
+@benchmark
+@skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "The load generator's threads need a file-backed SQLite database or PostgreSQL.",
+)
+class ConnectionReuseBenchmark(TransactionTestCase):
+    """
+    Serve the same uncached reads from 8 WSGI threads with a new connection
+    per request (CONN_MAX_AGE=0) and with persistent connections. Opening a
+    SQLite file is cheap; a PostgreSQL connection adds a TCP, TLS and auth
+    handshake to every request, which persistent connections (or DB_POOL)
+    take off all but the first.
+    """
+    REQUESTS = 1000
+    CONCURRENCY = 8
+
+    def test_persistent_connections(self):
+        user = User.objects.create_user(username='bench', password='password123')
+        token = Token.objects.create(user=user)
+        Product.objects.bulk_create([
+            Product(owner=user, name=f'SKU {i}', price='2.50', stock_quantity=i % 20) for i in range(200)
+        ])
+        results = {}
+        for max_age in (0, 60):
+            with mock.patch.dict(connections.settings['default'], CONN_MAX_AGE=max_age):
+                results[max_age] = run_wsgi(
+                    ['/api/products/low_stock/'], self.REQUESTS, self.CONCURRENCY,
+                    headers={'Authorization': f'Token {token.key}'},
+                    before_request=lambda: read_cache.bump(user.pk, 'products'),
+                )
+        for max_age, result in results.items():
+            print(f"\nCONN_MAX_AGE={max_age}: {result['requests_per_second']} req/s, p50 {result['p50_ms']}ms, "
+                  f"p99 {result['p99_ms']}ms, {result['connections_opened']} connections opened")
+        self.assertGreater(results[0]['connections_opened'], self.REQUESTS - self.CONCURRENCY)
+        self.assertLessEqual(results[60]['connections_opened'], self.CONCURRENCY)
+
+
+class IndexUsageTests(TestCase):
+    """
+    Ensure the owner-scoped hot queries are answered from the composite indexes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        product = Product.objects.create(owner=self.user, name='Tea', price=10.00, stock_quantity=5)
+        sale = Sale.objects.create(owner=self.user, total_amount=10.00, payment_method='cash', receipt_number='RCP1')
+        SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price)
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan; make the planner show its index choice.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan, "ordering should come from the index")
+        return plan
+
+    def test_todays_sales_use_owner_created_index(self):
+        start, end = day_bounds(timezone.localdate())
+        queryset = Sale.objects.filter(owner=self.user, created_at__gte=start, created_at__lt=end)
+        self.assertUsesIndex(queryset, 'pos_sale_owner_created_idx')
+
+    def test_product_listing_uses_owner_name_index(self):
+        self.assertUsesIndex(Product.objects.filter(owner=self.user), 'pos_product_owner_name_idx')
+
+    def test_low_stock_uses_owner_reorder_index(self):
+        queryset = forecasting.below_reorder_point(Product.objects.filter(owner=self.user)).order_by()
+        self.assertUsesIndex(queryset, 'pos_product_owner_reorder_idx')
+
+    def test_dashboard_low_stock_count_uses_owner_reorder_index(self):
+        queryset, aggregates = dashboard_aggregates(self.user)[-1]
+        self.assertEqual(list(aggregates), ['low_stock_products'])
+        self.assertUsesIndex(queryset.order_by(), 'pos_product_owner_reorder_idx')
+
+    def test_movements_since_snapshot_use_product_id_index(self):
+        product = Product.objects.get()
+        queryset = ledger.movements_since(product, timezone.now(), last_movement_id=1)
+        self.assertUsesIndex(queryset, 'pos_movement_product_id_idx')
+
+    def test_sale_items_use_sale_product_index(self):
+        sale = Sale.objects.get()
+        self.assertUsesIndex(SaleItem.objects.filter(sale=sale), 'pos_saleitem_sale_product_idx')
+
+
+@skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "Concurrent writers need a file-backed SQLite database or PostgreSQL.",
+)
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """
+    Fire many simultaneous checkouts at a few hot SKUs and make sure stock
+    never goes negative and every unit sold is accounted for.
+    """
+    # Twice the units on hand are asked for, so plenty of checkouts must fail.
+    CHECKOUTS = 60
+    WORKERS = 16
+    HOT_STOCK = 20
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='till', password='password123')
+        self.products = [
+            Product.objects.create(owner=self.owner, name=f'Hot {i}', price=10.00, stock_quantity=self.HOT_STOCK)
+            for i in range(3)
+        ]
+
+    def _checkout(self, index):
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        first = self.products[index % 3]
+        second = self.products[(index + 1) % 3]
+        data = {
+            "payment_method": "cash",
+            "items": [
+                {"product_id": second.id, "quantity": 1},
+                {"product_id": first.id, "quantity": 1},
+            ]
+        }
+        try:
+            return client.post('/api/sales/', data, format='json').status_code
+        finally:
+            connection.close()
+
+    def _checkouts(self):
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(pool.map(self._checkout, range(self.CHECKOUTS)))
+
+    def assertStockAccountedFor(self, statuses):
+        self.assertEqual(set(statuses) - {201, 400}, set())
+        total_sold = 0
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertGreaterEqual(product.stock_quantity, 0)
+            sold = sum(item.quantity for item in SaleItem.objects.filter(product=product))
+            self.assertEqual(product.stock_quantity + sold, self.HOT_STOCK)
+            total_sold += sold
+
+        # Every successful sale took exactly one unit of two different SKUs.
+        self.assertEqual(total_sold, 2 * statuses.count(201))
+        self.assertEqual(Sale.objects.count(), statuses.count(201))
+
+    def test_parallel_checkouts_never_oversell(self):
+        statuses = self._checkouts()
+        self.assertStockAccountedFor(statuses)
+        self.assertIn(400, statuses)
+
+
+@benchmark
+class CheckoutConcurrencyBenchmark(CheckoutConcurrencyTests):
+    """
+    Concurrent checkout throughput: hundreds of simultaneous sales against a
+    few hot SKUs, with the same stock checks as the quick test.
+    """
+    CHECKOUTS = 300
+    WORKERS = 16
+    HOT_STOCK = 40
+
+    def test_parallel_checkout_throughput(self):
+        started = time.perf_counter()
+        statuses = self._checkouts()
+        elapsed = time.perf_counter() - started
+        self.assertStockAccountedFor(statuses)
+        print(f"\n{self.CHECKOUTS} checkouts in {elapsed:.2f}s "
+              f"({self.CHECKOUTS / elapsed:.0f} checkouts/s, {statuses.count(201)} sold, {connection.vendor})")
@@ -1,11 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'products', views.ProductViewSet, basename='product')
 router.register(r'sales', views.SaleViewSet, basename='sale')
+router.register(r'analytics', views.AnalyticsViewSet, basename='analytics')
+
+# Async-native versions of the hot read endpoints (see pos/async_views.py).
+async_urlpatterns = [
+    path('products/search/', async_views.search, name='async-product-search'),
+    path('products/low_stock/', async_views.low_stock, name='async-product-low-stock'),
+    path('sales/dashboard_stats/', async_views.dashboard_stats, name='async-sale-dashboard-stats'),
+    path('sales/today_sales/', async_views.today_sales, name='async-sale-today-sales'),
+]
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('auth/signed-token/', views.SignedTokenView.as_view(), name='signed-token'),
 ]
\ No newline at end of file
@@ -0,0 +1,79 @@
+import secrets
+import threading
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def day_bounds(day, days=1):
+    """
+    Return the half-open ``[start, end)`` timestamps covering ``days`` days
+    starting at ``day``, in the current time zone.
+
+    Filtering with ``created_at__gte=start, created_at__lt=end`` compares
+    the raw column, so the (owner, created_at) index can be used; the
+    ``created_at__date`` lookup wraps the column in a function and can't.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min), tz)
+    return start, end
+
+
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def _base32(value, length):
+    digits = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        digits.append(CROCKFORD_BASE32[digit])
+    return ''.join(reversed(digits))
+
+
+class ReceiptNumberGenerator:
+    """
+    Time-ordered receipt numbers: ``RCP`` + 10 Crockford base32 digits of
+    the millisecond timestamp + 7 digits (35 bits) of randomness, 20
+    characters in all, sorting in creation order.
+
+    Within one process the random part is incremented for receipts issued
+    in the same millisecond (as ULIDs do), so a process never repeats
+    itself; two processes collide only if they pick the same 35 random
+    bits in the same millisecond. The old ``uuid4().hex[:8]`` scheme had 32
+    random bits and no time component, so collisions were likely after a
+    few tens of thousands of receipts.
+    """
+    PREFIX = 'RCP'
+    TIME_DIGITS = 10
+    RANDOM_DIGITS = 7
+    RANDOM_BITS = RANDOM_DIGITS * 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def __call__(self):
+        with self._lock:
+            now_ms = clock.time_ns() // 1_000_000
+            if now_ms <= self._last_ms:
+                # Same (or a rewound) millisecond: stay monotonic.
+                now_ms = self._last_ms
+                self._last_random += 1
+                if self._last_random >= 1 << self.RANDOM_BITS:
+                    now_ms += 1
+                    self._last_random = secrets.randbits(self.RANDOM_BITS - 1)
+            else:
+                # Leave headroom so same-millisecond increments don't overflow.
+                self._last_random = secrets.randbits(self.RANDOM_BITS - 1)
+            self._last_ms = now_ms
+            return (
+                self.PREFIX
+                + _base32(now_ms, self.TIME_DIGITS)
+                + _base32(self._last_random, self.RANDOM_DIGITS)
+            )
+
+
+generate_receipt_number = ReceiptNumberGenerator()
@@ -1,16 +1,126 @@
-from rest_framework import viewsets, permissions
+import hashlib
+import time
+
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.db.models import Sum, Count
+from rest_framework.views import APIView
+from django.db.models import Sum, Count, Prefetch
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.http import HttpResponse
+from django.conf import settings
 from datetime import datetime, timedelta
-from .models import Product, Sale, SaleItem
-from .serializers import ProductSerializer, SaleSerializer, CreateSaleSerializer
-from django.db import models
+from decimal import Decimal
+from . import analytics, fast, forecasting, ledger, metrics
+from .authentication import issue_signed_token
+from .cache import barcode_cache, read_cache
+from .checkout import DuplicateSale
+from .exports import export_products, export_sales
+from .imports import DEFAULT_CHUNK_SIZE, detect_format, import_products, iter_rows
+from .models import DailySalesRollup, Product, ProductForecast, Sale, SaleItem
+from .pagination import MovementCursorPagination, ProductCursorPagination, SaleCursorPagination
+from .parsers import RawUploadParser
+from .renderers import CSVRenderer, FastJSONRenderer, JSONLinesRenderer, NDJSONRenderer
+from .search import clamp_limit, search_products
+from .serializers import (
+    ProductSerializer, SaleSerializer, CreateSaleSerializer, BatchSaleSerializer, StockChangeSerializer,
+    StockMovementSerializer,
+)
+from .utils import day_bounds
+from django.db import models, transaction
+
+def conditional_read(request, owner_id, namespaces, per_day=False):
+    """
+    Work out the cache name, versions and validator headers (ETag,
+    Last-Modified, Cache-Control) for a cached read of ``request``.
+    Returns ``(name, versions, headers, not_modified)``, where
+    ``not_modified`` is a 304 response if the client's copy is current.
+    """
+    name = request.build_absolute_uri()
+    if per_day:
+        name = f'{name}|{timezone.localdate()}'
+    versions, modified = read_cache.state(owner_id, namespaces)
+    etag = '"%s"' % hashlib.sha1(f'{owner_id}|{name}|{read_cache.tag(versions)}'.encode()).hexdigest()
+    # HTTP dates have whole-second precision: a change later in the same
+    # second would keep the same Last-Modified, so only send it once the
+    # second is over and rely on the ETag until then.
+    last_modified = int(modified) if modified is not None and time.time() - modified >= 1 else None
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+    return name, versions, headers, not_modified
+
+
+class OwnerCachedReadMixin:
+    """
+    Serve read actions from the per-owner versioned cache. A cached value
+    is dropped as soon as any product or sale it depends on (its
+    ``namespaces``) changes for the owner.
+
+    The same version counters make the validators: the ETag is a hash of
+    the owner, the URL and the versions, and Last-Modified is the time of
+    the latest bump. A matching ``If-None-Match`` or ``If-Modified-Since``
+    gets a 304 after one cache round trip, without touching the database.
+    """
+
+    def cached_response(self, namespaces, compute, per_day=False):
+        owner_id = self.request.user.pk
+        name, versions, headers, not_modified = conditional_read(self.request, owner_id, namespaces, per_day)
+        if not_modified is not None:
+            return not_modified
+
+        data, tier = read_cache.get_or_compute(owner_id, namespaces, name, compute, versions=versions)
+        return Response(data, headers={'X-Cache': tier.upper() if tier else 'MISS', **headers})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.list_namespaces, self.list_payload)
+
+    def list_payload(self):
+        with metrics.timed():
+            if not fast.enabled():
+                return super().list(self.request, *self.args, **self.kwargs).data
+            serializer = fast.compile_serializer(self.get_serializer_class())
+            # Nested serializers are loaded by the fast serializer, not by prefetching.
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            page = self.paginate_queryset(serializer.values(queryset))
+            if page is None:
+                return serializer.serialize(queryset)
+            return self.get_paginated_response(serializer.serialize_rows(page)).data
+
+    def serialize_many(self, objects):
+        """Serialize a queryset or a list of instances, fast when enabled."""
+        with metrics.timed():
+            if not fast.enabled():
+                return self.get_serializer(objects, many=True).data
+            serializer = fast.compile_serializer(self.get_serializer_class())
+            if isinstance(objects, models.QuerySet):
+                return serializer.serialize(objects.prefetch_related(None))
+            return serializer.serialize_objects(objects)
 
-class ProductViewSet(viewsets.ModelViewSet):
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if fast.enabled():
+            renderers = [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+        return renderers
+
+
+class ProductViewSet(OwnerCachedReadMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    list_namespaces = ('products',)
 
     def get_queryset(self):
         """
@@ -25,31 +135,218 @@ class ProductViewSet(viewsets.ModelViewSet):
         when a new product is created.
         """
         serializer.save(owner=self.request.user)
-    
+
+    def perform_update(self, serializer):
+        """
+        Record a stock_quantity edit in the stock ledger. Edits that don't
+        touch stock keep the current level instead of writing back the one
+        read before the row was locked.
+        """
+        with transaction.atomic():
+            stock_before = ledger.lock_stock_levels([serializer.instance.pk])
+            if 'stock_quantity' not in serializer.validated_data:
+                serializer.instance.stock_quantity = stock_before[serializer.instance.pk]
+            product = serializer.save()
+            ledger.record_overwrites(stock_before, [product], note='Edited')
+
+    @action(detail=True, methods=['get', 'post'])
+    def stock(self, request, pk=None):
+        """
+        GET: the stock level now, or at ?as_of= (ISO 8601 timestamp).
+        POST: record a restock, return or adjustment ({kind, quantity, note}).
+        """
+        product = self.get_object()
+        if request.method == 'POST':
+            serializer = StockChangeSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                stock = ledger.move_stock(product, **serializer.validated_data)
+            except ledger.StockWouldGoNegative as exc:
+                raise ValidationError({'quantity': [str(exc)]})
+            return Response({'product_id': product.pk, 'stock_quantity': stock}, status=status.HTTP_201_CREATED)
+
+        as_of = request.query_params.get('as_of')
+        if as_of is None:
+            return Response({'product_id': product.pk, 'stock_quantity': product.stock_quantity})
+        try:
+            when = parse_datetime(as_of)
+        except ValueError:
+            when = None
+        if when is None:
+            raise ValidationError({'as_of': ["Use an ISO 8601 timestamp."]})
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        return Response({
+            'product_id': product.pk,
+            'as_of': when,
+            'stock_quantity': ledger.stock_as_of(product, when),
+        })
+
+    @action(detail=True, methods=['get'], pagination_class=MovementCursorPagination)
+    def movements(self, request, pk=None):
+        """The product's stock ledger, newest first."""
+        movements = self.get_object().movements.all()
+        page = self.paginate_queryset(movements)
+        return self.get_paginated_response(StockMovementSerializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
-        """Get products with low stock (less than 10)"""
-        low_stock_products = self.get_queryset().filter(stock_quantity__lt=10)
-        serializer = self.get_serializer(low_stock_products, many=True)
-        return Response(serializer.data)
+        """Get products with stock below their reorder point"""
+        def compute():
+            low_stock_products = forecasting.below_reorder_point(self.get_queryset())
+            return self.serialize_many(low_stock_products)
+
+        return self.cached_response(('products',), compute)
     
+    @action(detail=True, methods=['get'])
+    def forecast(self, request, pk=None):
+        """Daily demand, reorder point and days of stock left from the latest forecast."""
+        product = self.get_object()
+        forecast = ProductForecast.objects.filter(product=product).first()
+        if forecast is None:
+            return Response({
+                'product_id': product.pk, 'stock_quantity': product.stock_quantity,
+                'reorder_point': product.reorder_point, 'velocity': None, 'std': None,
+                'through_day': None, 'days_of_cover': None,
+            })
+        return Response({
+            'product_id': product.pk,
+            'stock_quantity': product.stock_quantity,
+            'reorder_point': product.reorder_point,
+            'velocity': round(forecast.velocity, 3),
+            'std': round(forecast.variance ** 0.5, 3),
+            'through_day': forecast.through_day,
+            'days_of_cover': forecast.days_of_cover(product.stock_quantity),
+        })
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        parser_classes=[MultiPartParser, RawUploadParser],
+    )
+    def import_catalog(self, request):
+        """
+        Bulk upsert products by barcode from a CSV or JSON Lines upload
+        (multipart field ``file`` or the raw request body). Returns a
+        per-row error report.
+        """
+        upload = request.data.get('file')
+        if upload is None:
+            raise ValidationError({'file': ["Upload a CSV or JSON Lines file."]})
+        fmt = detect_format(
+            getattr(upload, 'name', ''),
+            getattr(upload, 'content_type', None) or request.data.get('content_type', ''),
+        )
+        chunk_size = clamp_limit(request.query_params.get('chunk_size'), default=DEFAULT_CHUNK_SIZE, maximum=5000)
+        report = import_products(request.user, iter_rows(upload, fmt), chunk_size=chunk_size)
+        return Response(report.as_dict())
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, JSONLinesRenderer])
+    def export(self, request):
+        """Stream the catalog as CSV (default) or JSON Lines (?format=jsonl)."""
+        return export_products(self.get_queryset(), request.accepted_renderer.format)
+
+    @action(detail=False, methods=['get'], url_path=r'by-barcode/(?P<code>[^/]+)')
+    def by_barcode(self, request, code=None):
+        """
+        Resolve a scanned barcode to a compact product payload, served from
+        the in-process barcode cache when warm.
+        """
+        payload = barcode_cache.lookup(request.user.pk, code)
+        cache_status = 'HIT'
+        if payload is None:
+            cache_status = 'MISS'
+            product = self.get_queryset().filter(barcode=code).values(
+                'id', 'name', 'price', 'stock_quantity', 'barcode'
+            ).first()
+            if product is None:
+                raise NotFound("No product with this barcode.")
+            payload = {**product, 'price': format(product['price'], '.2f')}
+            barcode_cache.store(request.user.pk, payload)
+        return Response(payload, headers={'X-Cache': cache_status})
+
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Search products by name or barcode"""
+        """
+        Search products by barcode, name or category, best match first.
+        Paged with ?limit= (default 20, max 100) and ?offset=.
+        """
         query = request.query_params.get('q', '')
-        if query:
-            products = self.get_queryset().filter(
-                models.Q(name__icontains=query) | 
-                models.Q(barcode__icontains=query)
-            )
-        else:
-            products = self.get_queryset().all()
-        
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
-
-class SaleViewSet(viewsets.ModelViewSet):
+        limit = clamp_limit(request.query_params.get('limit'))
+        offset = clamp_limit(request.query_params.get('offset'), default=0, maximum=10_000, minimum=0)
+
+        def compute():
+            products = search_products(self.request.user, query, limit=limit, offset=offset)
+            return self.serialize_many(products)
+
+        return self.cached_response(('products',), compute)
+
+def parse_day_range(params, max_days=None):
+    """
+    Read the inclusive ``from``/``to`` local dates (YYYY-MM-DD, default
+    today) from query ``params``, rejecting bad or inverted ranges.
+    """
+    today = timezone.localdate()
+    days = {}
+    for param in ('from', 'to'):
+        value = params.get(param)
+        try:
+            days[param] = parse_date(value) if value else today
+        except ValueError:  # well formed but not a real date
+            days[param] = None
+        if days[param] is None:
+            raise ValidationError({param: ["Use the YYYY-MM-DD format."]})
+    if days['to'] < days['from']:
+        raise ValidationError({'to': ["Must not be before 'from'."]})
+    if max_days is not None and (days['to'] - days['from']).days >= max_days:
+        raise ValidationError({'to': [f"Ranges are limited to {max_days} days."]})
+    return days['from'], days['to']
+
+
+def dashboard_aggregates(owner):
+    """
+    The ``(queryset, aggregates)`` pairs behind dashboard_stats: one
+    conditional aggregate over the (small) daily rollup rows, and counts
+    of the owner's products and of those below their reorder point (read
+    from the reorder index, like `low_stock`), instead of six scans of the
+    sales history.
+    """
+    today = timezone.localdate()
+    week_ago = today - timedelta(days=7)
+    return [
+        (DailySalesRollup.objects.filter(owner=owner, day__gte=week_ago), {
+            'today_sales': Sum('sale_count', filter=models.Q(day=today)),
+            'today_revenue': Sum('revenue', filter=models.Q(day=today)),
+            'week_sales': Sum('sale_count'),
+            'week_revenue': Sum('revenue'),
+        }),
+        (Product.objects.filter(owner=owner), {'total_products': Count('id')}),
+        (forecasting.below_reorder_point(Product.objects.filter(owner=owner)), {'low_stock_products': Count('id')}),
+    ]
+
+
+IDEMPOTENCY_KEY_MAX_LENGTH = Sale._meta.get_field('idempotency_key').max_length
+
+
+def with_sale_items(sales):
+    """
+    Load sale items and their product names in a fixed number of queries,
+    instead of one query per sale plus one per item for `product_name`.
+    """
+    items = SaleItem.objects.select_related('product').only(
+        'id', 'sale_id', 'product_id', 'product__name',
+        'quantity', 'unit_price', 'unit_cost', 'total_price',
+    ).order_by('id')
+    return sales.prefetch_related(Prefetch('items', queryset=items))
+
+
+class SaleViewSet(OwnerCachedReadMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SaleCursorPagination
+    read_actions = ('list', 'retrieve', 'today_sales')
+    list_namespaces = ('sales', 'products')  # items carry product names
+    # Sales can't be edited: the rollups, stock ledger and totals are written
+    # with them. Delete a sale and record it again to correct it.
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -61,42 +358,206 @@ class SaleViewSet(viewsets.ModelViewSet):
         This is the main filter. It ensures that a user can only ever
         see, retrieve, update, or delete their own products.
         """
-        return Sale.objects.filter(owner=self.request.user)
+        queryset = Sale.objects.filter(owner=self.request.user)
+        if self.action in self.read_actions:
+            queryset = with_sale_items(queryset)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        """
+        Honour an ``Idempotency-Key`` header: a retried request gets the
+        recorded sale back (flagged with ``Idempotent-Replayed``) instead of
+        selling twice.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if key is not None:
+            if not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+                raise ValidationError({'Idempotency-Key': [
+                    f"Must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters."
+                ]})
+            recorded = Sale.objects.filter(owner=request.user, idempotency_key=key).first()
+            if recorded is not None:
+                return self._replayed(recorded)
+        try:
+            return super().create(request, *args, **kwargs)
+        except DuplicateSale as exc:
+            return self._replayed(exc.sale)
+
+    def _replayed(self, sale):
+        data = CreateSaleSerializer(sale).data
+        return Response(data, status=status.HTTP_201_CREATED, headers={'Idempotent-Replayed': 'true'})
 
     def perform_create(self, serializer):
         """
         This hook automatically assigns the logged-in user as the owner
         when a new product is created.
         """
-        serializer.save(owner=self.request.user)
+        serializer.save(owner=self.request.user, idempotency_key=self.request.headers.get('Idempotency-Key'))
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Ingest up to 500 queued sales (offline till sync) in one request.
+        Each sale needs an idempotency_key, so replaying a batch is safe.
+        """
+        serializer = BatchSaleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(owner=self.request.user)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer, JSONLinesRenderer])
+    def export(self, request):
+        """
+        Stream every sale item sold between ?from= and ?to= (inclusive
+        local dates, default today) as CSV (default) or NDJSON
+        (?format=ndjson), one row per item with its sale and product name.
+        """
+        first_day, last_day = parse_day_range(request.query_params)
+        start, end = day_bounds(first_day, days=(last_day - first_day).days + 1)
+        filename = f"sales-{first_day:%Y%m%d}-{last_day:%Y%m%d}"
+        return export_sales(request.user, start, end, request.accepted_renderer.format, filename)
 
     @action(detail=False, methods=['get'])
     def today_sales(self, request):
         """Get today's sales summary"""
-        today = timezone.now().date()
-        today_sales = self.get_queryset().filter(created_at__date=today)
-        
-        summary = {
-            'total_sales': today_sales.count(),
-            'total_revenue': today_sales.aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-            'sales': SaleSerializer(today_sales, many=True).data
-        }
-        return Response(summary)
+        def compute():
+            start, end = day_bounds(timezone.localdate())
+            today_sales = self.get_queryset().filter(created_at__gte=start, created_at__lt=end)
+            if fast.enabled():
+                sales = self.serialize_many(today_sales)
+                revenue = sum(Decimal(sale['total_amount']) for sale in sales)
+            else:
+                # Evaluate once: the count and revenue come from the rows we serialize anyway.
+                today_sales = list(today_sales)
+                with metrics.timed():
+                    sales = SaleSerializer(today_sales, many=True).data
+                revenue = sum(sale.total_amount for sale in today_sales)
+            return {
+                'total_sales': len(sales),
+                'total_revenue': revenue or 0,
+                'sales': sales,
+            }
+
+        return self.cached_response(('sales', 'products'), compute, per_day=True)
     
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         """Get dashboard statistics"""
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        
-        user_sales = Sale.objects.filter(owner=self.request.user)
-        user_products = Product.objects.filter(owner=self.request.user)
-        stats = {
-            'today_sales': user_sales.filter(created_at__date=today).count(),
-            'today_revenue': user_sales.filter(created_at__date=today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-            'week_sales': user_sales.filter(created_at__date__gte=week_ago).count(),
-            'week_revenue': user_sales.filter(created_at__date__gte=week_ago).aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-            'total_products': user_products.count(),
-            'low_stock_products': user_products.filter(stock_quantity__lt=10).count(),
-        }
-        return Response(stats)
\ No newline at end of file
+        return self.cached_response(('sales', 'products'), self._dashboard_stats, per_day=True)
+
+    def _dashboard_stats(self):
+        stats = {}
+        for queryset, aggregates in dashboard_aggregates(self.request.user):
+            stats.update(queryset.aggregate(**aggregates))
+        return {key: value or 0 for key, value in stats.items()}
+
+
+class AnalyticsViewSet(OwnerCachedReadMixin, viewsets.ViewSet):
+    """
+    Sales trends over ``?from=``/``?to=`` (inclusive local dates, default
+    today). The root returns an overview; each section is also available
+    on its own with more options.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # Category and product names come from the catalog.
+    namespaces = ('sales', 'products')
+
+    def _cached(self, compute):
+        return self.cached_response(self.namespaces, compute, per_day=True)
+
+    def list(self, request):
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS['day'])
+
+        def compute():
+            owner = self.request.user
+            return {
+                'from': first_day,
+                'to': last_day,
+                'revenue': analytics.revenue_series(owner, first_day, last_day),
+                'top_products': analytics.top_products(owner, first_day, last_day),
+                'categories': analytics.category_mix(owner, first_day, last_day),
+                'payment_methods': analytics.payment_mix(owner, first_day, last_day),
+                'baskets': analytics.basket_stats(owner, first_day, last_day),
+            }
+
+        return self._cached(compute)
+
+    @action(detail=False, methods=['get'])
+    def revenue(self, request):
+        """
+        Sales and revenue per ?bucket= (hour, day or week; default day),
+        gaps filled with zeros, with a trailing ?window= moving average.
+        """
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in analytics.BUCKETS:
+            raise ValidationError({'bucket': [f"Choose one of: {', '.join(analytics.BUCKETS)}."]})
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS[bucket])
+        window = clamp_limit(
+            request.query_params.get('window'), default=analytics.DEFAULT_WINDOW, maximum=analytics.MAX_WINDOW
+        )
+        return self._cached(lambda: {
+            'from': first_day,
+            'to': last_day,
+            'bucket': bucket,
+            'window': window,
+            'time_zone': timezone.get_current_timezone_name(),
+            'series': analytics.revenue_series(self.request.user, first_day, last_day, bucket, window),
+        })
+
+    @action(detail=False, methods=['get'])
+    def top_products(self, request):
+        """Best sellers by ?order_by= revenue (default) or quantity; ?limit= up to 100."""
+        order_by = request.query_params.get('order_by', 'revenue')
+        if order_by not in ('revenue', 'quantity'):
+            raise ValidationError({'order_by': ["Choose revenue or quantity."]})
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS['day'])
+        limit = clamp_limit(request.query_params.get('limit'), default=10)
+        return self._cached(
+            lambda: analytics.top_products(self.request.user, first_day, last_day, limit=limit, order_by=order_by)
+        )
+
+    @action(detail=False, methods=['get'])
+    def category_mix(self, request):
+        """Quantity, revenue and revenue share per product category."""
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS['day'])
+        return self._cached(lambda: analytics.category_mix(self.request.user, first_day, last_day))
+
+    @action(detail=False, methods=['get'])
+    def payment_mix(self, request):
+        """Sales, revenue and revenue share per payment method."""
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS['day'])
+        return self._cached(lambda: analytics.payment_mix(self.request.user, first_day, last_day))
+
+    @action(detail=False, methods=['get'])
+    def baskets(self, request):
+        """Average lines, units and value per sale, and gross margin where costs are known."""
+        first_day, last_day = parse_day_range(request.query_params, max_days=analytics.MAX_RANGE_DAYS['day'])
+        return self._cached(lambda: analytics.basket_stats(self.request.user, first_day, last_day))
+
+
+class SignedTokenView(APIView):
+    """Issue a signed stateless token for the current user, when POS_AUTH_SIGNED_TOKENS is on."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if not settings.POS_AUTH_SIGNED_TOKENS:
+            raise NotFound()
+        return Response({
+            'token': issue_signed_token(request.user),
+            'expires_in': settings.POS_AUTH_SIGNED_TOKEN_MAX_AGE,
+        })
+
+
+def metrics_view(request):
+    """
+    Request metrics in the Prometheus text format, for staff users or with
+    ``Authorization: Bearer <POS_METRICS_TOKEN>``.
+    """
+    header = request.headers.get('Authorization', '').split()
+    token = settings.POS_METRICS_TOKEN
+    authorized = (
+        bool(token) and len(header) == 2 and header[0].lower() == 'bearer' and constant_time_compare(header[1], token)
+    ) or (request.user.is_authenticated and request.user.is_staff)
+    if not authorized:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')